@@ -14,6 +14,7 @@ from rq import Queue
 
 from pychunkedgraph.logging import jsonformatter
 
+from . import admission
 from . import config
 from .meshing.legacy.routes import bp as meshing_api_legacy
 from .meshing.v1.routes import bp as meshing_api_v1
@@ -60,6 +61,16 @@ def create_app(test_config=None):
     app.register_blueprint(segmentation_api_legacy)
     app.register_blueprint(segmentation_api_v1)
 
+    if app.config.get("ADMISSION_DIR"):
+        app.wsgi_app = admission.AdmissionMiddleware(
+            app.wsgi_app,
+            app.url_map,
+            app.config["ADMISSION_DIR"],
+            limits=app.config.get("ADMISSION_LIMITS") or admission.DEFAULT_LIMITS,
+            max_workers=app.config.get("ADMISSION_MAX_WORKERS", 32),
+            retry_after=app.config.get("ADMISSION_RETRY_AFTER", 5),
+        )
+
     return app
 
 
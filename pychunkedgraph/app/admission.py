@@ -0,0 +1,231 @@
+"""
+Admission control for expensive endpoints.
+
+Each limited endpoint has a budget of cost units shared by all worker
+processes of a host. A request's cost is estimated from the layer of the
+node it asks about and from the durations of earlier requests. Units are
+slot files in a local directory held with `flock`, so they are released
+by the kernel even when a worker is killed (e.g. by harakiri).
+
+Requests over the budget of their endpoint are rejected with 429, requests
+that would exceed the number of workers all limited endpoints may occupy
+together are rejected with 503. Both carry a Retry-After header. Endpoints
+without a limit (e.g. `root`) are never rejected, so interactive requests
+always find a free worker.
+"""
+
+import os
+import json
+import time
+import fcntl
+import random
+import threading
+from typing import Dict, List, Optional
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import ClosingIterator
+
+
+# cost units per endpoint (name of the view function), shared by the
+# legacy and v1 APIs
+DEFAULT_LIMITS = {
+    "handle_leaves": 16,
+    "handle_leaves_many": 16,
+    "handle_leaves_many_binary": 16,
+    "handle_subgraph": 16,
+    "handle_contact_sites": 8,
+    "handle_pairwise_contact_sites": 8,
+    "handle_get_lvl2_graph": 8,
+    "find_path": 8,
+}
+
+NODE_ID_ARGS = ("node_id", "root_id", "first_node_id", "second_node_id")
+N_BITS_LAYER_ID = 8
+
+
+class SlotPool:
+    def __init__(self, directory: str, name: str, capacity: int):
+        """
+        :param directory: local directory shared by the worker processes
+        :param name: pool name, prefix of the slot files
+        :param capacity: number of slots
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._paths = [os.path.join(directory, f"{name}.{i}") for i in range(capacity)]
+        self.capacity = capacity
+
+    def acquire(self, n_slots: int = 1) -> Optional[List[int]]:
+        """ Locks `n_slots` free slots without waiting
+
+        :return: file descriptors of the slots or None if not enough are free
+        """
+        fds = []
+        paths = random.sample(self._paths, len(self._paths))
+        for path in paths:
+            if len(fds) == n_slots:
+                break
+            fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                continue
+            fds.append(fd)
+        if len(fds) < n_slots:
+            self.release(fds)
+            return None
+        return fds
+
+    @staticmethod
+    def release(fds: List[int]) -> None:
+        for fd in fds:
+            # closing the file releases the lock
+            os.close(fd)
+
+
+class CostModel:
+    def __init__(self, unit_seconds: float = 10, alpha: float = 0.2):
+        """
+        :param unit_seconds: duration of a request that costs one unit
+        :param alpha: weight of new durations in the moving averages
+        """
+        self._unit_seconds = unit_seconds
+        self._alpha = alpha
+        self._durations = {}
+        self._lock = threading.Lock()
+
+    def get_duration(self, endpoint: str, layer: Optional[int] = None) -> Optional[float]:
+        """ Average duration of requests to endpoint for nodes of layer """
+        with self._lock:
+            duration = self._durations.get((endpoint, layer))
+            if duration is None:
+                duration = self._durations.get((endpoint, None))
+        return duration
+
+    def estimate(self, endpoint: str, layer: Optional[int] = None) -> int:
+        """ Cost units, from earlier durations or from the layer (the
+            number of supervoxels below a node grows with its layer) """
+        duration = self.get_duration(endpoint, layer)
+        if duration is not None:
+            return max(1, int(round(duration / self._unit_seconds)))
+        if layer is None:
+            return 1
+        return max(1, layer - 2)
+
+    def observe(self, endpoint: str, layer: Optional[int], duration: float) -> None:
+        keys = [(endpoint, None)] if layer is None else [(endpoint, layer), (endpoint, None)]
+        with self._lock:
+            for key in keys:
+                average = self._durations.get(key)
+                if average is None:
+                    self._durations[key] = duration
+                else:
+                    self._durations[key] = (1 - self._alpha) * average + self._alpha * duration
+
+
+def get_node_layer(view_args: Dict) -> Optional[int]:
+    """ Highest layer of the node ids in the arguments of a view """
+    layers = []
+    for arg in NODE_ID_ARGS:
+        try:
+            node_id = int(view_args[arg])
+        except (KeyError, ValueError):
+            continue
+        layers.append(node_id >> (64 - N_BITS_LAYER_ID))
+    return max(layers) if layers else None
+
+
+class AdmissionMiddleware:
+    def __init__(
+        self,
+        wsgi_app,
+        url_map,
+        directory: str,
+        limits: Dict[str, int] = DEFAULT_LIMITS,
+        max_workers: int = 32,
+        retry_after: int = 5,
+        max_retry_after: int = 120,
+        cost_model: Optional[CostModel] = None,
+    ):
+        """
+        :param wsgi_app: the Flask wsgi app
+        :param url_map: the Flask url map, to find the endpoint of a request
+        :param directory: local directory for the slot files
+        :param limits: cost units per view function name
+        :param max_workers: number of requests to limited endpoints that may
+            run at once, the other workers stay free for cheap requests
+        :param retry_after: seconds to wait before retrying if no duration of
+            the endpoint is known
+        """
+        self._wsgi_app = wsgi_app
+        self._url_map = url_map
+        self._retry_after = retry_after
+        self._max_retry_after = max_retry_after
+        self._cost_model = CostModel() if cost_model is None else cost_model
+        self._pools = {
+            endpoint: SlotPool(directory, endpoint, capacity)
+            for endpoint, capacity in limits.items()
+        }
+        self._workers = SlotPool(directory, "workers", max_workers)
+        self.n_rejected = 0
+
+    def _get_endpoint(self, environ):
+        try:
+            endpoint, view_args = self._url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None, {}
+        return endpoint.rsplit(".", 1)[-1], view_args
+
+    def _get_retry_after(self, endpoint: str, layer: Optional[int]) -> int:
+        duration = self._cost_model.get_duration(endpoint, layer)
+        if duration is None:
+            return self._retry_after
+        return int(min(self._max_retry_after, max(1, duration)))
+
+    def _reject(self, environ, start_response, status: int, message: str, retry_after: int):
+        self.n_rejected += 1
+        body = json.dumps({"code": status, "message": message})
+        headers = {
+            "Retry-After": str(retry_after),
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Expose-Headers": "Retry-After",
+        }
+        response = Response(body, status=status, mimetype="application/json", headers=headers)
+        return response(environ, start_response)
+
+    def __call__(self, environ, start_response):
+        endpoint, view_args = self._get_endpoint(environ)
+        pool = self._pools.get(endpoint)
+        if pool is None:
+            return self._wsgi_app(environ, start_response)
+
+        layer = get_node_layer(view_args)
+        cost = min(pool.capacity, self._cost_model.estimate(endpoint, layer))
+        retry_after = self._get_retry_after(endpoint, layer)
+
+        worker_fds = self._workers.acquire()
+        if worker_fds is None:
+            return self._reject(
+                environ, start_response, 503,
+                "Server is busy with expensive requests, retry later", retry_after)
+        endpoint_fds = pool.acquire(cost)
+        if endpoint_fds is None:
+            SlotPool.release(worker_fds)
+            return self._reject(
+                environ, start_response, 429,
+                f"Too many concurrent {endpoint} requests, retry later", retry_after)
+
+        start_time = time.time()
+
+        def release():
+            SlotPool.release(endpoint_fds + worker_fds)
+            self._cost_model.observe(endpoint, layer, time.time() - start_time)
+
+        try:
+            app_iter = self._wsgi_app(environ, start_response)
+        except Exception:
+            release()
+            raise
+        # streamed responses hold their slots until they are sent
+        return ClosingIterator(app_iter, [release])
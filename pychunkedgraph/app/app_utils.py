@@ -1,17 +1,31 @@
+import hashlib
 import logging
+import os
 import sys
+import threading
 import time
 
 import numpy as np
-from flask import current_app, json
+import redis
+from flask import current_app, g, json, request, stream_with_context
 from google.auth import credentials
 from google.auth import default as default_creds
 from google.cloud import bigtable, datastore
 
-from pychunkedgraph.backend import chunkedgraph
+from pychunkedgraph.app import content_encoding, response_formats
+from pychunkedgraph.app.result_cache import RedisStore, ResultCache
+from pychunkedgraph.app.single_flight import SingleFlight
+from pychunkedgraph.io.cache import DiskCache
+from pychunkedgraph.backend import chunkedgraph, chunkedgraph_utils
 from pychunkedgraph.logging import flask_log_db, jsonformatter
 
 CACHE = {}
+# requests of a worker run concurrently in threads or greenlets, only one
+# of them creates a missing ChunkedGraph
+_cache_lock = threading.Lock()
+_bigtable_client = None
+_single_flight = None
+_result_cache = None
 
 
 class DoNothingCreds(credentials.Credentials):
@@ -33,6 +47,114 @@ def jsonify_with_kwargs(data, as_response=True, **kwargs):
         return resp
 
 
+def respond_with_format(data, **kwargs):
+    """ Responds with json, npy, msgpack or arrow
+
+    The format is taken from the `format` argument or the Accept header,
+    see `response_formats`. kwargs are passed to `jsonify_with_kwargs`.
+    """
+    response_format = response_formats.get_response_format(
+        request.args.get("format", default=None, type=str), request.accept_mimetypes
+    )
+    if response_format == response_formats.JSON:
+        resp = jsonify_with_kwargs(data, **kwargs)
+    else:
+        content, mimetype = response_formats.SERIALIZERS[response_format](data)
+        resp = current_app.response_class(content, mimetype=mimetype)
+    resp.vary.add("Accept")
+    return resp
+
+
+def stream_frames(batches):
+    """ Streams arrays of uint64 rows as compressed frames while they are
+        computed, see `response_formats` """
+    encoding = content_encoding.choose_encoding(
+        request.headers.get("Accept-Encoding", "")
+    )
+    if encoding == "zstd":
+        level = current_app.config["COMPRESSION_ZSTD_LEVEL"]
+    else:
+        level = current_app.config["COMPRESSION_GZIP_LEVEL"]
+    frames = response_formats.iter_compressed_frames(batches, encoding, level)
+    resp = current_app.response_class(
+        stream_with_context(frames), mimetype=response_formats.FRAMES_MIMETYPE
+    )
+    if encoding is not None:
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def get_single_flight():
+    global _single_flight
+    if _single_flight is None:
+        redis_conn = None
+        if current_app.config.get("SINGLE_FLIGHT_USE_REDIS", False):
+            redis_conn = redis.from_url(current_app.config["REDIS_URL"])
+        _single_flight = SingleFlight(
+            redis_conn=redis_conn,
+            lock_timeout=current_app.config.get("SINGLE_FLIGHT_LOCK_TIMEOUT", 120),
+        )
+    return _single_flight
+
+
+def get_request_key(table_id, node_id=None):
+    """ Key of the current request for single flight execution: endpoint,
+        table, node, sorted arguments (incl. timestamp) and request data """
+    args = sorted(request.args.items(multi=True))
+    data_hash = hashlib.sha1(request.get_data()).hexdigest()
+    return json.dumps([request.endpoint, table_id, str(node_id), args, data_hash])
+
+
+def single_flight(key, func, *args, **kwargs):
+    """ func(*args, **kwargs), computed once for concurrent requests with
+        the same key, see `get_request_key` """
+    return get_single_flight().do(key, func, *args, **kwargs)
+
+
+def get_result_cache():
+    """ Cache for results on immutable node ids, None if not configured """
+    global _result_cache
+    if _result_cache is None:
+        max_bytes = current_app.config.get("RESULT_CACHE_BYTES", 10 * 1024 ** 3)
+        if current_app.config.get("RESULT_CACHE_USE_REDIS", False):
+            store = RedisStore(redis.from_url(current_app.config["REDIS_URL"]), max_bytes=max_bytes)
+        elif current_app.config.get("RESULT_CACHE_DIR"):
+            store = DiskCache(current_app.config["RESULT_CACHE_DIR"], max_bytes=max_bytes)
+        else:
+            return None
+        _result_cache = ResultCache(store)
+    return _result_cache
+
+
+def get_result_key(table_id, node_id, endpoint, **params):
+    """ Result cache key for the current request, includes its bounds """
+    return ResultCache.get_key(
+        table_id, node_id, endpoint, bounds=request.args.get("bounds"), **params
+    )
+
+
+def cached_result(key, func, *args, **kwargs):
+    """ func(*args, **kwargs) from the result cache or computed (once for
+        concurrent requests) and cached, see `ResultCache.get_key` """
+    result_cache = get_result_cache()
+    if result_cache is None:
+        return single_flight(key, func, *args, **kwargs)
+
+    def _compute_and_put():
+        result = func(*args, **kwargs)
+        # node IDs that do not exist (yet) have no children, leaves or edges,
+        # empty results are not cached so they are not served once they do
+        if len(result) == 0:
+            return result
+        return result_cache.put(key, result)
+
+    result = result_cache.get(key)
+    if result is None:
+        result = single_flight(key, _compute_and_put)
+    return result
+
+
 def get_bigtable_client(config):
     project_id = config.get("PROJECT_ID", None)
 
@@ -47,6 +169,15 @@ def get_bigtable_client(config):
     return client
 
 
+def get_shared_bigtable_client(config):
+    """ Bigtable client shared by the ChunkedGraphs of all tables in this
+        process, so that they use the same gRPC channels """
+    global _bigtable_client
+    if _bigtable_client is None:
+        _bigtable_client = get_bigtable_client(config)
+    return _bigtable_client
+
+
 def get_datastore_client(config):
     project_id = config.get("PROJECT_ID", None)
 
@@ -70,41 +201,65 @@ def get_cg(table_id):
     )
 
     if table_id not in CACHE:
-        instance_id = current_app.config["CHUNKGRAPH_INSTANCE_ID"]
-        client = get_bigtable_client(current_app.config)
+        with _cache_lock:
+            if table_id not in CACHE:
+                CACHE[table_id] = _create_cg(table_id)
 
-        # Create ChunkedGraph logging
-        logger = logging.getLogger(f"{instance_id}/{table_id}")
-        logger.setLevel(current_app.config["LOGGING_LEVEL"])
+    g.table_id = table_id
+    return CACHE[table_id]
 
-        # prevent duplicate logs from Flasks(?) parent logger
-        logger.propagate = False
 
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(current_app.config["LOGGING_LEVEL"])
-        formatter = jsonformatter.JsonFormatter(
-            fmt=current_app.config["LOGGING_FORMAT"],
-            datefmt=current_app.config["LOGGING_DATEFORMAT"],
-        )
-        formatter.converter = time.gmtime
-        handler.setFormatter(formatter)
+def _create_cg(table_id):
+    instance_id = current_app.config["CHUNKGRAPH_INSTANCE_ID"]
+    client = get_shared_bigtable_client(current_app.config)
+
+    # Create ChunkedGraph logging
+    logger = logging.getLogger(f"{instance_id}/{table_id}")
+    logger.setLevel(current_app.config["LOGGING_LEVEL"])
 
-        logger.addHandler(handler)
+    # prevent duplicate logs from Flasks(?) parent logger
+    logger.propagate = False
 
-        # Create ChunkedGraph
-        CACHE[table_id] = chunkedgraph.ChunkedGraph(
-            table_id=table_id, instance_id=instance_id, client=client, logger=logger
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setLevel(current_app.config["LOGGING_LEVEL"])
+    formatter = jsonformatter.JsonFormatter(
+        fmt=current_app.config["LOGGING_FORMAT"],
+        datefmt=current_app.config["LOGGING_DATEFORMAT"],
+    )
+    formatter.converter = time.gmtime
+    handler.setFormatter(formatter)
+
+    logger.addHandler(handler)
+
+    # Graph settings from a local snapshot skip reading them from the table
+    snapshot_path = None
+    graph_settings = None
+    if current_app.config.get("CG_SNAPSHOT_DIR"):
+        snapshot_path = os.path.join(current_app.config["CG_SNAPSHOT_DIR"], f"{table_id}.settings")
+        graph_settings = chunkedgraph_utils.read_graph_settings_snapshot(
+            snapshot_path, max_age=current_app.config.get("CG_SNAPSHOT_MAX_AGE")
         )
 
-    current_app.table_id = table_id
-    return CACHE[table_id]
+    # Create ChunkedGraph
+    cg = chunkedgraph.ChunkedGraph(
+        table_id=table_id,
+        instance_id=instance_id,
+        client=client,
+        logger=logger,
+        graph_settings=graph_settings,
+    )
+    if snapshot_path is not None and graph_settings is None:
+        chunkedgraph_utils.write_graph_settings_snapshot(snapshot_path, cg.graph_settings)
+    return cg
 
 
 def get_log_db(table_id):
     if "log_db" not in CACHE:
-        client = get_datastore_client(current_app.config)
-        CACHE["log_db"] = flask_log_db.FlaskLogDatabase(table_id, client=client,
-                                                        credentials=credentials)
+        with _cache_lock:
+            if "log_db" not in CACHE:
+                client = get_datastore_client(current_app.config)
+                CACHE["log_db"] = flask_log_db.FlaskLogDatabase(table_id, client=client,
+                                                                credentials=credentials)
 
     return CACHE["log_db"]
 
@@ -22,6 +22,45 @@ class BaseConfig(object):
     # CHUNKGRAPH_TABLE_ID = "pinky100_benchmark_v92"
 
     USE_REDIS_JOBS = False
+    # seconds to collect remesh requests of a table before remeshing,
+    # 0 enqueues every request immediately
+    REMESH_DEBOUNCE_WINDOW = float(os.environ.get("REMESH_DEBOUNCE_WINDOW", 0))
+    MANIFEST_CACHE_BYTES = int(os.environ.get("MANIFEST_CACHE_BYTES", 256 * 1024 ** 2))
+    # share cached manifests between processes through REDIS_URL
+    MANIFEST_CACHE_USE_REDIS = os.environ.get("MANIFEST_CACHE_USE_REDIS", "false") == "true"
+    # share concurrent computations of identical requests between processes
+    # through REDIS_URL, within a process they are always shared
+    SINGLE_FLIGHT_USE_REDIS = os.environ.get("SINGLE_FLIGHT_USE_REDIS", "false") == "true"
+    # seconds after which other processes stop waiting for a shared
+    # computation and compute the result themselves
+    SINGLE_FLIGHT_LOCK_TIMEOUT = float(os.environ.get("SINGLE_FLIGHT_LOCK_TIMEOUT", 120))
+
+    # cache for leaves, children and subgraphs of (immutable) node ids,
+    # on local disk in RESULT_CACHE_DIR or shared through REDIS_URL
+    RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", None)
+    RESULT_CACHE_USE_REDIS = os.environ.get("RESULT_CACHE_USE_REDIS", "false") == "true"
+    RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_BYTES", 10 * 1024 ** 3))
+
+    # admission control of expensive endpoints, disabled without a local
+    # directory for the slot files shared by the worker processes
+    ADMISSION_DIR = os.environ.get("ADMISSION_DIR", None)
+    # cost units per endpoint, e.g. '{"handle_leaves": 16}', see admission.py
+    ADMISSION_LIMITS = json.loads(os.environ.get("ADMISSION_LIMITS", "null"))
+    # workers that may serve limited endpoints at once
+    ADMISSION_MAX_WORKERS = int(os.environ.get("ADMISSION_MAX_WORKERS", 32))
+    ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", 5))
+
+    # local snapshots of the graph settings of tables, new workers then
+    # create their ChunkedGraphs without reading them from bigtable
+    CG_SNAPSHOT_DIR = os.environ.get("CG_SNAPSHOT_DIR", None)
+    # seconds after which a snapshot is read again from the table, the
+    # dataset info can change (e.g. mesh settings)
+    CG_SNAPSHOT_MAX_AGE = float(os.environ.get("CG_SNAPSHOT_MAX_AGE", 3600))
+
+    # responses smaller than this are sent uncompressed
+    COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+    COMPRESSION_ZSTD_LEVEL = int(os.environ.get("COMPRESSION_ZSTD_LEVEL", 3))
+    COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
     
     MESHING_ENDPOINT = os.environ.get("MESHING_ENDPOINT", "http://meshing-service/meshing")
     
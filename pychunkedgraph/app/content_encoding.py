@@ -0,0 +1,103 @@
+"""
+Content-Encoding negotiation for responses and request bodies.
+"""
+
+import zlib
+from typing import Dict, Optional
+
+import zstandard as zstd
+
+
+# preferred first if the client accepts several with the same quality
+ENCODINGS = ("zstd", "gzip")
+
+# payloads that do not get smaller when compressed again
+COMPRESSED_MIMETYPES = {
+    "application/gzip",
+    "application/x-gzip",
+    "application/zip",
+    "application/zstd",
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+}
+
+
+def parse_accept_encoding(accept_encoding: str) -> Dict[str, float]:
+    """
+    :param accept_encoding: value of the Accept-Encoding header
+    :return: dict encoding -> quality
+    """
+    qualities = {}
+    for part in accept_encoding.lower().split(","):
+        params = part.strip().split(";")
+        encoding = params[0].strip()
+        if not encoding:
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[encoding] = quality
+    return qualities
+
+
+def choose_encoding(accept_encoding: str, encodings=ENCODINGS) -> Optional[str]:
+    """ Best of `encodings` the client accepts, None for identity
+
+    :param accept_encoding: value of the Accept-Encoding header
+    :param encodings: supported encodings, in order of preference
+    :return: str or None
+    """
+    qualities = parse_accept_encoding(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "zstd":
+        return zstd.ZstdCompressor(level=3 if level is None else level).compress(data)
+    if encoding == "gzip":
+        compressor = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    raise ValueError(f"Unsupported encoding {encoding}")
+
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    """
+    :param encoding: value of the Content-Encoding header
+    :raises ValueError: unsupported encoding or corrupt data
+    """
+    encoding = encoding.strip().lower()
+    if encoding in ("", "identity"):
+        return data
+    try:
+        if encoding == "zstd":
+            # frames written in streaming mode have no content size
+            return zstd.ZstdDecompressor().decompressobj().decompress(data)
+        if encoding in ("gzip", "x-gzip"):
+            return zlib.decompress(data, 31)
+        if encoding == "deflate":
+            return zlib.decompress(data)
+    except (zlib.error, zstd.ZstdError) as e:
+        raise ValueError(f"Corrupt {encoding} data: {e}")
+    raise ValueError(f"Unsupported encoding {encoding}")
+
+
+def should_compress(response, min_size: int) -> bool:
+    """ Whether a (non streamed) response is worth compressing """
+    if response.status_code < 200 or response.status_code >= 300:
+        return False
+    if "Content-Encoding" in response.headers:
+        return False
+    if response.mimetype in COMPRESSED_MIMETYPES:
+        return False
+    return len(response.get_data()) >= min_size
@@ -3,7 +3,7 @@ import os
 
 import numpy as np
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import traceback
 import redis
 from rq import Queue, Connection, Retry
@@ -15,6 +15,8 @@ from pychunkedgraph.app import app_utils
 from pychunkedgraph.app.meshing import tasks as meshing_tasks
 from pychunkedgraph.backend import chunkedgraph
 from pychunkedgraph.meshing import meshgen, meshgen_utils
+from pychunkedgraph.meshing.manifest_cache import ManifestCache
+from pychunkedgraph.meshing.remesh_debounce import RemeshDebouncer
 
 
 # -------------------------------
@@ -43,36 +45,36 @@ def home():
 
 
 def before_request():
-    current_app.request_start_time = time.time()
-    current_app.request_start_date = datetime.utcnow()
-    current_app.user_id = None
-    current_app.table_id = None
-    current_app.request_type = None
+    g.request_start_time = time.time()
+    g.request_start_date = datetime.utcnow()
+    g.user_id = None
+    g.table_id = None
+    g.request_type = None
 
 
 def after_request(response):
-    dt = (time.time() - current_app.request_start_time) * 1000
+    dt = (time.time() - g.request_start_time) * 1000
 
     current_app.logger.debug("Response time: %.3fms" % dt)
     try:
-        if current_app.user_id is None:
+        if g.user_id is None:
             user_id = ""
         else:
-            user_id = current_app.user_id
+            user_id = g.user_id
 
-        if current_app.table_id is not None:
-            log_db = app_utils.get_log_db(current_app.table_id)
+        if g.table_id is not None:
+            log_db = app_utils.get_log_db(g.table_id)
             log_db.add_success_log(
                 user_id=user_id,
                 user_ip="",
-                request_time=current_app.request_start_date,
+                request_time=g.request_start_date,
                 response_time=dt,
                 url=request.url,
                 request_data=request.data,
-                request_type=current_app.request_type,
+                request_type=g.request_type,
             )
     except Exception as e:
-        current_app.logger.debug(f"{current_app.user_id}: LogDB entry not"
+        current_app.logger.debug(f"{g.user_id}: LogDB entry not"
                                  f" successful: {e}")
 
     return response
@@ -80,7 +82,7 @@ def after_request(response):
 
 def unhandled_exception(e):
     status_code = 500
-    response_time = (time.time() - current_app.request_start_time) * 1000
+    response_time = (time.time() - g.request_start_time) * 1000
     user_ip = str(request.remote_addr)
     tb = traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
 
@@ -89,7 +91,7 @@ def unhandled_exception(e):
             "message": str(e),
             "user_id": user_ip,
             "user_ip": user_ip,
-            "request_time": current_app.request_start_date,
+            "request_time": g.request_start_date,
             "request_url": request.url,
             "request_data": request.data,
             "response_time": response_time,
@@ -99,7 +101,7 @@ def unhandled_exception(e):
     )
 
     resp = {
-        "timestamp": current_app.request_start_date,
+        "timestamp": g.request_start_date,
         "duration": response_time,
         "code": status_code,
         "message": str(e),
@@ -110,7 +112,7 @@ def unhandled_exception(e):
 
 
 def api_exception(e):
-    response_time = (time.time() - current_app.request_start_time) * 1000
+    response_time = (time.time() - g.request_start_time) * 1000
     user_ip = str(request.remote_addr)
     tb = traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
 
@@ -119,7 +121,7 @@ def api_exception(e):
             "message": str(e),
             "user_id": user_ip,
             "user_ip": user_ip,
-            "request_time": current_app.request_start_date,
+            "request_time": g.request_start_date,
             "request_url": request.url,
             "request_data": request.data,
             "response_time": response_time,
@@ -129,7 +131,7 @@ def api_exception(e):
     )
 
     resp = {
-        "timestamp": current_app.request_start_date,
+        "timestamp": g.request_start_date,
         "duration": response_time,
         "code": e.status_code.value,
         "message": str(e),
@@ -142,10 +144,10 @@ def api_exception(e):
 
 
 def handle_valid_frags(table_id, node_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
 
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     cg = app_utils.get_cg(table_id)
 
@@ -159,18 +161,59 @@ def handle_valid_frags(table_id, node_id):
 ## MANIFEST --------------------------------------------------------------------
 
 
+_manifest_cache = None
+
+
+def _get_manifest_cache():
+    global _manifest_cache
+    if _manifest_cache is None:
+        redis_conn = None
+        if current_app.config.get("MANIFEST_CACHE_USE_REDIS", False):
+            redis_conn = redis.from_url(current_app.config["REDIS_URL"])
+        _manifest_cache = ManifestCache(
+            max_bytes=current_app.config.get("MANIFEST_CACHE_BYTES", 256 * 1024 ** 2),
+            redis_conn=redis_conn,
+        )
+    return _manifest_cache
+
+
 def handle_get_manifest(table_id, node_id):
-    current_app.request_type = "manifest"
-    current_app.table_id = table_id
+    g.request_type = "manifest"
+    g.table_id = table_id
 
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     if len(request.data) > 0:
         data = json.loads(request.data)
     else:
         data = {}
 
+    verify = request.args.get("verify", False)
+    verify = verify in ["True", "true", "1", True]
+
+    manifest_cache = _get_manifest_cache()
+    cache_key = manifest_cache.get_key(
+        table_id, node_id, verify, bounds=request.args.get("bounds"), data=data
+    )
+    entry = manifest_cache.get(cache_key)
+    if entry is None:
+        manifest, n_missing = app_utils.single_flight(
+            cache_key, _get_manifest, table_id, node_id, verify, data
+        )
+        entry = manifest_cache.put(cache_key, manifest, complete=n_missing == 0)
+
+    response = jsonify(entry["manifest"])
+    response.set_etag(entry["etag"])
+    if entry["complete"]:
+        response.cache_control.private = True
+        response.cache_control.max_age = 3600
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def _get_manifest(table_id, node_id, verify, data):
     if "bounds" in request.args:
         bounds = request.args["bounds"]
         bounding_box = np.array(
@@ -179,9 +222,6 @@ def handle_get_manifest(table_id, node_id):
     else:
         bounding_box = None
 
-    verify = request.args.get("verify", False)
-    verify = verify in ["True", "true", "1", True]
-
     cg = app_utils.get_cg(table_id)
 
     if "start_layer" in data:
@@ -194,14 +234,15 @@ def handle_get_manifest(table_id, node_id):
     else:
         flexible_start_layer = None
 
-    seg_ids = meshgen_utils.get_highest_child_nodes_with_meshes(
+    seg_ids, n_missing = meshgen_utils.get_highest_child_nodes_with_meshes(
         cg,
         np.uint64(node_id),
         stop_layer=2,
         start_layer=start_layer,
         bounding_box=bounding_box,
         verify_existence=verify,
-        flexible_start_layer=flexible_start_layer
+        flexible_start_layer=flexible_start_layer,
+        return_n_missing=True,
     )
 
     filenames = [meshgen_utils.get_mesh_name(cg, s) for s in seg_ids]
@@ -212,26 +253,26 @@ def handle_get_manifest(table_id, node_id):
 
     if "return_seg_id_layers" in data:
         if app_utils.toboolean(data["return_seg_id_layers"]):
-            resp["seg_id_layers"] = cg.get_chunk_layers(seg_ids)
+            resp["seg_id_layers"] = cg.get_chunk_layers(seg_ids).tolist()
 
     if "return_seg_chunk_coordinates" in data:
         if app_utils.toboolean(data["return_seg_chunk_coordinates"]):
-            resp["seg_chunk_coordinates"] = [cg.get_chunk_coordinates(seg_id)
+            resp["seg_chunk_coordinates"] = [cg.get_chunk_coordinates(seg_id).tolist()
                                              for seg_id in seg_ids]
 
-    return resp
+    return resp, n_missing
 
 def str2bool(v):
   return v.lower() in ("yes", "true", "t", "1")
 
 ## REMESHING -----------------------------------------------------
 def handle_remesh(table_id):
-    current_app.request_type = "remesh_enque"
-    current_app.table_id = table_id
+    g.request_type = "remesh_enque"
+    g.table_id = table_id
     is_priority = request.args.get('priority', True, type=str2bool)
     is_redisjob = request.args.get('use_redis', False, type=str2bool)
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
     new_lvl2_ids = json.loads(request.data)["new_lvl2_ids"]
 
     if is_redisjob:    
@@ -244,13 +285,18 @@ def handle_remesh(table_id):
                 retry = Retry(max=3, interval=[60, 60, 60])
                 queue_name = "mesh-chunks-low-priority"
             q = Queue(queue_name, retry=retry, default_timeout=1200)
-            task = q.enqueue(meshing_tasks.remeshing, table_id, 
-                             new_lvl2_ids)
+            window = current_app.config.get("REMESH_DEBOUNCE_WINDOW", 0)
+            if window > 0:
+                task_id = _debounce_remesh(q, table_id, new_lvl2_ids, window)
+            else:
+                task = q.enqueue(meshing_tasks.remeshing, table_id, 
+                                 new_lvl2_ids)
+                task_id = task.get_id()
 
         response_object = {
             "status": "success",
             "data": {
-                "task_id": task.get_id()
+                "task_id": task_id
             }
         }
         
@@ -267,6 +313,27 @@ def handle_remesh(table_id):
         return Response(status=202)
     
 
+def _debounce_remesh(q, table_id, new_lvl2_ids, window):
+    """
+    Buffer L2 IDs and schedule a single flush job per window.
+    Requests are buffered per queue, priority requests are never
+    merged into a low priority job.
+    Returns the id of the flush job that remeshes the IDs.
+    """
+    cg = app_utils.get_cg(table_id)
+    new_lvl2_ids = np.array(new_lvl2_ids, dtype=np.uint64)
+    prefix = meshing_tasks.get_debounce_prefix(q.name)
+    debouncer = RemeshDebouncer(q.connection, window=window, prefix=prefix)
+    if not debouncer.add(table_id, new_lvl2_ids,
+                         cg.get_chunk_ids_from_node_ids(new_lvl2_ids)):
+        # coalesced, already scheduled
+        return debouncer.job_id(table_id)
+    task = q.enqueue_in(timedelta(seconds=window),
+                        meshing_tasks.remeshing_debounced, table_id, prefix,
+                        job_id=debouncer.job_id(table_id))
+    return task.get_id()
+
+
 def _remeshing(serialized_cg_info, lvl2_nodes):
     cg = chunkedgraph.ChunkedGraph(**serialized_cg_info)
 
@@ -1,6 +1,11 @@
 from pychunkedgraph.app import app_utils
 from pychunkedgraph.meshing import meshgen
+from pychunkedgraph.meshing.remesh_debounce import RemeshDebouncer
+from pychunkedgraph.meshing.remesh_debounce import filter_superseded_lvl2_ids
+from datetime import timedelta
 import numpy as np
+import redis
+from rq import Queue
 from flask import current_app
 
 
@@ -15,3 +20,40 @@ def remeshing(table_id, lvl2_nodes):
         cg, lvl2_nodes, stop_layer=4, cv_path=None,
         cv_mesh_dir=None, mip=1, max_err=320
     )
+
+
+def get_debounce_prefix(queue_name):
+    """ Debounced L2 IDs are buffered per queue. """
+    return f"remesh:{queue_name}"
+
+
+def remeshing_debounced(table_id, prefix="remesh"):
+    """ Remesh all L2 IDs collected for `table_id` during the debounce window. """
+    cg = app_utils.get_cg(table_id)
+    debouncer = RemeshDebouncer(redis.from_url(current_app.config["REDIS_URL"]),
+                                prefix=prefix)
+
+    def _remesh(lvl2_nodes):
+        current_app.logger.debug(f"remeshing {len(lvl2_nodes)} coalesced L2 IDs")
+        meshgen.remeshing(
+            cg, lvl2_nodes, stop_layer=4, cv_path=None,
+            cv_mesh_dir=None, mip=1, max_err=320
+        )
+
+    debouncer.flush(
+        table_id, _remesh,
+        filter_func=lambda ids: filter_superseded_lvl2_ids(cg, ids)
+    )
+
+
+def sweep_debounced_remeshing(redis_conn, queue_names, window):
+    """ Reschedule debounce windows whose flush job was lost or failed. """
+    for queue_name in queue_names:
+        q = Queue(queue_name, connection=redis_conn)
+        prefix = get_debounce_prefix(queue_name)
+        debouncer = RemeshDebouncer(redis_conn, window=window, prefix=prefix)
+        debouncer.sweep(
+            lambda table_id: q.enqueue_in(timedelta(seconds=window),
+                                          remeshing_debounced, table_id, prefix,
+                                          job_id=debouncer.job_id(table_id))
+        )
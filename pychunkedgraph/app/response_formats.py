@@ -0,0 +1,245 @@
+"""
+Binary response formats for the segmentation API.
+
+Responses that are (dicts of) numpy arrays can be sent as
+- npy: a little endian .npy file, or an .npz archive with one array per
+  key if the response has more than one
+- msgpack: arrays are encoded like msgpack-numpy does
+  ({"nd": True, "type": dtype, "kind": "", "shape": shape, "data": bytes})
+  so clients can decode them with `msgpack_numpy.decode`
+- arrow: an Arrow IPC stream with one column per key, multi dimensional
+  arrays become (nested) fixed size list columns
+
+The format is selected with the `format` argument or the Accept header.
+
+Streamed responses are a sequence of frames, each a little endian uint64
+row count followed by the rows as little endian uint64s, and end with an
+empty frame. The stream is compressed incrementally (zstd or gzip) so the
+first frames are sent while later ones are still being computed.
+"""
+
+import io
+import zlib
+import datetime
+from typing import Iterable, Iterator, Optional
+
+import msgpack
+import numpy as np
+import pyarrow as pa
+import zstandard as zstd
+
+from pychunkedgraph.backend import chunkedgraph_exceptions as cg_exceptions
+
+
+JSON = "json"
+NPY = "npy"
+MSGPACK = "msgpack"
+ARROW = "arrow"
+
+MIMETYPES = {
+    JSON: "application/json",
+    NPY: "application/x-npy",
+    MSGPACK: "application/x-msgpack",
+    ARROW: "application/vnd.apache.arrow.stream",
+}
+NPZ_MIMETYPE = "application/x-npz"
+FRAMES_MIMETYPE = "application/x-pcg-frames"
+
+
+def get_response_format(format_arg: Optional[str] = None, accept_mimetypes=None) -> str:
+    """ Format from the `format` argument or else the Accept header
+
+    :param format_arg: str
+    :param accept_mimetypes: werkzeug MIMEAccept
+    :return: str
+    """
+    if format_arg:
+        format_arg = format_arg.lower()
+        if not format_arg in MIMETYPES:
+            raise cg_exceptions.BadRequest(
+                f"Unknown format {format_arg}, options: {list(MIMETYPES)}")
+        return format_arg
+
+    if accept_mimetypes is None:
+        return JSON
+    # json first so that */* keeps the default
+    mimetype = accept_mimetypes.best_match(
+        list(MIMETYPES.values()) + [NPZ_MIMETYPE], default=MIMETYPES[JSON])
+    if mimetype == NPZ_MIMETYPE:
+        return NPY
+    return {v: k for k, v in MIMETYPES.items()}[mimetype]
+
+
+def _to_little_endian(arr: np.ndarray) -> np.ndarray:
+    return arr.astype(arr.dtype.newbyteorder("<"), copy=False)
+
+
+def _to_array(value, key: str) -> np.ndarray:
+    arr = np.asarray(value)
+    if arr.dtype == object:
+        raise cg_exceptions.BadRequest(
+            f"'{key}' cannot be represented as an array, use format=msgpack")
+    return _to_little_endian(arr)
+
+
+def _get_arrays(data) -> dict:
+    if isinstance(data, dict):
+        return {str(k): _to_array(v, k) for k, v in data.items()}
+    return {"data": _to_array(data, "data")}
+
+
+def to_npy(data):
+    """
+    :return: (bytes, mimetype)
+    """
+    arrays = _get_arrays(data)
+    content = io.BytesIO()
+    if len(arrays) == 1:
+        np.save(content, next(iter(arrays.values())), allow_pickle=False)
+        return content.getvalue(), MIMETYPES[NPY]
+    np.savez(content, **arrays)
+    return content.getvalue(), NPZ_MIMETYPE
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, np.ndarray):
+        arr = _to_little_endian(np.ascontiguousarray(obj))
+        if arr.dtype == object:
+            return arr.tolist()
+        return {
+            b"nd": True,
+            b"type": arr.dtype.str,
+            b"kind": b"",
+            b"shape": list(arr.shape),
+            b"data": arr.tobytes(),
+        }
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, datetime.datetime):
+        return obj.__str__()
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    raise TypeError(f"Cannot serialize {type(obj)}")
+
+
+def _convert_keys(obj):
+    """ msgpack does not accept numpy scalars as dict keys """
+    if isinstance(obj, dict):
+        return {
+            (k.item() if isinstance(k, np.generic) else k): _convert_keys(v)
+            for k, v in obj.items()
+        }
+    if isinstance(obj, list):
+        return [_convert_keys(v) for v in obj]
+    return obj
+
+
+def to_msgpack(data):
+    """
+    :return: (bytes, mimetype)
+    """
+    content = msgpack.packb(
+        _convert_keys(data), default=_msgpack_default, use_bin_type=True)
+    return content, MIMETYPES[MSGPACK]
+
+
+def _to_arrow_array(arr: np.ndarray):
+    if arr.ndim <= 1:
+        return pa.array(arr.reshape(-1))
+    child = _to_arrow_array(arr.reshape(-1, *arr.shape[2:]))
+    return pa.FixedSizeListArray.from_arrays(child, arr.shape[1])
+
+
+def to_arrow(data):
+    """
+    :return: (bytes, mimetype)
+    """
+    arrays = _get_arrays(data)
+    lengths = {len(arr) if arr.ndim else 1 for arr in arrays.values()}
+    if len(lengths) > 1:
+        raise cg_exceptions.BadRequest(
+            "Response arrays differ in length, use format=msgpack or npy")
+    table = pa.Table.from_arrays(
+        [_to_arrow_array(arr) for arr in arrays.values()],
+        names=list(arrays.keys()))
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes(), MIMETYPES[ARROW]
+
+
+SERIALIZERS = {NPY: to_npy, MSGPACK: to_msgpack, ARROW: to_arrow}
+
+
+def encode_frame(rows: np.ndarray) -> bytes:
+    rows = np.asarray(rows, dtype="<u8")
+    return np.array([len(rows)], dtype="<u8").tobytes() + rows.tobytes()
+
+
+def decode_frames(content: bytes, n_cols: int = 1) -> Iterator[np.ndarray]:
+    """ Inverse of `encode_frame` for a complete, uncompressed stream
+
+    :param content: bytes
+    :param n_cols: number of uint64s per row
+    """
+    offset = 0
+    while offset < len(content):
+        n_rows = int(np.frombuffer(content, dtype="<u8", count=1, offset=offset)[0])
+        offset += 8
+        if n_rows == 0:
+            return
+        rows = np.frombuffer(content, dtype="<u8", count=n_rows * n_cols, offset=offset)
+        offset += rows.nbytes
+        yield rows.reshape(-1, n_cols) if n_cols > 1 else rows
+    raise ValueError("Stream ended without end frame")
+
+
+class StreamCompressor:
+    """ Compresses a stream chunk by chunk, every chunk can be decompressed
+        as soon as it is received """
+
+    def __init__(self, encoding: Optional[str], level: Optional[int] = None):
+        """
+        :param encoding: "zstd", "gzip" or None
+        :param level: compression level
+        """
+        self.encoding = encoding
+        if encoding == "zstd":
+            level = 3 if level is None else level
+            self._compressor = zstd.ZstdCompressor(level=level).compressobj()
+        elif encoding == "gzip":
+            level = 6 if level is None else level
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        else:
+            self._compressor = None
+
+    def compress(self, data: bytes) -> bytes:
+        if self._compressor is None:
+            return data
+        if self.encoding == "zstd":
+            flush_mode = zstd.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            flush_mode = zlib.Z_SYNC_FLUSH
+        return self._compressor.compress(data) + self._compressor.flush(flush_mode)
+
+    def finish(self) -> bytes:
+        if self._compressor is None:
+            return b""
+        return self._compressor.flush()
+
+
+def iter_compressed_frames(batches: Iterable[np.ndarray],
+                           encoding: Optional[str],
+                           level: Optional[int] = None) -> Iterator[bytes]:
+    """
+    :param batches: arrays of uint64 rows
+    :param encoding: see `StreamCompressor`
+    :param level: compression level
+    """
+    compressor = StreamCompressor(encoding, level)
+    for rows in batches:
+        if len(rows) == 0:
+            continue
+        yield compressor.compress(encode_frame(rows))
+    yield compressor.compress(encode_frame([])) + compressor.finish()
@@ -0,0 +1,166 @@
+"""
+Persistent cache for results of read endpoints on immutable node IDs.
+
+Node IDs never change once they exist, so their leaves, children and
+subgraph can be cached without invalidation. Results are stored on local
+disk (`DiskCache`) or in redis (`RedisStore`), both bounded in size.
+
+ID arrays are stored sorted and delta encoded before compression, which
+makes the supervoxel IDs of a root (that mostly share their chunk
+prefix) a few bits per ID.
+"""
+
+import json
+import time
+import pickle
+from typing import Optional
+
+import numpy as np
+import zstandard as zstd
+
+
+_IDS = b"I"
+_EDGES = b"E"
+_PICKLE = b"P"
+
+
+def _encode_sorted_ids(ids: np.ndarray) -> bytes:
+    deltas = np.diff(ids, prepend=np.uint64(0)).astype("<u8")
+    return deltas.tobytes()
+
+
+def _decode_sorted_ids(content: bytes) -> np.ndarray:
+    return np.cumsum(np.frombuffer(content, dtype="<u8"), dtype=np.uint64)
+
+
+def encode_result(value) -> bytes:
+    """ uint64 ID arrays and edge lists are sorted, other values pickled
+
+    :return: bytes
+    """
+    compressor = zstd.ZstdCompressor(level=3)
+    if isinstance(value, np.ndarray) and value.dtype == np.uint64:
+        if value.ndim == 1:
+            ids = np.sort(value)
+            return _IDS + compressor.compress(_encode_sorted_ids(ids))
+        if value.ndim == 2 and value.shape[1] == 2:
+            edges = value[np.lexsort((value[:, 1], value[:, 0]))]
+            content = _encode_sorted_ids(edges[:, 0]) + edges[:, 1].astype("<u8").tobytes()
+            return _EDGES + compressor.compress(content)
+    return _PICKLE + compressor.compress(pickle.dumps(value))
+
+
+def decode_result(content: bytes):
+    kind, content = content[:1], zstd.ZstdDecompressor().decompressobj().decompress(content[1:])
+    if kind == _IDS:
+        return _decode_sorted_ids(content)
+    if kind == _EDGES:
+        n_edges = len(content) // 16
+        edges = np.empty((n_edges, 2), dtype=np.uint64)
+        edges[:, 0] = _decode_sorted_ids(content[: n_edges * 8])
+        edges[:, 1] = np.frombuffer(content[n_edges * 8 :], dtype="<u8")
+        return edges
+    if kind == _PICKLE:
+        return pickle.loads(content)
+    raise ValueError(f"Unknown result encoding {kind}")
+
+
+class RedisStore:
+    """
+    Size bounded LRU of bytes in redis. Access times are kept in a sorted
+    set, entry sizes in a hash.
+    """
+
+    def __init__(self, redis_conn, max_bytes: int = 10 * 1024 ** 3, prefix: str = "results"):
+        self._redis = redis_conn
+        self._max_bytes = max_bytes
+        self._prefix = prefix
+        self._index_key = f"{prefix}:index"
+        self._sizes_key = f"{prefix}:sizes"
+        self._size_key = f"{prefix}:size"
+
+    def _get_data_key(self, key: str) -> str:
+        return f"{self._prefix}:data:{key}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        content = self._redis.get(self._get_data_key(key))
+        if content is not None:
+            self._redis.zadd(self._index_key, {key: time.time()})
+        return content
+
+    def put(self, key: str, content: bytes) -> None:
+        pipe = self._redis.pipeline()
+        pipe.set(self._get_data_key(key), content)
+        pipe.zadd(self._index_key, {key: time.time()})
+        pipe.hget(self._sizes_key, key)
+        pipe.hset(self._sizes_key, key, len(content))
+        _, _, old_size, _ = pipe.execute()
+        size = self._redis.incrby(self._size_key, len(content) - int(old_size or 0))
+        if size > self._max_bytes:
+            self.evict()
+
+    def evict(self, target_fraction: float = 0.9) -> int:
+        """
+        Remove least recently used entries until the store is below
+        `target_fraction` of its maximum size.
+        :return: number of removed entries
+        """
+        removed = 0
+        target = self._max_bytes * target_fraction
+        while int(self._redis.get(self._size_key) or 0) > target:
+            oldest = self._redis.zpopmin(self._index_key)
+            if not oldest:
+                break
+            key = oldest[0][0].decode()
+            size = int(self._redis.hget(self._sizes_key, key) or 0)
+            pipe = self._redis.pipeline()
+            pipe.delete(self._get_data_key(key))
+            pipe.hdel(self._sizes_key, key)
+            pipe.decrby(self._size_key, size)
+            pipe.execute()
+            removed += 1
+        return removed
+
+
+class ResultCache:
+    def __init__(self, store):
+        """
+        :param store: `DiskCache` or `RedisStore`
+        """
+        self._store = store
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    @staticmethod
+    def get_key(table_id: str, node_id, endpoint: str, bounds: Optional[str] = None, **params) -> str:
+        """
+        :param bounds: bounding box argument of the request
+        :param params: other request parameters that change the result
+        """
+        params_str = json.dumps(params, sort_keys=True, default=str)
+        return f"{table_id}:{int(node_id)}:{endpoint}:{bounds}:{params_str}"
+
+    def get(self, key: str):
+        content = self._store.get(key)
+        if content is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return decode_result(content)
+
+    def put(self, key: str, value):
+        """
+        :return: value as returned by `get` (ID arrays are sorted)
+        """
+        content = encode_result(value)
+        self._store.put(key, content)
+        return decode_result(content)
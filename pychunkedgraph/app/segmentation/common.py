@@ -1,4 +1,3 @@
-import collections
 import json
 import threading
 import time
@@ -13,13 +12,11 @@ import numpy as np
 from pytz import UTC
 import pandas as pd
 
-from cloudvolume import compression
-
 from middle_auth_client import get_usernames
 
 from flask import current_app, g, jsonify, make_response, request
 from pychunkedgraph import __version__
-from pychunkedgraph.app import app_utils
+from pychunkedgraph.app import app_utils, content_encoding
 from pychunkedgraph.backend import chunkedgraph_exceptions as cg_exceptions
 from pychunkedgraph.backend import history as cg_history
 from pychunkedgraph.backend.utils import column_keys
@@ -49,60 +46,71 @@ def home():
 
 
 def before_request():
-    current_app.request_start_time = time.time()
-    current_app.request_start_date = datetime.utcnow()
-    current_app.user_id = None
-    current_app.table_id = None
-    current_app.request_type = None
+    g.request_start_time = time.time()
+    g.request_start_date = datetime.utcnow()
+    g.user_id = None
+    g.table_id = None
+    g.request_type = None
 
-    content_encoding = request.headers.get('Content-Encoding', '')
+    request_encoding = request.headers.get('Content-Encoding', '')
 
-    if "gzip" in content_encoding.lower():
-        request.data = compression.decompress(request.data, "gzip")
+    if request_encoding:
+        try:
+            request.data = content_encoding.decompress(request.data, request_encoding)
+        except ValueError as e:
+            raise cg_exceptions.BadRequest(f"Cannot decode request data: {e}")
 
 
 def after_request(response):
-    dt = (time.time() - current_app.request_start_time) * 1000
+    dt = (time.time() - g.request_start_time) * 1000
 
     current_app.logger.debug("Response time: %.3fms" % dt)
 
     try:
-        if current_app.user_id is None:
+        if g.user_id is None:
             user_id = ""
         else:
-            user_id = current_app.user_id
+            user_id = g.user_id
 
-        if current_app.table_id is not None:
-            log_db = app_utils.get_log_db(current_app.table_id)
+        if g.table_id is not None:
+            log_db = app_utils.get_log_db(g.table_id)
             log_db.add_success_log(
                 user_id=user_id,
                 user_ip="",
-                request_time=current_app.request_start_date,
+                request_time=g.request_start_date,
                 response_time=dt,
                 url=request.url,
                 request_data=request.data,
-                request_type=current_app.request_type,
+                request_type=g.request_type,
             )
     except Exception as e:
-        current_app.logger.debug(f"{current_app.user_id}: LogDB entry not"
+        current_app.logger.debug(f"{g.user_id}: LogDB entry not"
                                  f" successful: {e}")
 
     accept_encoding = request.headers.get('Accept-Encoding', '')
+    encoding = content_encoding.choose_encoding(accept_encoding)
+
+    if encoding is None:
+        return response
 
-    if 'gzip' not in accept_encoding.lower():
+    # streamed responses compress themselves
+    if response.is_streamed:
         return response
 
     response.direct_passthrough = False
 
-    if (response.status_code < 200 or
-            response.status_code >= 300 or
-            'Content-Encoding' in response.headers):
+    if not content_encoding.should_compress(
+            response, current_app.config["COMPRESSION_MIN_SIZE"]):
         return response
 
-    response.data = compression.gzip_compress(response.data)
+    if encoding == "zstd":
+        level = current_app.config["COMPRESSION_ZSTD_LEVEL"]
+    else:
+        level = current_app.config["COMPRESSION_GZIP_LEVEL"]
+    response.data = content_encoding.compress(response.data, encoding, level)
 
-    response.headers['Content-Encoding'] = 'gzip'
-    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
     response.headers['Content-Length'] = len(response.data)
 
     return response
@@ -110,7 +118,7 @@ def after_request(response):
 
 def unhandled_exception(e):
     status_code = 500
-    response_time = (time.time() - current_app.request_start_time) * 1000
+    response_time = (time.time() - g.request_start_time) * 1000
     user_ip = str(request.remote_addr)
     tb = traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
 
@@ -119,7 +127,7 @@ def unhandled_exception(e):
             "message": str(e),
             "user_id": user_ip,
             "user_ip": user_ip,
-            "request_time": current_app.request_start_date,
+            "request_time": g.request_start_date,
             "request_url": request.url,
             "request_data": request.data,
             "response_time": response_time,
@@ -129,7 +137,7 @@ def unhandled_exception(e):
     )
 
     resp = {
-        "timestamp": current_app.request_start_date,
+        "timestamp": g.request_start_date,
         "duration": response_time,
         "code": status_code,
         "message": str(e),
@@ -140,7 +148,7 @@ def unhandled_exception(e):
 
 
 def api_exception(e):
-    response_time = (time.time() - current_app.request_start_time) * 1000
+    response_time = (time.time() - g.request_start_time) * 1000
     user_ip = str(request.remote_addr)
     tb = traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)
 
@@ -149,7 +157,7 @@ def api_exception(e):
             "message": str(e),
             "user_id": user_ip,
             "user_ip": user_ip,
-            "request_time": current_app.request_start_date,
+            "request_time": g.request_start_date,
             "request_url": request.url,
             "request_data": request.data,
             "response_time": response_time,
@@ -159,7 +167,7 @@ def api_exception(e):
     )
 
     resp = {
-        "timestamp": current_app.request_start_date,
+        "timestamp": g.request_start_date,
         "duration": response_time,
         "code": e.status_code.value,
         "message": str(e),
@@ -174,7 +182,7 @@ def api_exception(e):
 
 
 def sleep_me(sleep):
-    current_app.request_type = "sleep"
+    g.request_type = "sleep"
 
     time.sleep(sleep)
     return "zzz... {} ... awake".format(sleep)
@@ -194,14 +202,21 @@ def handle_api_versions():
     return jsonify(__api_versions__)
 
 
+def set_request_state(table_id):
+    """ Table and user of the request for the log, set by routes whose
+        handler may not run (shared or cached results) """
+    g.table_id = table_id
+    g.user_id = str(g.auth_user["id"])
+
+
 ### GET ROOT -------------------------------------------------------------------
 
 
 def handle_root(table_id, atomic_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
 
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     # Convert seconds since epoch to UTC datetime
     try:
@@ -238,8 +253,8 @@ def handle_root(table_id, atomic_id):
 
 
 def handle_roots(table_id, is_binary=False):
-    current_app.request_type = "roots"
-    current_app.table_id = table_id
+    g.request_type = "roots"
+    g.table_id = table_id
 
     if is_binary:
         node_ids = np.frombuffer(request.data, np.uint64)
@@ -269,12 +284,58 @@ def handle_roots(table_id, is_binary=False):
     return root_ids
 
 
+def handle_roots_from_coord(table_id):
+    """ Roots of the supervoxels at many coordinates (in nm). With
+        `node_ids`, the supervoxel of each coordinate is searched around it
+        among those of the same root as its node id. """
+    g.request_type = "roots_from_coords"
+    g.table_id = table_id
+
+    data = json.loads(request.data)
+    try:
+        coordinates = np.array(data["coords"], dtype=np.float64).reshape(-1, 3)
+    except (KeyError, TypeError, ValueError):
+        raise cg_exceptions.BadRequest("coords has to be a list of [x, y, z]")
+
+    node_ids = data.get("node_ids", None)
+    if node_ids is not None:
+        node_ids = np.array(node_ids, dtype=np.uint64)
+        if len(node_ids) != len(coordinates):
+            raise cg_exceptions.BadRequest(
+                "node_ids and coords need to have the same length")
+
+    # Convert seconds since epoch to UTC datetime
+    try:
+        timestamp = float(request.args.get("timestamp", time.time()))
+        timestamp = datetime.fromtimestamp(timestamp, UTC)
+    except (TypeError, ValueError) as e:
+        raise (
+            cg_exceptions.BadRequest(
+                "Timestamp parameter is not a valid" " unix timestamp"
+            )
+        )
+
+    # Call ChunkedGraph
+    cg = app_utils.get_cg(table_id)
+    coordinates = coordinates / cg.segmentation_resolution
+    supervoxel_ids = cg.get_atomic_ids_from_coords(coordinates, parent_ids=node_ids)
+
+    # 0 where no supervoxel was found
+    root_ids = np.zeros(len(supervoxel_ids), dtype=np.uint64)
+    is_found = supervoxel_ids != 0
+    if np.any(is_found):
+        root_ids[is_found] = cg.get_roots(supervoxel_ids[is_found],
+                                          time_stamp=timestamp)
+
+    return {"root_ids": root_ids, "supervoxel_ids": supervoxel_ids}
+
+
 ### RANGE READ -------------------------------------------------------------------
 
 
 def handle_l2_chunk_children(table_id, chunk_id, as_array):
-    current_app.request_type = "l2_chunk_children"
-    current_app.table_id = table_id
+    g.request_type = "l2_chunk_children"
+    g.table_id = table_id
 
     # Convert seconds since epoch to UTC datetime
     try:
@@ -340,16 +401,38 @@ def trigger_remesh(table_id, new_lvl2_ids, is_priority=True):
                             headers=auth_header)
     resp.raise_for_status()
 
+
+def _get_atomic_ids_from_nodes(cg, nodes):
+    """ Supervoxel ids of [node_id, x, y, z] nodes (coordinates in nm),
+        resolved together
+
+    :return: supervoxel ids, voxel coordinates
+    """
+    parent_ids = np.array([node[0] for node in nodes], dtype=np.uint64)
+    coordinates = np.array([node[1:] for node in nodes], dtype=np.float64)
+    coordinates = coordinates.reshape(-1, 3) / cg.segmentation_resolution
+
+    atomic_ids = cg.get_atomic_ids_from_coords(coordinates, parent_ids=parent_ids)
+
+    if np.any(atomic_ids == 0):
+        coordinate = coordinates[np.argmax(atomic_ids == 0)]
+        raise cg_exceptions.BadRequest(
+            f"Could not determine supervoxel ID for coordinates "
+            f"{coordinate}."
+        )
+    return atomic_ids, coordinates
+
+
 ### MERGE ----------------------------------------------------------------------
 
 
 def handle_merge(table_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
 
     nodes = json.loads(request.data)
     is_priority = request.args.get('priority', True, type=str2bool)
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     current_app.logger.debug(nodes)
     assert len(nodes) == 2
@@ -357,25 +440,7 @@ def handle_merge(table_id):
     # Call ChunkedGraph
     cg = app_utils.get_cg(table_id)
 
-    atomic_edge = []
-    coords = []
-    for node in nodes:
-        node_id = node[0]
-        x, y, z = node[1:]
-        coordinate = np.array([x, y, z]) / cg.segmentation_resolution
-
-        atomic_id = cg.get_atomic_id_from_coord(
-            coordinate[0], coordinate[1], coordinate[2], parent_id=np.uint64(node_id)
-        )
-
-        if atomic_id is None:
-            raise cg_exceptions.BadRequest(
-                f"Could not determine supervoxel ID for coordinates " 
-                f"{coordinate}."
-            )
-
-        coords.append(coordinate)
-        atomic_edge.append(atomic_id)
+    atomic_edge, coords = _get_atomic_ids_from_nodes(cg, nodes)
 
     # Protection from long range mergers
     chunk_coord_delta = cg.get_chunk_coordinates(
@@ -418,43 +483,33 @@ def handle_merge(table_id):
 ### SPLIT ----------------------------------------------------------------------
 
 
+def _get_split_data_dict(cg, data):
+    """ Supervoxel ids and coordinates of sources and sinks, resolved
+        together """
+    n_sources = len(data["sources"])
+    atomic_ids, coordinates = _get_atomic_ids_from_nodes(
+        cg, list(data["sources"]) + list(data["sinks"]))
+
+    data_dict = {}
+    for k, sl in [("sources", slice(None, n_sources)), ("sinks", slice(n_sources, None))]:
+        data_dict[k] = {"id": list(atomic_ids[sl]), "coord": list(coordinates[sl])}
+    return data_dict
+
+
 def handle_split(table_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
 
     data = json.loads(request.data)
     is_priority = request.args.get('priority', True, type=str2bool)
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     current_app.logger.debug(data)
 
     # Call ChunkedGraph
     cg = app_utils.get_cg(table_id)
 
-    data_dict = {}
-    for k in ["sources", "sinks"]:
-        data_dict[k] = collections.defaultdict(list)
-
-        for node in data[k]:
-            node_id = node[0]
-            x, y, z = node[1:]
-            coordinate = np.array([x, y, z]) / cg.segmentation_resolution
-
-            atomic_id = cg.get_atomic_id_from_coord(
-                coordinate[0],
-                coordinate[1],
-                coordinate[2],
-                parent_id=np.uint64(node_id),
-            )
-
-            if atomic_id is None:
-                raise cg_exceptions.BadRequest(
-                    f"Could not determine supervoxel ID for coordinates "
-                    f"{coordinate}."
-                )
-
-            data_dict[k]["id"].append(atomic_id)
-            data_dict[k]["coord"].append(coordinate)
+    data_dict = _get_split_data_dict(cg, data)
 
     current_app.logger.debug(data_dict)
 
@@ -498,12 +553,12 @@ def handle_undo(table_id):
             "Undo not supported for this chunkedgraph table."
         )
         
-    current_app.table_id = table_id
+    g.table_id = table_id
 
     data = json.loads(request.data)
     is_priority = request.args.get('priority', True, type=str2bool)
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     current_app.logger.debug(data)
 
@@ -538,12 +593,12 @@ def handle_redo(table_id):
             "Redo not supported for this chunkedgraph table."
         )
         
-    current_app.table_id = table_id
+    g.table_id = table_id
 
     data = json.loads(request.data)
     is_priority = request.args.get('priority', True, type=str2bool)
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     current_app.logger.debug(data)
 
@@ -578,10 +633,10 @@ def handle_rollback(table_id):
             "Rollback not supported for this chunkedgraph table."
         )
         
-    current_app.table_id = table_id
+    g.table_id = table_id
 
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
     target_user_id = request.args["user_id"]
 
     # Call ChunkedGraph
@@ -613,9 +668,9 @@ def handle_rollback(table_id):
 
 
 def all_user_operations(table_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
     target_user_id = request.args["user_id"]
 
     try:
@@ -654,9 +709,9 @@ def all_user_operations(table_id):
 
 
 def handle_children(table_id, parent_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     cg = app_utils.get_cg(table_id)
 
@@ -675,9 +730,9 @@ def handle_children(table_id, parent_id):
 
 
 def handle_leaves(table_id, root_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     if "bounds" in request.args:
         bounds = request.args["bounds"]
@@ -696,13 +751,75 @@ def handle_leaves(table_id, root_id):
     return atomic_ids
 
 
+def handle_leaves_stream(table_id, root_id):
+    """ Like handle_leaves, but returns an iterator of batches of atomic ids """
+    g.table_id = table_id
+    user_id = str(g.auth_user["id"])
+    g.user_id = user_id
+
+    if "bounds" in request.args:
+        bounds = request.args["bounds"]
+        bounding_box = np.array(
+            [b.split("-") for b in bounds.split("_")], dtype=np.int
+        ).T
+    else:
+        bounding_box = None
+
+    # Call ChunkedGraph
+    cg = app_utils.get_cg(table_id)
+    return cg.iter_subgraph_nodes(
+        int(root_id), bounding_box=bounding_box, bb_is_coordinate=True
+    )
+
+
+def handle_leaves_many(table_id, is_binary=False):
+    g.request_type = "leaves_many"
+    g.table_id = table_id
+    user_id = str(g.auth_user["id"])
+    g.user_id = user_id
+
+    if is_binary:
+        node_ids = np.frombuffer(request.data, np.uint64)
+    else:
+        node_ids = np.array(json.loads(request.data)["node_ids"],
+                            dtype=np.uint64)
+
+    # Convert seconds since epoch to UTC datetime
+    timestamp = None
+    if "timestamp" in request.args:
+        try:
+            timestamp = float(request.args["timestamp"])
+            timestamp = datetime.fromtimestamp(timestamp, UTC)
+        except (TypeError, ValueError) as e:
+            raise (
+                cg_exceptions.BadRequest(
+                    "Timestamp parameter is not a valid" " unix timestamp"
+                )
+            )
+
+    if "bounds" in request.args:
+        bounds = request.args["bounds"]
+        bounding_box = np.array(
+            [b.split("-") for b in bounds.split("_")], dtype=np.int
+        ).T
+    else:
+        bounding_box = None
+
+    # Call ChunkedGraph
+    cg = app_utils.get_cg(table_id)
+    return cg.get_leaves_multiple(
+        node_ids, bounding_box=bounding_box, bb_is_coordinate=True,
+        time_stamp=timestamp
+    )
+
+
 ### LEAVES FROM LEAVES ---------------------------------------------------------
 
 
 def handle_leaves_from_leave(table_id, atomic_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     if "bounds" in request.args:
         bounds = request.args["bounds"]
@@ -727,9 +844,9 @@ def handle_leaves_from_leave(table_id, atomic_id):
 
 
 def handle_subgraph(table_id, root_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     if "bounds" in request.args:
         bounds = request.args["bounds"]
@@ -748,13 +865,35 @@ def handle_subgraph(table_id, root_id):
     return atomic_edges
 
 
+def handle_subgraph_stream(table_id, root_id):
+    """ Like handle_subgraph, but returns an iterator of batches of edges """
+    g.table_id = table_id
+    user_id = str(g.auth_user["id"])
+    g.user_id = user_id
+
+    if "bounds" in request.args:
+        bounds = request.args["bounds"]
+        bounding_box = np.array(
+            [b.split("-") for b in bounds.split("_")], dtype=np.int
+        ).T
+    else:
+        bounding_box = None
+
+    # Call ChunkedGraph
+    cg = app_utils.get_cg(table_id)
+    edge_infos = cg.iter_subgraph_edges(
+        int(root_id), bounding_box=bounding_box, bb_is_coordinate=True
+    )
+    return (edges for edges, _, _ in edge_infos)
+
+
 ### CHANGE LOG -----------------------------------------------------------------
 
 
 def change_log(table_id, root_id=None):
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     try:
         time_stamp_past = float(request.args.get("timestamp", 0))
@@ -777,9 +916,9 @@ def change_log(table_id, root_id=None):
 
 
 def tabular_change_log_recent(table_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     try:
         start_time = float(request.args.get("start_time", 0))
@@ -817,13 +956,13 @@ def tabular_change_log_recent(table_id):
 
 def tabular_change_log(table_id, root_id, get_root_ids, filtered):
     if get_root_ids:
-        current_app.request_type = "tabular_changelog_wo_ids"
+        g.request_type = "tabular_changelog_wo_ids"
     else:
-        current_app.request_type = "tabular_changelog"
+        g.request_type = "tabular_changelog"
 
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     # Call ChunkedGraph
     cg = app_utils.get_cg(table_id)
@@ -842,9 +981,9 @@ def tabular_change_log(table_id, root_id, get_root_ids, filtered):
 
 
 def merge_log(table_id, root_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     try:
         time_stamp_past = float(request.args.get("timestamp", 0))
@@ -864,9 +1003,9 @@ def merge_log(table_id, root_id):
 
 
 def last_edit(table_id, root_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     cg = app_utils.get_cg(table_id)
 
@@ -876,9 +1015,9 @@ def last_edit(table_id, root_id):
 
 
 def oldest_timestamp(table_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     cg = app_utils.get_cg(table_id)
 
@@ -898,9 +1037,9 @@ def handle_contact_sites(table_id, root_id):
     as_list = request.args.get("as_list", True, type=app_utils.toboolean)
     areas_only = request.args.get("areas_only", True, type=app_utils.toboolean)
 
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     try:
         timestamp = float(request.args.get("timestamp", time.time()))
@@ -936,10 +1075,10 @@ def handle_contact_sites(table_id, root_id):
     return cs_list, cs_metadata
 
 def handle_pairwise_contact_sites(table_id, first_node_id, second_node_id):
-    current_app.request_type = "pairwise_contact_sites"
-    current_app.table_id = table_id
+    g.request_type = "pairwise_contact_sites"
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     try:
         timestamp = float(request.args.get("timestamp", time.time()))
@@ -967,37 +1106,16 @@ def handle_pairwise_contact_sites(table_id, first_node_id, second_node_id):
 
 
 def handle_split_preview(table_id):
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     data = json.loads(request.data)
     current_app.logger.debug(data)
 
     cg = app_utils.get_cg(table_id)
 
-    data_dict = {}
-    for k in ["sources", "sinks"]:
-        data_dict[k] = collections.defaultdict(list)
-
-        for node in data[k]:
-            node_id = node[0]
-            x, y, z = node[1:]
-            coordinate = np.array([x, y, z]) / cg.segmentation_resolution
-
-            atomic_id = cg.get_atomic_id_from_coord(coordinate[0],
-                                                    coordinate[1],
-                                                    coordinate[2],
-                                                    parent_id=np.uint64(
-                                                        node_id))
-
-            if atomic_id is None:
-                raise cg_exceptions.BadRequest(
-                    f"Could not determine supervoxel ID for coordinates "
-                    f"{coordinate}.")
-
-            data_dict[k]["id"].append(atomic_id)
-            data_dict[k]["coord"].append(coordinate)
+    data_dict = _get_split_data_dict(cg, data)
 
     current_app.logger.debug(data_dict)
 
@@ -1025,36 +1143,22 @@ def handle_split_preview(table_id):
 
 
 def handle_find_path(table_id, precision_mode):
-    current_app.table_id = table_id
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     nodes = json.loads(request.data)
 
     current_app.logger.debug(nodes)
-    assert len(nodes) == 2
+    if len(nodes) != 2:
+        raise cg_exceptions.BadRequest(
+            f"Expected a source and a target node, got {len(nodes)} nodes."
+        )
 
     # Call ChunkedGraph
     cg = app_utils.get_cg(table_id)
-    def _get_supervoxel_id_from_node(node):
-        node_id = node[0]
-        x, y, z = node[1:]
-        coordinate = np.array([x, y, z]) / cg.segmentation_resolution
-
-        supervoxel_id = cg.get_atomic_id_from_coord(coordinate[0],
-                                                coordinate[1],
-                                                coordinate[2],
-                                                parent_id=np.uint64(node_id))
-        if supervoxel_id is None:
-            raise cg_exceptions.BadRequest(
-                f"Could not determine supervoxel ID for coordinates "
-                f"{coordinate}."
-            )
-
-        return supervoxel_id
-
-    source_supervoxel_id = _get_supervoxel_id_from_node(nodes[0])
-    target_supervoxel_id = _get_supervoxel_id_from_node(nodes[1])
+    supervoxel_ids, _ = _get_atomic_ids_from_nodes(cg, nodes)
+    source_supervoxel_id, target_supervoxel_id = supervoxel_ids
     source_l2_id = cg.get_parent(source_supervoxel_id)
     target_l2_id = cg.get_parent(target_supervoxel_id)
 
@@ -1076,10 +1180,10 @@ def handle_find_path(table_id, precision_mode):
 
 ### GET_LAYER2_SUBGRAPH
 def handle_get_layer2_graph(table_id, node_id):
-    current_app.request_type = "get_lvl2_graph"
-    current_app.table_id = table_id
+    g.request_type = "get_lvl2_graph"
+    g.table_id = table_id
     user_id = str(g.auth_user["id"])
-    current_app.user_id = user_id
+    g.user_id = user_id
 
     cg = app_utils.get_cg(table_id)
     edge_graph = pathing.get_lvl2_edge_list(cg, int(node_id))
@@ -1090,8 +1194,8 @@ def handle_get_layer2_graph(table_id, node_id):
 ### IS LATEST ROOTS --------------------------------------------------------------
 
 def handle_is_latest_roots(table_id, is_binary):
-    current_app.request_type = "is_latest_roots"
-    current_app.table_id = table_id
+    g.request_type = "is_latest_roots"
+    g.table_id = table_id
 
     if is_binary:
         node_ids = np.frombuffer(request.data, np.uint64)
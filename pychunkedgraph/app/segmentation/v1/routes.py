@@ -1,6 +1,7 @@
 import io
 import csv
 import pickle
+import numpy as np
 import pandas as pd
 
 from flask import make_response, current_app
@@ -9,7 +10,8 @@ from middle_auth_client import auth_requires_permission
 from middle_auth_client import auth_requires_admin
 from middle_auth_client import auth_required
 
-from pychunkedgraph.app.app_utils import jsonify_with_kwargs, toboolean, tobinary
+from pychunkedgraph.app.app_utils import jsonify_with_kwargs, respond_with_format, stream_frames, toboolean, tobinary
+from pychunkedgraph.app.app_utils import cached_result, get_request_key, get_result_key, single_flight
 from pychunkedgraph.app.segmentation import common
 from pychunkedgraph.backend import chunkedgraph_exceptions as cg_exceptions
 
@@ -159,7 +161,9 @@ def handle_user_operations(table_id):
 @auth_requires_permission("view")
 def handle_root(table_id, node_id):
     int64_as_str = request.args.get("int64_as_str", default=False, type=toboolean)
-    root_id = common.handle_root(table_id, node_id)
+    common.set_request_state(table_id)
+    root_id = single_flight(get_request_key(table_id, node_id),
+                            common.handle_root, table_id, node_id)
     resp = {"root_id": root_id}
     return jsonify_with_kwargs(resp, int64_as_str=int64_as_str)
 
@@ -195,9 +199,11 @@ def handle_roots_binary(table_id):
 @auth_requires_permission("view")
 def handle_children(table_id, node_id):
     int64_as_str = request.args.get("int64_as_str", default=False, type=toboolean)
-    children_ids = common.handle_children(table_id, node_id)
+    common.set_request_state(table_id)
+    children_ids = cached_result(get_result_key(table_id, node_id, "children"),
+                                 common.handle_children, table_id, node_id)
     resp = {"children_ids": children_ids}
-    return jsonify_with_kwargs(resp, int64_as_str=int64_as_str)
+    return respond_with_format(resp, int64_as_str=int64_as_str)
 
 
 ### GET L2:SV MAPPINGS OF A L2 CHUNK ------------------------------------------------------------------
@@ -236,10 +242,39 @@ def handle_l2_chunk_children_binary(table_id, chunk_id):
 @auth_requires_permission("view", public_table_key='table_id', public_node_key='node_id', 
                           service_token=AUTH_TOKEN)
 def handle_leaves(table_id, node_id):
+    if request.args.get("stream", default=False, type=toboolean):
+        return stream_frames(common.handle_leaves_stream(table_id, node_id))
+
     int64_as_str = request.args.get("int64_as_str", default=False, type=toboolean)
-    leaf_ids = common.handle_leaves(table_id, node_id)
+    common.set_request_state(table_id)
+    leaf_ids = cached_result(get_result_key(table_id, node_id, "leaves"),
+                             common.handle_leaves, table_id, node_id)
     resp = {"leaf_ids": leaf_ids}
-    return jsonify_with_kwargs(resp, int64_as_str=int64_as_str)
+    return respond_with_format(resp, int64_as_str=int64_as_str)
+
+
+### LEAVES OF MANY NODES --------------------------------------------------------
+
+
+@bp.route("/table/<table_id>/node/leaves_many", methods=["POST"])
+@auth_requires_permission("view")
+def handle_leaves_many(table_id):
+    int64_as_str = request.args.get("int64_as_str", default=False, type=toboolean)
+    leaves_d = common.handle_leaves_many(table_id, is_binary=False)
+    resp = {str(node_id): leaf_ids for node_id, leaf_ids in leaves_d.items()}
+    return respond_with_format(resp, int64_as_str=int64_as_str)
+
+
+@bp.route("/table/<table_id>/node/leaves_many_binary", methods=["POST"])
+@auth_requires_permission("view")
+def handle_leaves_many_binary(table_id):
+    # [n_nodes, node_ids (n_nodes), n_leaves (n_nodes), leaf_ids] as uint64
+    leaves_d = common.handle_leaves_many(table_id, is_binary=True)
+    node_ids = np.array(list(leaves_d.keys()), dtype=np.uint64)
+    n_leaves = np.array([len(l) for l in leaves_d.values()], dtype=np.uint64)
+    leaf_ids = [np.array(l, dtype=np.uint64) for l in leaves_d.values()]
+    return tobinary(np.concatenate([[np.uint64(len(node_ids))], node_ids,
+                                    n_leaves] + leaf_ids).astype(np.uint64))
 
 
 ### SUBGRAPH -------------------------------------------------------------------
@@ -248,10 +283,15 @@ def handle_leaves(table_id, node_id):
 @bp.route("/table/<table_id>/node/<node_id>/subgraph", methods=["GET"])
 @auth_requires_permission("view")
 def handle_subgraph(table_id, node_id):
+    if request.args.get("stream", default=False, type=toboolean):
+        return stream_frames(common.handle_subgraph_stream(table_id, node_id))
+
     int64_as_str = request.args.get("int64_as_str", default=False, type=toboolean)
-    subgraph_result = common.handle_subgraph(table_id, node_id)
+    common.set_request_state(table_id)
+    subgraph_result = cached_result(get_result_key(table_id, node_id, "subgraph"),
+                                    common.handle_subgraph, table_id, node_id)
     resp = {"atomic_edges": subgraph_result}
-    return jsonify_with_kwargs(resp, int64_as_str=int64_as_str)
+    return respond_with_format(resp, int64_as_str=int64_as_str)
 
 
 ### CONTACT SITES --------------------------------------------------------------
@@ -268,7 +308,7 @@ def handle_contact_sites(table_id, node_id):
         "contact_sites": contact_sites,
         "contact_site_metadata": contact_site_metadata,
     }
-    return jsonify_with_kwargs(resp, int64_as_str=int64_as_str)
+    return respond_with_format(resp, int64_as_str=int64_as_str)
 
 
 @bp.route("/table/<table_id>/node/contact_sites_pair/<first_node_id>/<second_node_id>", methods=["GET"])
@@ -282,7 +322,7 @@ def handle_pairwise_contact_sites(table_id, first_node_id, second_node_id):
         "contact_sites": contact_sites,
         "contact_site_metadata": contact_site_metadata,
     }
-    return jsonify_with_kwargs(resp, int64_as_str=int64_as_str)
+    return respond_with_format(resp, int64_as_str=int64_as_str)
 
 ### CHANGE LOG -----------------------------------------------------------------
 
@@ -318,7 +358,7 @@ def tabular_change_log_weekly(table_id):
 def change_log(table_id, root_id):
     int64_as_str = request.args.get("int64_as_str", default=False, type=toboolean)
     log = common.change_log(table_id, root_id)
-    return jsonify_with_kwargs(log, int64_as_str=int64_as_str)
+    return respond_with_format(log, int64_as_str=int64_as_str)
 
 
 @bp.route("/table/<table_id>/root/<root_id>/tabular_change_log", methods=["GET"])
@@ -339,7 +379,7 @@ def tabular_change_log(table_id, root_id):
 def merge_log(table_id, root_id):
     int64_as_str = request.args.get("int64_as_str", default=False, type=toboolean)
     log = common.merge_log(table_id, root_id)
-    return jsonify_with_kwargs(log, int64_as_str=int64_as_str)
+    return respond_with_format(log, int64_as_str=int64_as_str)
 
 
 @bp.route("/table/<table_id>/oldest_timestamp", methods=["GET"])
@@ -380,7 +420,7 @@ def find_path(table_id):
 def handle_get_lvl2_graph(table_id, node_id):
     int64_as_str = request.args.get("int64_as_str", default=False, type=toboolean)
     resp = common.handle_get_layer2_graph(table_id, node_id)
-    return jsonify_with_kwargs(resp, int64_as_str=int64_as_str)
+    return respond_with_format(resp, int64_as_str=int64_as_str)
 
 
 ### IS LATEST ROOTS --------------------------------------------------------------
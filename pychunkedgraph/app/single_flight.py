@@ -0,0 +1,134 @@
+"""
+Single flight execution of identical concurrent requests.
+
+While a result for a key is being computed, other callers with the same
+key wait for that result instead of computing it again. Within a process
+callers wait on a thread event. With a redis connection, one process
+holds a lock for the key and hands its result to the other processes;
+results are only handed to callers that arrived while the computation
+was running, so nothing is served from a stale cache.
+"""
+
+import time
+import uuid
+import pickle
+import logging
+import threading
+from typing import Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(
+        self,
+        redis_conn=None,
+        lock_timeout: float = 120,
+        result_ttl: float = 30,
+        poll_interval: float = 0.05,
+        prefix: str = "singleflight",
+    ):
+        """
+        :param redis_conn: share computations between processes
+        :param lock_timeout: seconds after which a remote computation is
+            considered lost and the result is computed locally
+        :param result_ttl: seconds remote results are kept for waiters
+        :param poll_interval: seconds between checks for remote results
+        """
+        self._redis = redis_conn
+        self._lock_timeout = lock_timeout
+        self._result_ttl = result_ttl
+        self._poll_interval = poll_interval
+        self._prefix = prefix
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.n_calls = 0
+        self.n_shared = 0
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs):
+        """ Returns func(*args, **kwargs), shared with concurrent calls
+            with the same key. Errors are raised in all waiting callers. """
+        with self._lock:
+            self.n_calls += 1
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.n_shared += 1
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if self._redis is None:
+                call.result = func(*args, **kwargs)
+            else:
+                call.result = self._do_remote(str(key), func, args, kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def _wait_for_result(self, result_key, lock_key, leader_token, deadline):
+        while time.time() < deadline:
+            content = self._redis.get(result_key)
+            if content is not None:
+                return content
+            if self._redis.get(lock_key) != leader_token:
+                # the result may have been written right before the release
+                return self._redis.get(result_key)
+            time.sleep(self._poll_interval)
+        return None
+
+    def _hand_over(self, result_key, result):
+        """ Best effort, waiters that do not get the result compute it
+            themselves once the lock is released """
+        try:
+            self._redis.set(
+                result_key, pickle.dumps(result), ex=max(1, int(self._result_ttl))
+            )
+        except Exception as e:
+            logger.error(f"Handing over {result_key} failed: {e}")
+
+    def _do_remote(self, key: str, func: Callable, args, kwargs):
+        lock_key = f"{self._prefix}:lock:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.time() + self._lock_timeout
+        while time.time() < deadline:
+            if self._redis.set(lock_key, token, nx=True, ex=int(self._lock_timeout)):
+                try:
+                    result = func(*args, **kwargs)
+                    self._hand_over(f"{self._prefix}:result:{key}:{token}", result)
+                    return result
+                finally:
+                    # only release our own lock
+                    if self._redis.get(lock_key) == token.encode():
+                        self._redis.delete(lock_key)
+
+            leader_token = self._redis.get(lock_key)
+            if leader_token is None:
+                continue
+            result_key = f"{self._prefix}:result:{key}:{leader_token.decode()}"
+            content = self._wait_for_result(result_key, lock_key, leader_token, deadline)
+            if content is not None:
+                with self._lock:
+                    self.n_shared += 1
+                return pickle.loads(content)
+            # the leader failed, take over
+        return func(*args, **kwargs)
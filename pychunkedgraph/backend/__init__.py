@@ -19,8 +19,9 @@ _datasource_fields = (
     "use_raw_edges",
     "use_raw_components",
     "data_version",
+    "edges_format",  # serialization of processed edges, "proto" or "columnar"
 )
-_datasource_defaults = (None, None, None, None, False, False, 4)
+_datasource_defaults = (None, None, None, None, False, False, 4, "proto")
 DataSource = namedtuple("DataSource", _datasource_fields, defaults=_datasource_defaults)
 
 _graphconfig_fields = (
@@ -1,4 +1,5 @@
 import collections
+import copy
 import numpy as np
 import time
 import datetime
@@ -12,15 +13,19 @@ import itertools
 import logging
 
 from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 from multiwrapper import multiprocessing_utils as mu
 from pychunkedgraph.backend import cutting, chunkedgraph_comp, flatgraph_utils
 from pychunkedgraph.backend.chunkedgraph_utils import compute_indices_pandas, \
     compute_bitmasks, get_google_compatible_time_stamp, \
     get_time_range_filter, get_time_range_and_column_filter, get_max_time, \
-    combine_cross_chunk_edge_dicts, get_min_time, partial_row_data_to_column_dict
+    combine_cross_chunk_edge_dicts, get_min_time, partial_row_data_to_column_dict, \
+    group_atomic_edges_by_node, group_by_index, resolve_cross_chunk_edges
 from pychunkedgraph.backend.utils import serializers, column_keys, row_keys, basetypes
 from pychunkedgraph.backend import chunkedgraph_exceptions as cg_exceptions, \
     chunkedgraph_edits as cg_edits, ChunkedGraphMeta
+from pychunkedgraph.io.segmentation import SegmentationBlockCache, \
+    get_segmentation_block_cache
 from pychunkedgraph.backend.graphoperation import (
     GraphEditOperation,
     MergeOperation,
@@ -43,7 +48,7 @@ from google.cloud.bigtable.row_filters import TimestampRange, \
 from google.cloud.bigtable.row_set import RowSet
 from google.cloud.bigtable.column_family import MaxVersionsGCRule
 
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union, NamedTuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union, NamedTuple
 
 
 HOME = os.path.expanduser("~")
@@ -74,7 +79,15 @@ class ChunkedGraph(object):
         is_new: bool = False,
         logger: Optional[logging.Logger] = None,
         meta: Optional[ChunkedGraphMeta] = None,
+        graph_settings: Optional[Dict[column_keys._Column, Any]] = None,
                 ) -> None:
+        """
+        :param client: bigtable client, can be shared by the ChunkedGraphs
+            of a process (they then share its gRPC channels)
+        :param graph_settings: dict column -> value of the parameters in the
+            GraphSettings row, e.g. from a local snapshot (see
+            `graph_settings`), instead of reading them from the table
+        """
 
         if logger is None:
             self.logger = logging.getLogger(f"{project_id}/{instance_id}/{table_id}")
@@ -100,33 +113,44 @@ class ChunkedGraph(object):
         if is_new:
             self._check_and_create_table()
 
+        if graph_settings is None:
+            graph_settings = self.read_graph_settings()
+        else:
+            graph_settings = copy.deepcopy(graph_settings)
+
         self._dataset_info = self.check_and_write_table_parameters(
             column_keys.GraphSettings.DatasetInfo, dataset_info,
-            required=True, is_new=is_new)
+            required=True, is_new=is_new, settings=graph_settings)
 
         self._cv_path = self._dataset_info["data_dir"]         # required
         self._mesh_dir = self._dataset_info.get("mesh", None)  # optional
 
         self._n_layers = self.check_and_write_table_parameters(
             column_keys.GraphSettings.LayerCount, n_layers,
-            required=True, is_new=is_new)
+            required=True, is_new=is_new, settings=graph_settings)
         self._fan_out = self.check_and_write_table_parameters(
             column_keys.GraphSettings.FanOut, fan_out,
-            required=True, is_new=is_new)
+            required=True, is_new=is_new, settings=graph_settings)
         s_bits_atomic_layer = self.check_and_write_table_parameters(
             column_keys.GraphSettings.SpatialBits,
             np.uint64(s_bits_atomic_layer),
-            required=False, is_new=is_new)
+            required=False, is_new=is_new,
+            settings=graph_settings)
         self._use_skip_connections = self.check_and_write_table_parameters(
             column_keys.GraphSettings.SkipConnections,
-            np.uint64(use_skip_connections), required=False, is_new=is_new) > 0
+            np.uint64(use_skip_connections), required=False, is_new=is_new,
+            settings=graph_settings) > 0
         self._n_bits_root_counter = self.check_and_write_table_parameters(
             column_keys.GraphSettings.RootCounterBits,
             np.uint64(n_bits_root_counter),
-            required=False, is_new=is_new)
+            required=False, is_new=is_new,
+            settings=graph_settings)
         self._chunk_size = self.check_and_write_table_parameters(
             column_keys.GraphSettings.ChunkSize, chunk_size,
-            required=True, is_new=is_new)
+            required=True, is_new=is_new, settings=graph_settings)
+
+        # before the dataset info is augmented below
+        self._graph_settings = copy.deepcopy(graph_settings)
 
         self._bitmasks = compute_bitmasks(self.n_layers, self.fan_out,
                                           s_bits_atomic_layer)
@@ -263,6 +287,19 @@ class ChunkedGraph(object):
 
         return self._cv
 
+    def get_ws_block_cache(self, mip: Optional[int] = None
+                           ) -> SegmentationBlockCache:
+        """ Cache of watershed blocks shared by all ChunkedGraph instances
+            of this process that use the same segmentation and mip
+
+        :param mip: int or None (cv_mip)
+        :return: SegmentationBlockCache
+        """
+        if mip is None:
+            mip = self.cv_mip
+        return get_segmentation_block_cache(self._cv_path, mip,
+                                            info=self.dataset_info)
+
     @property
     def vx_vol_bounds(self):
         return np.array(self.cv.bounds.to_list()).reshape(2, -1).T
@@ -293,10 +330,28 @@ class ChunkedGraph(object):
 
             self.logger.info(f"Table {self.table_id} created")
 
+    def read_graph_settings(self) -> Dict[column_keys._Column, Any]:
+        """ Reads all parameters of the GraphSettings row at once
+
+        :return: dict column -> value
+        """
+        columns = [column for column in vars(column_keys.GraphSettings).values()
+                   if isinstance(column, column_keys._Column)]
+        setting = self.read_byte_row(row_key=row_keys.GraphSettings,
+                                     columns=columns)
+        return {column: cells[0].value for column, cells in setting.items()}
+
+    @property
+    def graph_settings(self) -> Dict[column_keys._Column, Any]:
+        """ Parameters of the GraphSettings row this graph was created with,
+            can be passed to the constructor of another instance """
+        return self._graph_settings
+
     def check_and_write_table_parameters(self, column: column_keys._Column,
                                          value: Optional[Union[str, np.uint64]] = None,
                                          required: bool = True,
-                                         is_new: bool = False
+                                         is_new: bool = False,
+                                         settings: Optional[Dict[column_keys._Column, Any]] = None
                                          ) -> Union[str, np.uint64]:
         """ Checks if a parameter already exists in the table. If it already
         exists it returns the stored value, else it stores the given value.
@@ -308,21 +363,29 @@ class ChunkedGraph(object):
         :param value: Union[str, np.uint64]
         :param required: bool
         :param is_new: bool
+        :param settings: parameters read before with `read_graph_settings`,
+            updated with the stored value
         :return: Union[str, np.uint64]
             value
         """
-        setting = self.read_byte_row(row_key=row_keys.GraphSettings,
-                                     columns=column)
+        if settings is None:
+            setting = self.read_byte_row(row_key=row_keys.GraphSettings,
+                                         columns=column)
+            stored_value = setting[0].value if setting else None
+        else:
+            stored_value = settings.get(column, None)
 
-        if (not setting or is_new) and value is not None:
+        if (stored_value is None or is_new) and value is not None:
             row = self.mutate_row(row_keys.GraphSettings, {column: value})
             self.bulk_write([row])
-        elif not setting and value is None:
+        elif stored_value is None and value is None:
             assert not required
             return None
         else:
-            value = setting[0].value
+            value = stored_value
 
+        if settings is not None:
+            settings[column] = value
         return value
 
     def set_dataset_info_parameter(self, key: str, value: Any, overwrite: bool = False):
@@ -1464,71 +1527,94 @@ class ChunkedGraph(object):
         :param n_tries: int
         :return: np.uint64 or None
         """
-        if self.get_chunk_layer(parent_id) == 1:
-            return parent_id
+        atomic_id = self.get_atomic_ids_from_coords(
+            [[x, y, z]], parent_ids=[parent_id], n_tries=n_tries)[0]
 
+        # Returns None if unsuccessful
+        return atomic_id if atomic_id != 0 else None
 
-        x /= 2**self.cv_mip
-        y /= 2**self.cv_mip
+    def get_atomic_ids_from_coords(self, coordinates: Sequence[Sequence[int]],
+                                   parent_ids: Optional[Sequence[np.uint64]] = None,
+                                   n_tries: int = 5) -> np.ndarray:
+        """ Determines the atomic ids of many coordinates at once
 
-        x = int(x)
-        y = int(y)
-        z = int(z)
+        Without `parent_ids` the atomic id at each coordinate is returned.
+        With `parent_ids`, the atomic id of each coordinate is searched in
+        growing boxes around it among the ids that belong to the same root
+        as its parent. In each search step the blocks of all boxes are
+        downloaded once and the roots of all candidates are read at once.
 
-        checked = []
-        atomic_id = None
-        root_id = self.get_root(parent_id)
+        :param coordinates: n x 3 voxel coordinates (at mip 0 in x and y)
+        :param parent_ids: n uint64 or None
+        :param n_tries: int
+        :return: n uint64, 0 where no atomic id was found
+        """
+        coordinates = np.array(coordinates, dtype=np.float64).reshape(-1, 3)
+        coordinates[:, :2] /= 2 ** self.cv_mip
+        coordinates = coordinates.astype(np.int64)
+
+        ws_cache = self.get_ws_block_cache()
+        atomic_ids = np.zeros(len(coordinates), dtype=basetypes.NODE_ID)
+
+        if parent_ids is None:
+            bboxes = [(c, c + 1) for c in coordinates]
+            ws_cache.prefetch(bboxes)
+            for i_coord, (start, end) in enumerate(bboxes):
+                seg = ws_cache.cutout(start, end)
+                # outside of the volume
+                if seg.size > 0:
+                    atomic_ids[i_coord] = seg.flat[0]
+            return atomic_ids
+
+        parent_ids = np.array(parent_ids, dtype=basetypes.NODE_ID)
+        is_atomic = self.get_chunk_layers(parent_ids) == 1
+        atomic_ids[is_atomic] = parent_ids[is_atomic]
+
+        unresolved = np.where(~is_atomic)[0]
+        if len(unresolved) == 0:
+            return atomic_ids
+
+        root_ids = np.zeros(len(coordinates), dtype=basetypes.NODE_ID)
+        root_ids[unresolved] = self.get_roots(parent_ids[unresolved])
+        checked = collections.defaultdict(list)
 
         for i_try in range(n_tries):
-
-            # Define block size -- increase by one each try
-            x_l = x - (i_try - 1)**2
-            y_l = y - (i_try - 1)**2
-            z_l = z - (i_try - 1)**2
-
-            x_h = x + 1 + (i_try - 1)**2
-            y_h = y + 1 + (i_try - 1)**2
-            z_h = z + 1 + (i_try - 1)**2
-
-            if x_l < 0:
-                x_l = 0
-
-            if y_l < 0:
-                y_l = 0
-
-            if z_l < 0:
-                z_l = 0
-
-            # Get atomic ids from cloudvolume
-            atomic_id_block = self.cv[x_l: x_h, y_l: y_h, z_l: z_h]
-            atomic_ids, atomic_id_count = np.unique(atomic_id_block,
-                                                    return_counts=True)
-
-            # sort by frequency and discard those ids that have been checked
-            # previously
-            sorted_atomic_ids = atomic_ids[np.argsort(atomic_id_count)]
-            sorted_atomic_ids = sorted_atomic_ids[~np.in1d(sorted_atomic_ids,
-                                                           checked)]
-
-            # For each candidate id check whether its root id corresponds to the
-            # given root id
-            for candidate_atomic_id in sorted_atomic_ids:
-                ass_root_id = self.get_root(candidate_atomic_id)
-
-                if ass_root_id == root_id:
-                    # atomic_id is not None will be our indicator that the
-                    # search was successful
-
-                    atomic_id = candidate_atomic_id
-                    break
+            # Define block size -- increase each try
+            radius = (i_try - 1) ** 2
+            bboxes = [(np.maximum(coordinates[i_coord] - radius, 0),
+                       coordinates[i_coord] + 1 + radius)
+                      for i_coord in unresolved]
+            ws_cache.prefetch(bboxes)
+
+            # Candidates of each coordinate sorted by frequency, without
+            # those that have been checked previously
+            candidates_d = {}
+            for i_coord, (start, end) in zip(unresolved, bboxes):
+                ids, counts = np.unique(ws_cache.cutout(start, end),
+                                        return_counts=True)
+                ids = ids[np.argsort(counts)]
+                ids = ids[(ids != 0) & ~np.in1d(ids, checked[i_coord])]
+                candidates_d[i_coord] = ids.astype(basetypes.NODE_ID)
+
+            all_candidates = np.unique(np.concatenate(
+                [np.array([], dtype=basetypes.NODE_ID)] + list(candidates_d.values())))
+            if len(all_candidates) == 0:
+                continue
+            candidate_roots = self.get_roots(all_candidates)
+
+            for i_coord, ids in candidates_d.items():
+                roots = candidate_roots[np.searchsorted(all_candidates, ids)]
+                is_match = roots == root_ids[i_coord]
+                if np.any(is_match):
+                    atomic_ids[i_coord] = ids[np.argmax(is_match)]
                 else:
-                    checked.append(candidate_atomic_id)
+                    checked[i_coord].extend(ids)
 
-            if atomic_id is not None:
+            unresolved = unresolved[atomic_ids[unresolved] == 0]
+            if len(unresolved) == 0:
                 break
 
-        # Returns None if unsuccessful
-        return atomic_id
+        return atomic_ids
 
     def read_log_row(
         self, operation_id: np.uint64
@@ -1734,175 +1820,73 @@ class ChunkedGraph(object):
 
         time_dict = collections.defaultdict(list)
 
+        # Group partners of all nodes with one sort instead of per node masks
         time_start_1 = time.time()
-        sparse_indices = {}
-        remapping = {}
-        for k in edge_id_dict.keys():
-            # Circumvent datatype issues
+        node_partners, node_affs, node_areas, node_n_connected = \
+            group_atomic_edges_by_node(chunk_node_ids, edge_id_dict,
+                                       edge_aff_dict, edge_area_dict)
+        time_dict["grouping_edges"].append(time.time() - time_start_1)
 
-            u_ids, inv_ids = np.unique(edge_id_dict[k], return_inverse=True)
-            mapped_ids = np.arange(len(u_ids), dtype=np.int32)
-            remapped_arr = mapped_ids[inv_ids].reshape(edge_id_dict[k].shape)
+        # Assign cross edges (first node in this chunk) to their component
+        time_start_1 = time.time()
+        node_cc_ids = np.empty(len(chunk_node_ids), dtype=np.int64)
+        for i_cc, cc in enumerate(ccs):
+            node_cc_ids[np.searchsorted(chunk_node_ids,
+                                        unique_graph_ids[cc])] = i_cc
 
-            sparse_indices[k] = compute_indices_pandas(remapped_arr)
-            remapping[k] = dict(zip(u_ids, mapped_ids))
+        cross_edges = np.concatenate([
+            edge_id_dict["between_connected"].reshape(-1, 2),
+            edge_id_dict["cross"].reshape(-1, 2)]).astype(np.uint64)
+        cross_edge_cc_ids = node_cc_ids[np.searchsorted(chunk_node_ids,
+                                                        cross_edges[:, 0])]
+        cross_edge_layers = self.get_cross_chunk_edges_layer(cross_edges)
 
-        time_dict["sparse_indices"].append(time.time() - time_start_1)
+        cc_cross_edges = group_by_index(cross_edges, cross_edge_cc_ids, n_ccs)
+        cc_cross_edge_layers = group_by_index(np.asarray(cross_edge_layers),
+                                              cross_edge_cc_ids, n_ccs)
+        time_dict["grouping_cross_edges"].append(time.time() - time_start_1)
 
         rows = []
-
+        time_start_1 = time.time()
         for i_cc, cc in enumerate(ccs):
             node_ids = unique_graph_ids[cc]
-
-            u_chunk_ids = np.unique([self.get_chunk_id(n) for n in node_ids])
-
-            if len(u_chunk_ids) > 1:
-                self.logger.error(f"Found multiple chunk ids: {u_chunk_ids}")
-                raise Exception()
-
-            # Create parent id
             parent_id = parent_ids[i_cc]
 
-            parent_cross_edges = np.array([], dtype=np.uint64).reshape(0, 2)
-
-            # Add rows for nodes that are in this chunk
-            for i_node_id, node_id in enumerate(node_ids):
-                # Extract edges relevant to this node
-
-                # in chunk + connected
-                time_start_2 = time.time()
-                if node_id in remapping["in_connected"]:
-                    row_ids, column_ids = sparse_indices["in_connected"][remapping["in_connected"][node_id]]
-
-                    inv_column_ids = (column_ids + 1) % 2
-
-                    connected_ids = edge_id_dict["in_connected"][row_ids, inv_column_ids]
-                    connected_affs = edge_aff_dict["in_connected"][row_ids]
-                    connected_areas = edge_area_dict["in_connected"][row_ids]
-                    time_dict["in_connected"].append(time.time() - time_start_2)
-                    time_start_2 = time.time()
-                else:
-                    connected_ids = np.array([], dtype=np.uint64)
-                    connected_affs = np.array([], dtype=np.float32)
-                    connected_areas = np.array([], dtype=np.uint64)
-
-                # in chunk + disconnected
-                if node_id in remapping["in_disconnected"]:
-                    row_ids, column_ids = sparse_indices["in_disconnected"][remapping["in_disconnected"][node_id]]
-                    inv_column_ids = (column_ids + 1) % 2
-
-                    disconnected_ids = edge_id_dict["in_disconnected"][row_ids, inv_column_ids]
-                    disconnected_affs = edge_aff_dict["in_disconnected"][row_ids]
-                    disconnected_areas = edge_area_dict["in_disconnected"][row_ids]
-                    time_dict["in_disconnected"].append(time.time() - time_start_2)
-                    time_start_2 = time.time()
-                else:
-                    disconnected_ids = np.array([], dtype=np.uint64)
-                    disconnected_affs = np.array([], dtype=np.float32)
-                    disconnected_areas = np.array([], dtype=np.uint64)
-
-                # out chunk + connected
-                if node_id in remapping["between_connected"]:
-                    row_ids, column_ids = sparse_indices["between_connected"][remapping["between_connected"][node_id]]
-
-                    row_ids = row_ids[column_ids == 0]
-                    column_ids = column_ids[column_ids == 0]
-                    inv_column_ids = (column_ids + 1) % 2
-                    time_dict["out_connected_mask"].append(time.time() - time_start_2)
-                    time_start_2 = time.time()
-
-                    connected_ids = np.concatenate([connected_ids, edge_id_dict["between_connected"][row_ids, inv_column_ids]])
-                    connected_affs = np.concatenate([connected_affs, edge_aff_dict["between_connected"][row_ids]])
-                    connected_areas = np.concatenate([connected_areas, edge_area_dict["between_connected"][row_ids]])
-
-                    parent_cross_edges = np.concatenate([parent_cross_edges, edge_id_dict["between_connected"][row_ids]])
-
-                    time_dict["out_connected"].append(time.time() - time_start_2)
-                    time_start_2 = time.time()
-
-                # out chunk + disconnected
-                if node_id in remapping["between_disconnected"]:
-                    row_ids, column_ids = sparse_indices["between_disconnected"][remapping["between_disconnected"][node_id]]
-
-                    row_ids = row_ids[column_ids == 0]
-                    column_ids = column_ids[column_ids == 0]
-                    inv_column_ids = (column_ids + 1) % 2
-                    time_dict["out_disconnected_mask"].append(time.time() - time_start_2)
-                    time_start_2 = time.time()
-
-                    disconnected_ids = np.concatenate([disconnected_ids, edge_id_dict["between_disconnected"][row_ids, inv_column_ids]])
-                    disconnected_affs = np.concatenate([disconnected_affs, edge_aff_dict["between_disconnected"][row_ids]])
-                    disconnected_areas = np.concatenate([disconnected_areas, edge_area_dict["between_disconnected"][row_ids]])
-
-                    time_dict["out_disconnected"].append(time.time() - time_start_2)
-                    time_start_2 = time.time()
-
-                # cross
-                if node_id in remapping["cross"]:
-                    row_ids, column_ids = sparse_indices["cross"][remapping["cross"][node_id]]
-
-                    row_ids = row_ids[column_ids == 0]
-                    column_ids = column_ids[column_ids == 0]
-                    inv_column_ids = (column_ids + 1) % 2
-                    time_dict["cross_mask"].append(time.time() - time_start_2)
-                    time_start_2 = time.time()
-
-                    connected_ids = np.concatenate([connected_ids, edge_id_dict["cross"][row_ids, inv_column_ids]])
-                    connected_affs = np.concatenate([connected_affs, np.full((len(row_ids)), np.inf, dtype=np.float32)])
-                    connected_areas = np.concatenate([connected_areas, np.ones((len(row_ids)), dtype=np.uint64)])
-
-                    parent_cross_edges = np.concatenate([parent_cross_edges, edge_id_dict["cross"][row_ids]])
-                    time_dict["cross"].append(time.time() - time_start_2)
-                    time_start_2 = time.time()
-
-                # Create node
-                partners = np.concatenate([connected_ids, disconnected_ids])
-                affinities = np.concatenate([connected_affs, disconnected_affs])
-                areas = np.concatenate([connected_areas, disconnected_areas])
-                connected = np.arange(len(connected_ids), dtype=np.int)
-
-                val_dict = {column_keys.Connectivity.Partner: partners,
-                            column_keys.Connectivity.Affinity: affinities,
-                            column_keys.Connectivity.Area: areas,
-                            column_keys.Connectivity.Connected: connected,
+            for node_id, i_node in zip(node_ids,
+                                       np.searchsorted(chunk_node_ids, node_ids)):
+                val_dict = {column_keys.Connectivity.Partner: node_partners[i_node],
+                            column_keys.Connectivity.Affinity: node_affs[i_node],
+                            column_keys.Connectivity.Area: node_areas[i_node],
+                            column_keys.Connectivity.Connected:
+                                np.arange(node_n_connected[i_node], dtype=int),
                             column_keys.Hierarchy.Parent: parent_id}
 
                 rows.append(self.mutate_row(serializers.serialize_uint64(node_id),
                                             val_dict, time_stamp=time_stamp))
                 node_c += 1
-                time_dict["creating_lv1_row"].append(time.time() - time_start_2)
 
-            time_start_1 = time.time()
             # Create parent node
-            rows.append(self.mutate_row(serializers.serialize_uint64(parent_id),
-                                        {column_keys.Hierarchy.Child: node_ids},
-                                        time_stamp=time_stamp))
-
-            time_dict["creating_lv2_row"].append(time.time() - time_start_1)
-            time_start_1 = time.time()
-
-            cce_layers = self.get_cross_chunk_edges_layer(parent_cross_edges)
-            u_cce_layers = np.unique(cce_layers)
+            val_dict = {column_keys.Hierarchy.Child: node_ids}
 
-            val_dict = {}
-            for cc_layer in u_cce_layers:
-                layer_cross_edges = parent_cross_edges[cce_layers == cc_layer]
-
-                if len(layer_cross_edges) > 0:
-                    val_dict[column_keys.Connectivity.CrossChunkEdge[cc_layer]] = \
-                        layer_cross_edges
+            parent_cross_edges = cc_cross_edges[i_cc]
+            cce_layers = cc_cross_edge_layers[i_cc]
+            for cc_layer in np.unique(cce_layers):
+                val_dict[column_keys.Connectivity.CrossChunkEdge[cc_layer]] = \
+                    parent_cross_edges[cce_layers == cc_layer]
 
-            if len(val_dict) > 0:
-                rows.append(self.mutate_row(serializers.serialize_uint64(parent_id),
-                                            val_dict, time_stamp=time_stamp))
+            rows.append(self.mutate_row(serializers.serialize_uint64(parent_id),
+                                        val_dict, time_stamp=time_stamp))
             node_c += 1
 
-            time_dict["adding_cross_edges"].append(time.time() - time_start_1)
-
             if len(rows) > 100000:
+                time_dict["creating_rows"].append(time.time() - time_start_1)
                 time_start_1 = time.time()
                 self.bulk_write(rows)
+                rows = []
                 time_dict["writing"].append(time.time() - time_start_1)
+                time_start_1 = time.time()
+
+        time_dict["creating_rows"].append(time.time() - time_start_1)
 
         if len(rows) > 0:
             time_start_1 = time.time()
@@ -1978,60 +1962,31 @@ class ChunkedGraph(object):
             row_ids = row_ids[sorting]
             max_child_ids = max_child_ids[sorting]
 
-            counter = collections.defaultdict(int)
-            max_child_ids_occ_so_far = np.zeros(len(max_child_ids),
-                                                dtype=np.int)
-            for i_row in range(len(max_child_ids)):
-                max_child_ids_occ_so_far[i_row] = counter[max_child_ids[i_row]]
-                counter[max_child_ids[i_row]] += 1
-
-            # Filter last occurences (we inverted the list) of each node
-            m = max_child_ids_occ_so_far == 0
-            row_ids = row_ids[m]
+            # Keep first occurences (we inverted the list) of each node
+            _, first_occ = np.unique(max_child_ids, return_index=True)
+            row_ids = row_ids[np.sort(first_occ)]
             ll_node_ids.extend(row_ids)
 
-            # Loop through nodes from this chunk
+            # Collect cross chunk edges of nodes from this chunk with the
+            # node id of each edge, appended together since the threads
+            # share the lists
             for row_id in row_ids:
-                if row_id in row_cell_dict:
-                    cross_edge_dict[row_id] = {}
-
-                    cell_family = row_cell_dict[row_id]
-
-                    for l in range(layer_id - 1, self.n_layers):
-                        row_key = column_keys.Connectivity.CrossChunkEdge[l]
-                        if row_key in cell_family:
-                            cross_edge_dict[row_id][l] = cell_family[row_key][0].value
-
-                    if int(layer_id - 1) in cross_edge_dict[row_id]:
-                        atomic_cross_edges = cross_edge_dict[row_id][layer_id - 1]
-
-                        if len(atomic_cross_edges) > 0:
-                            atomic_partner_id_dict[row_id] = \
-                                atomic_cross_edges[:, 1]
-
-                            new_pairs = zip(atomic_cross_edges[:, 0],
-                                            [row_id] * len(atomic_cross_edges))
-                            atomic_child_id_dict_pairs.extend(new_pairs)
-
-        def _resolve_cross_chunk_edges_thread(args) -> None:
-            start, end = args
-
-            for i_child_key, child_key in\
-                    enumerate(atomic_partner_id_dict_keys[start: end]):
-                this_atomic_partner_ids = atomic_partner_id_dict[child_key]
-
-                partners = {atomic_child_id_dict[atomic_cross_id]
-                            for atomic_cross_id in this_atomic_partner_ids
-                            if atomic_child_id_dict[atomic_cross_id] != 0}
+                if not row_id in row_cell_dict:
+                    continue
 
-                if len(partners) > 0:
-                    partners = np.array(list(partners), dtype=np.uint64)[:, None]
+                cell_family = row_cell_dict[row_id]
+                for l in range(layer_id - 1, self.n_layers):
+                    row_key = column_keys.Connectivity.CrossChunkEdge[l]
+                    if not row_key in cell_family:
+                        continue
 
-                    this_ids = np.array([child_key] * len(partners),
-                                        dtype=np.uint64)[:, None]
-                    these_edges = np.concatenate([this_ids, partners], axis=1)
+                    layer_cross_edges = cell_family[row_key][0].value
+                    if len(layer_cross_edges) == 0:
+                        continue
 
-                    edge_ids.extend(these_edges)
+                    cross_edges_d[l].append(
+                        (layer_cross_edges,
+                         np.full(len(layer_cross_edges), row_id, dtype=np.uint64)))
 
         def _write_out_connected_components(args) -> None:
             start, end = args
@@ -2039,19 +1994,11 @@ class ChunkedGraph(object):
             # Collect cc info
             parent_layer_ids = range(layer_id, self.n_layers + 1)
             cc_connections = {l: [] for l in parent_layer_ids}
-            for i_cc, cc in enumerate(ccs[start: end]):
-                node_ids = unique_graph_ids[cc]
-
-                parent_cross_edges = collections.defaultdict(list)
+            for i_cc in range(start, end):
+                node_ids = unique_graph_ids[ccs[i_cc]]
 
-                # Collect row info for nodes that are in this chunk
-                for node_id in node_ids:
-                    if node_id in cross_edge_dict:
-                        # Extract edges relevant to this node
-                        for l in range(layer_id, self.n_layers):
-                            if l in cross_edge_dict[node_id] and \
-                                    len(cross_edge_dict[node_id][l]) > 0:
-                                parent_cross_edges[l].append(cross_edge_dict[node_id][l])
+                parent_cross_edges = {l: cc_cross_edges_d[l][i_cc]
+                                      for l in cc_cross_edges_d}
 
                 if self.use_skip_connections and len(node_ids) == 1:
                     for l in parent_layer_ids:
@@ -2088,9 +2035,9 @@ class ChunkedGraph(object):
 
                     val_dict = {column_keys.Hierarchy.Child: node_ids}
                     for l in range(parent_layer_id, self.n_layers):
-                        if l in parent_cross_edges and len(parent_cross_edges[l]) > 0:
+                        if len(parent_cross_edges[l]) > 0:
                             val_dict[column_keys.Connectivity.CrossChunkEdge[l]] = \
-                                np.concatenate(parent_cross_edges[l])
+                                parent_cross_edges[l]
 
                     rows.append(
                         self.mutate_row(serializers.serialize_uint64(parent_id),
@@ -2119,9 +2066,7 @@ class ChunkedGraph(object):
 
         time_start = time.time()
 
-        atomic_partner_id_dict = {}
-        cross_edge_dict = {}
-        atomic_child_id_dict_pairs = []
+        cross_edges_d = {l: [] for l in range(layer_id - 1, self.n_layers)}
         ll_node_ids = []
 
         multi_args = child_chunk_coords
@@ -2131,39 +2076,25 @@ class ChunkedGraph(object):
             mu.multithread_func(_read_subchunks_thread, multi_args,
                                 n_threads=n_jobs)
 
-        d = dict(atomic_child_id_dict_pairs)
-        atomic_child_id_dict = collections.defaultdict(np.uint64, d)
         ll_node_ids = np.array(ll_node_ids, dtype=np.uint64)
 
+        cross_edge_node_ids_d = {}
+        for l in range(layer_id - 1, self.n_layers):
+            cross_edge_node_ids_d[l] = np.concatenate(
+                [node_ids for _, node_ids in cross_edges_d[l]] +
+                [np.empty(0, dtype=np.uint64)])
+            cross_edges_d[l] = np.concatenate(
+                [edges for edges, _ in cross_edges_d[l]] +
+                [np.empty((0, 2), dtype=np.uint64)])
+
         if verbose:
             self.logger.debug("Time iterating through subchunks: %.3fs" %
                               (time.time() - time_start))
         time_start = time.time()
 
-        # Extract edges from remaining cross chunk edges
-        # and maintain unused cross chunk edges
-        edge_ids = []
-        # u_atomic_child_ids = np.unique(atomic_child_ids)
-        atomic_partner_id_dict_keys = \
-            np.array(list(atomic_partner_id_dict.keys()), dtype=np.uint64)
-
-        if n_threads > 1:
-            n_jobs = n_threads * 3 # Heuristic
-        else:
-            n_jobs = 1
-
-        n_jobs = np.min([n_jobs, len(atomic_partner_id_dict_keys)])
-
-        if n_jobs > 0:
-            spacing = np.linspace(0, len(atomic_partner_id_dict_keys),
-                                  n_jobs+1).astype(np.int)
-            starts = spacing[:-1]
-            ends = spacing[1:]
-
-            multi_args = list(zip(starts, ends))
-
-            mu.multithread_func(_resolve_cross_chunk_edges_thread, multi_args,
-                                n_threads=n_threads)
+        # Extract edges from cross chunk edges of the layer below
+        edge_ids = resolve_cross_chunk_edges(
+            cross_edges_d[layer_id - 1], cross_edge_node_ids_d[layer_id - 1])
 
         if verbose:
             self.logger.debug("Time resolving cross chunk edges: %.3fs" %
@@ -2182,9 +2113,9 @@ class ChunkedGraph(object):
 
         # Extract connected components
         isolated_node_mask = ~np.in1d(ll_node_ids, np.unique(edge_ids))
-        add_node_ids = ll_node_ids[isolated_node_mask].squeeze()
+        add_node_ids = ll_node_ids[isolated_node_mask]
         add_edge_ids = np.vstack([add_node_ids, add_node_ids]).T
-        edge_ids.extend(add_edge_ids)
+        edge_ids = np.concatenate([edge_ids, add_edge_ids])
 
         graph, _, _, unique_graph_ids = flatgraph_utils.build_gt_graph(
             edge_ids, make_directed=True)
@@ -2196,6 +2127,24 @@ class ChunkedGraph(object):
                               (time.time() - time_start))
         time_start = time.time()
 
+        # Group cross chunk edges of higher layers by connected component
+        node_cc_ids = np.empty(len(unique_graph_ids), dtype=np.int64)
+        for i_cc, cc in enumerate(ccs):
+            node_cc_ids[cc] = i_cc
+
+        cc_cross_edges_d = {}
+        for l in range(layer_id, self.n_layers):
+            cc_cross_edges_d[l] = group_by_index(
+                cross_edges_d[l],
+                node_cc_ids[np.searchsorted(unique_graph_ids,
+                                            cross_edge_node_ids_d[l])],
+                len(ccs))
+
+        if verbose:
+            self.logger.debug("Time grouping cross chunk edges: %.3fs" %
+                              (time.time() - time_start))
+        time_start = time.time()
+
         # Add rows for nodes that are in this chunk
         # a connected component at a time
         if n_threads > 1:
@@ -3307,6 +3256,269 @@ class ChunkedGraph(object):
         else:
             return nodes_per_layer
 
+    def get_leaves_multiple(self, root_ids: Sequence[np.uint64],
+                            bounding_box: Optional[Sequence[Sequence[int]]] = None,
+                            bb_is_coordinate: bool = False,
+                            time_stamp: Optional[datetime.datetime] = None
+                            ) -> Dict[np.uint64, np.ndarray]:
+        """ Atomic IDs of many agglomerations. All agglomerations are
+            descended together, with one (threaded) read per layer.
+
+        :param root_ids: array of np.uint64
+        :param bounding_box: [[x_l, y_l, z_l], [x_h, y_h, z_h]]
+        :param bb_is_coordinate: bool
+        :param time_stamp: None or datetime, hierarchy as of this time
+        :return: dict root id -> np.array of atomic IDs
+        """
+
+        def _read_children(node_ids):
+            return self.read_node_id_rows(node_ids=node_ids,
+                                          columns=column_keys.Hierarchy.Child,
+                                          end_time=time_stamp,
+                                          end_time_inclusive=True)
+
+        if time_stamp is not None and time_stamp.tzinfo is None:
+            time_stamp = UTC.localize(time_stamp)
+
+        bounding_box = self.normalize_bounding_box(bounding_box,
+                                                   bb_is_coordinate)
+        root_ids = np.unique(np.array(root_ids, dtype=np.uint64))
+        if len(root_ids) == 0:
+            return {}
+
+        node_ids = root_ids
+        owners = np.arange(len(root_ids))
+        leaf_ids, leaf_owners = [], []
+        while len(node_ids) > 0:
+            layer_m = self.get_chunk_layers(node_ids) == 1
+            leaf_ids.append(node_ids[layer_m])
+            leaf_owners.append(owners[layer_m])
+            node_ids, owners = node_ids[~layer_m], owners[~layer_m]
+            if len(node_ids) == 0:
+                break
+
+            # Agglomerations of different times can share nodes
+            u_node_ids, inverse = np.unique(node_ids, return_inverse=True)
+
+            # Use heuristic to guess the optimal number of threads
+            this_n_threads = np.min([int(len(u_node_ids) // 50000) + 1, mu.n_cpus])
+            children_d = {}
+            for row_dict in mu.multithread_func(
+                    _read_children, np.array_split(u_node_ids, this_n_threads),
+                    n_threads=this_n_threads, debug=this_n_threads == 1):
+                children_d.update(row_dict)
+
+            children = [children_d[node_id][0].value if node_id in children_d
+                        else np.empty(0, dtype=basetypes.NODE_ID)
+                        for node_id in u_node_ids]
+            counts = np.array([len(c) for c in children], dtype=np.int64)
+            flat_children = np.concatenate(children) if children \
+                else np.empty(0, dtype=basetypes.NODE_ID)
+            starts = np.cumsum(counts) - counts
+
+            # children of every (node, owner) pair
+            node_counts = counts[inverse]
+            node_starts = np.repeat(starts[inverse], node_counts)
+            offsets = np.arange(node_counts.sum()) - \
+                np.repeat(np.cumsum(node_counts) - node_counts, node_counts)
+            child_ids = flat_children[node_starts + offsets].astype(np.uint64)
+            child_owners = np.repeat(owners, node_counts)
+
+            if bounding_box is not None and len(child_ids) > 0:
+                child_layers = (child_ids >> np.uint64(
+                    64 - self._n_bits_for_layer_id)).astype(np.int64)
+
+                # as in get_subgraph_nodes, atomic ids are not filtered
+                bound_check_mask = np.ones(len(child_ids), dtype=bool)
+                higher_m = child_layers > 1
+                chunk_coordinates = self._get_chunk_coordinates_multiple(
+                    child_ids[higher_m], child_layers[higher_m])
+                bounding_box_layer = bounding_box[None] / \
+                    (self.fan_out ** (child_layers[higher_m] - 2))[:, None, None]
+
+                bound_check_mask[higher_m] = np.all(
+                    [np.all(chunk_coordinates < bounding_box_layer[:, 1], axis=1),
+                     np.all(chunk_coordinates + 1 > bounding_box_layer[:, 0], axis=1)],
+                    axis=0)
+                child_ids = child_ids[bound_check_mask]
+                child_owners = child_owners[bound_check_mask]
+
+            node_ids, owners = child_ids, child_owners
+
+        leaf_ids = np.concatenate(leaf_ids)
+        leaf_owners = np.concatenate(leaf_owners)
+        sorting = np.argsort(leaf_owners, kind="stable")
+        leaf_ids, leaf_owners = leaf_ids[sorting], leaf_owners[sorting]
+        splits = np.searchsorted(leaf_owners, np.arange(1, len(root_ids)))
+        return dict(zip(root_ids, np.split(leaf_ids, splits)))
+
+    def _get_chunk_coordinate_keys(self, node_ids: Sequence[np.uint64],
+                                   layer: int) -> np.ndarray:
+        """ Packs the chunk coordinates of node ids from a single layer into
+            one integer per node. Layer 1 and 2 nodes at the same position
+            get the same key.
+
+        :param node_ids: np.ndarray
+        :param layer: int
+        :return: np.ndarray of np.uint64
+        """
+        coordinates = self._get_chunk_coordinates_multiple(
+            node_ids, np.full(len(node_ids), layer)).astype(np.uint64)
+        keys = np.zeros(len(coordinates), dtype=np.uint64)
+        for i_dim in range(3):
+            keys |= coordinates[:, i_dim] << np.uint64(40 - 20 * i_dim)
+        return keys
+
+    def _get_chunk_coordinates_multiple(self, node_ids: Sequence[np.uint64],
+                                        layers: Sequence[int]) -> np.ndarray:
+        """ Vectorized get_chunk_coordinates for node ids of any layer
+
+        :param node_ids: np.ndarray
+        :param layers: np.ndarray, layer of each node id
+        :return: np.ndarray of shape (n, 3)
+        """
+        node_ids = np.asarray(node_ids, dtype=np.uint64)
+        coordinates = np.zeros((len(node_ids), 3), dtype=np.int64)
+        for layer in np.unique(layers):
+            layer_m = layers == layer
+            bits_per_dim = self.bitmasks[int(layer)]
+            x_offset = 64 - self._n_bits_for_layer_id - bits_per_dim
+            mask = np.uint64(2 ** bits_per_dim - 1)
+            for i_dim in range(3):
+                offset = np.uint64(x_offset - i_dim * bits_per_dim)
+                coordinates[layer_m, i_dim] = (node_ids[layer_m] >> offset) & mask
+        return coordinates
+
+    def _get_subgraph_l2_batches(self, agglomeration_id: np.uint64,
+                                 bounding_box: Optional[Sequence[Sequence[int]]],
+                                 batch_size: int,
+                                 verbose: bool) -> List[np.ndarray]:
+        """ Layer 2 nodes of an agglomeration, split into batches of whole
+            chunks with about `batch_size` nodes each
+
+        :return: list of np.ndarrays
+        """
+        l2_ids = self._get_subgraph_higher_layer_nodes(
+            node_id=agglomeration_id, bounding_box=bounding_box,
+            return_layers=[2], verbose=verbose)[2]
+
+        # Node ids start with their chunk id; sorting groups them by chunk
+        l2_ids = np.sort(l2_ids)
+        if len(l2_ids) == 0:
+            return []
+
+        _, chunk_starts = np.unique(self.get_chunk_ids_from_node_ids(l2_ids),
+                                    return_index=True)
+        batches = []
+        batch_start = 0
+        for chunk_start in chunk_starts[1:]:
+            if chunk_start - batch_start >= batch_size:
+                batches.append(l2_ids[batch_start: chunk_start])
+                batch_start = chunk_start
+        batches.append(l2_ids[batch_start:])
+        return batches
+
+    @staticmethod
+    def _iter_prefetched(func, batches: Sequence, n_threads: int) -> Iterator:
+        """ Yields func(batch) for all batches in order while the next
+            n_threads batches are processed in the background """
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            futures = collections.deque()
+            for batch in batches:
+                futures.append(executor.submit(func, batch))
+                if len(futures) > n_threads:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+
+    def iter_subgraph_nodes(self, agglomeration_id: np.uint64,
+                            bounding_box: Optional[Sequence[Sequence[int]]] = None,
+                            bb_is_coordinate: bool = False,
+                            batch_size: int = 1000,
+                            n_threads: int = 4,
+                            verbose: bool = False) -> Iterator[np.ndarray]:
+        """ Yields the atomic IDs of an agglomeration batch by batch.
+            Unlike `get_subgraph_nodes`, only a few batches of supervoxels
+            are held in memory at a time.
+
+        :param agglomeration_id: np.uint64
+        :param bounding_box: [[x_l, y_l, z_l], [x_h, y_h, z_h]]
+        :param bb_is_coordinate: bool
+        :param batch_size: number of layer 2 nodes per batch
+        :param n_threads: number of batches read ahead
+        :param verbose: bool
+        :return: iterator of np.ndarrays of np.uint64
+        """
+        bounding_box = self.normalize_bounding_box(bounding_box,
+                                                   bb_is_coordinate)
+        l2_batches = self._get_subgraph_l2_batches(
+            agglomeration_id, bounding_box, batch_size, verbose)
+
+        def _get_batch_children(l2_ids):
+            return self.get_children(l2_ids, flatten=True)
+
+        yield from self._iter_prefetched(_get_batch_children, l2_batches,
+                                         n_threads)
+
+    def iter_subgraph_edges(self, agglomeration_id: np.uint64,
+                            bounding_box: Optional[Sequence[Sequence[int]]] = None,
+                            bb_is_coordinate: bool = False,
+                            batch_size: int = 1000,
+                            n_threads: int = 4,
+                            verbose: bool = False
+                            ) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """ Yields the connected atomic edges of an agglomeration batch by
+            batch, see `get_subgraph_edges`. Every edge is yielded once.
+
+        :param agglomeration_id: np.uint64
+        :param bounding_box: [[x_l, y_l, z_l], [x_h, y_h, z_h]]
+        :param bb_is_coordinate: bool
+        :param batch_size: number of layer 2 nodes per batch
+        :param n_threads: number of batches read ahead
+        :param verbose: bool
+        :return: iterator of (edges, affinities, areas)
+        """
+        time_stamp = self.read_node_id_row(agglomeration_id,
+                                           columns=column_keys.Hierarchy.Child)[0].timestamp
+
+        bounding_box = self.normalize_bounding_box(bounding_box,
+                                                   bb_is_coordinate)
+        l2_batches = self._get_subgraph_l2_batches(
+            agglomeration_id, bounding_box, batch_size, verbose)
+
+        # Edges between batches are read by both; they are only yielded with
+        # the first batch, which is determined by the chunk of the partner
+        chunk_keys, chunk_batch_ids = [], []
+        for i_batch, l2_ids in enumerate(l2_batches):
+            keys = np.unique(self._get_chunk_coordinate_keys(l2_ids, 2))
+            chunk_keys.append(keys)
+            chunk_batch_ids.append(np.full(len(keys), i_batch))
+        if len(l2_batches) > 0:
+            chunk_keys = np.concatenate(chunk_keys)
+            chunk_batch_ids = np.concatenate(chunk_batch_ids)
+            sorting = np.argsort(chunk_keys)
+            chunk_keys = chunk_keys[sorting]
+            chunk_batch_ids = chunk_batch_ids[sorting]
+
+        def _get_batch_edges(l2_ids):
+            return self.get_subgraph_chunk(l2_ids, connected_edges=True,
+                                           time_stamp=time_stamp)
+
+        edge_infos = self._iter_prefetched(_get_batch_edges, l2_batches,
+                                           n_threads)
+        for i_batch, (edges, affinities, areas) in enumerate(edge_infos):
+            if len(edges) > 0:
+                keys = self._get_chunk_coordinate_keys(edges.ravel(), 1)
+                idx = np.minimum(np.searchsorted(chunk_keys, keys),
+                                 len(chunk_keys) - 1)
+                # partners outside of the agglomeration's chunks
+                batch_ids = np.where(chunk_keys[idx] == keys,
+                                     chunk_batch_ids[idx], len(l2_batches))
+                batch_ids = batch_ids.reshape(-1, 2)
+                m = np.all(batch_ids >= i_batch, axis=1)
+                edges, affinities, areas = edges[m], affinities[m], areas[m]
+            yield edges, affinities, areas
+
     def flatten_row_dict(self, row_dict: Dict[column_keys._Column,
                                               List[bigtable.row_data.Cell]]) -> Dict:
         """ Flattens multiple entries to columns by appending them
@@ -3888,12 +4100,7 @@ class ChunkedGraph(object):
         """
         chunk_start = self.get_chunk_voxel_location(chunk_coordinate)
         chunk_end = self.get_chunk_voxel_location(chunk_coordinate + 1)
-        ws_seg = self.cv[
-            chunk_start[0] : chunk_end[0],
-            chunk_start[1] : chunk_end[1],
-            chunk_start[2] : chunk_end[2],
-        ].squeeze()
-        return ws_seg
+        return self.get_ws_block_cache().cutout(chunk_start, chunk_end)
 
     def get_proofread_root_ids(self,            
                                start_time: Optional[datetime.datetime] = None,
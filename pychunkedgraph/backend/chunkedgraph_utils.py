@@ -1,5 +1,9 @@
+import os
+import time
+import pickle
 import datetime
-from typing import Dict, Iterable, Optional, Union
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional, Union
 
 import numpy as np
 import pandas as pd
@@ -26,6 +30,119 @@ def compute_indices_pandas(data) -> pd.Series:
     return pd.Series(d).groupby(d).apply(f)
 
 
+def group_atomic_edges_by_node(node_ids: np.ndarray, edge_id_dict: Dict,
+                               edge_aff_dict: Dict, edge_area_dict: Dict):
+    """ Groups partners, affinities and areas of all edges by node
+
+    Edges of all types are concatenated into one directed edge list, sorted
+    once by their source node (stable) and split at node boundaries. Within
+    a node the partners are ordered "in_connected", "between_connected",
+    "cross", "in_disconnected", "between_disconnected". "in" edges are
+    used in both directions, all other edges only from their first node.
+
+    :param node_ids: np.ndarray
+        sorted, unique ids of all nodes that are a source of any edge
+    :param edge_id_dict: dict
+    :param edge_aff_dict: dict
+    :param edge_area_dict: dict
+    :return: partners, affinities, areas (lists of arrays aligned with
+        node_ids) and an array with the number of connected partners
+    """
+    sources, partners, affinities, areas, connected = [], [], [], [], []
+
+    def _add(edges, affs, edge_areas, is_connected, both_directions):
+        edges = edges.reshape(-1, 2)
+        if both_directions:
+            # row major order keeps the order of edges within a node
+            sources.append(edges.ravel())
+            partners.append(edges[:, ::-1].ravel())
+            affs = np.repeat(affs, 2)
+            edge_areas = np.repeat(edge_areas, 2)
+        else:
+            sources.append(edges[:, 0])
+            partners.append(edges[:, 1])
+        affinities.append(np.asarray(affs, dtype=np.float32))
+        areas.append(np.asarray(edge_areas, dtype=np.uint64))
+        connected.append(np.full(len(affs), is_connected, dtype=bool))
+
+    n_cross = len(edge_id_dict["cross"])
+    _add(edge_id_dict["in_connected"], edge_aff_dict["in_connected"],
+         edge_area_dict["in_connected"], True, True)
+    _add(edge_id_dict["between_connected"], edge_aff_dict["between_connected"],
+         edge_area_dict["between_connected"], True, False)
+    _add(edge_id_dict["cross"], np.full(n_cross, np.inf, dtype=np.float32),
+         np.ones(n_cross, dtype=np.uint64), True, False)
+    _add(edge_id_dict["in_disconnected"], edge_aff_dict["in_disconnected"],
+         edge_area_dict["in_disconnected"], False, True)
+    _add(edge_id_dict["between_disconnected"],
+         edge_aff_dict["between_disconnected"],
+         edge_area_dict["between_disconnected"], False, False)
+
+    sources = np.concatenate(sources).astype(np.uint64, copy=False)
+    order = np.argsort(sources, kind="stable")
+    sources = sources[order]
+    partners = np.concatenate(partners).astype(np.uint64, copy=False)[order]
+    affinities = np.concatenate(affinities)[order]
+    areas = np.concatenate(areas)[order]
+    connected = np.concatenate(connected)[order]
+
+    starts = np.searchsorted(sources, node_ids, side="left")
+    ends = np.searchsorted(sources, node_ids, side="right")
+    connected_cumsum = np.concatenate([[0], np.cumsum(connected)])
+    n_connected = connected_cumsum[ends] - connected_cumsum[starts]
+
+    split_ids = starts[1:]
+    return (np.split(partners, split_ids), np.split(affinities, split_ids),
+            np.split(areas, split_ids), n_connected)
+
+
+def group_by_index(values: np.ndarray, index: np.ndarray, n_groups: int
+                   ) -> List[np.ndarray]:
+    """ Splits values into groups with one sort
+
+    :param values: np.ndarray
+    :param index: np.ndarray of ints in [0, n_groups)
+        group of each value (first dimension)
+    :param n_groups: int
+    :return: list of n_groups arrays, order within a group is preserved
+    """
+    order = np.argsort(index, kind="stable")
+    split_ids = np.searchsorted(index[order], np.arange(1, n_groups))
+    return np.split(values[order], split_ids)
+
+
+def resolve_cross_chunk_edges(atomic_cross_edges: np.ndarray,
+                              node_ids: np.ndarray) -> np.ndarray:
+    """ Maps atomic cross chunk edges to edges between their parent nodes
+
+    The parent of an atomic id is looked up in the sorted first column;
+    edges whose second atomic id has no parent among `node_ids` are dropped.
+
+    :param atomic_cross_edges: n x 2 array
+        first column belongs to the node in node_ids at the same position
+    :param node_ids: np.ndarray of length n
+    :return: unique m x 2 array of node ids
+    """
+    if len(atomic_cross_edges) == 0:
+        return np.empty((0, 2), dtype=np.uint64)
+
+    order = np.argsort(atomic_cross_edges[:, 0], kind="stable")
+    sorted_atomic_ids = atomic_cross_edges[order, 0]
+    sorted_node_ids = node_ids[order]
+
+    partner_ids = atomic_cross_edges[:, 1]
+    ids = np.searchsorted(sorted_atomic_ids, partner_ids)
+    ids = np.minimum(ids, len(sorted_atomic_ids) - 1)
+    found = sorted_atomic_ids[ids] == partner_ids
+
+    edges = np.empty((np.sum(found), 2), dtype=np.uint64)
+    edges[:, 0] = node_ids[found]
+    edges[:, 1] = sorted_node_ids[ids[found]]
+
+    edges_flattened_view = edges.view(dtype='u8,u8')
+    return np.unique(edges_flattened_view).view(np.uint64).reshape(-1, 2)
+
+
 def log_n(arr, n):
     """ Computes log to base n
 
@@ -228,4 +345,48 @@ def partial_row_data_to_column_dict(partial_row_data: bigtable.row_data.PartialR
             column = column_keys.from_key(family_id, column_key)
             new_column_dict[column] = column_values
 
-    return new_column_dict
\ No newline at end of file
+    return new_column_dict
+
+
+def write_graph_settings_snapshot(path: str,
+                                  graph_settings: Dict[column_keys._Column, Any]
+                                  ) -> None:
+    """ Stores graph settings in a local file, serialized as in the table.
+        The file is replaced atomically, concurrent readers never see a
+        partial snapshot.
+
+    :param path: str
+    :param graph_settings: dict column -> value, see `ChunkedGraph.graph_settings`
+    """
+    content = {(column.family_id, column.key): column.serialize(value)
+               for column, value in graph_settings.items()}
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(content, f)
+    os.replace(tmp_path, path)
+
+
+def read_graph_settings_snapshot(path: str, max_age: Optional[float] = None
+                                 ) -> Optional[Dict[column_keys._Column, Any]]:
+    """ Reads graph settings written by `write_graph_settings_snapshot`
+
+    :param path: str
+    :param max_age: seconds after which a snapshot is ignored
+    :return: dict column -> value or None if there is no (recent) snapshot
+    """
+    try:
+        if max_age is not None and time.time() - os.path.getmtime(path) > max_age:
+            return None
+        with open(path, "rb") as f:
+            content = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+    graph_settings = {}
+    for (family_id, key), value in content.items():
+        column = column_keys.from_key(family_id, key)
+        graph_settings[column] = column.deserialize(value)
+    return graph_settings
@@ -19,8 +19,17 @@ EDGE_TYPES = EdgeTypes()
 DEFAULT_AFFINITY = np.finfo(np.float32).tiny
 DEFAULT_AREA = np.finfo(np.float32).tiny
 
+PAIR_DTYPE = np.dtype(
+    [("node_id1", basetypes.NODE_ID), ("node_id2", basetypes.NODE_ID)]
+)
+
 
 class Edges:
+    """
+    Edges between supervoxels, stored as one array per attribute.
+    Input arrays that already have the right dtype are used as is (not copied).
+    """
+
     def __init__(
         self,
         node_ids1: np.ndarray,
@@ -29,49 +38,144 @@ class Edges:
         affinities: Optional[np.ndarray] = None,
         areas: Optional[np.ndarray] = None,
     ):
-        self.node_ids1 = np.array(node_ids1, dtype=basetypes.NODE_ID)
-        self.node_ids2 = np.array(node_ids2, dtype=basetypes.NODE_ID)
+        self.node_ids1 = np.asarray(node_ids1, dtype=basetypes.NODE_ID)
+        self.node_ids2 = np.asarray(node_ids2, dtype=basetypes.NODE_ID)
         assert self.node_ids1.size == self.node_ids2.size
         self._as_pairs = None
 
-        self.affinities = np.ones(len(self.node_ids1)) * DEFAULT_AFFINITY
-        if affinities is not None:
-            assert node_ids1.size == affinities.size
-            self.affinities = np.array(affinities, dtype=basetypes.EDGE_AFFINITY)
-
-        self.areas = np.ones(len(self.node_ids1)) * DEFAULT_AREA
-        if areas is not None:
-            assert node_ids1.size == areas.size
-            self.areas = np.array(areas, dtype=basetypes.EDGE_AREA)
+        if affinities is None:
+            self.affinities = np.full(
+                len(self.node_ids1), DEFAULT_AFFINITY, dtype=basetypes.EDGE_AFFINITY
+            )
+        else:
+            self.affinities = np.asarray(affinities, dtype=basetypes.EDGE_AFFINITY)
+            assert self.node_ids1.size == self.affinities.size
+
+        if areas is None:
+            self.areas = np.full(
+                len(self.node_ids1), DEFAULT_AREA, dtype=basetypes.EDGE_AREA
+            )
+        else:
+            self.areas = np.asarray(areas, dtype=basetypes.EDGE_AREA)
+            assert self.node_ids1.size == self.areas.size
+
+    @classmethod
+    def from_pairs(
+        cls,
+        pairs: np.ndarray,
+        *,
+        affinities: Optional[np.ndarray] = None,
+        areas: Optional[np.ndarray] = None,
+    ):
+        """create from an array of shape (n, 2), node ids are views of `pairs`"""
+        pairs = np.asarray(pairs, dtype=basetypes.NODE_ID).reshape(-1, 2)
+        edges = cls(pairs[:, 0], pairs[:, 1], affinities=affinities, areas=areas)
+        edges._as_pairs = pairs
+        return edges
 
     def __add__(self, other):
         """add two Edges instances"""
-        node_ids1 = np.concatenate([self.node_ids1, other.node_ids1])
-        node_ids2 = np.concatenate([self.node_ids2, other.node_ids2])
-        affinities = np.concatenate([self.affinities, other.affinities])
-        areas = np.concatenate([self.areas, other.areas])
-        return Edges(node_ids1, node_ids2, affinities=affinities, areas=areas)
+        builder = EdgesBuilder()
+        builder.add(self)
+        builder.add(other)
+        return builder.build()
 
     def __iadd__(self, other):
         self.node_ids1 = np.concatenate([self.node_ids1, other.node_ids1])
         self.node_ids2 = np.concatenate([self.node_ids2, other.node_ids2])
         self.affinities = np.concatenate([self.affinities, other.affinities])
         self.areas = np.concatenate([self.areas, other.areas])
+        self._as_pairs = None
         return self
 
     def __len__(self):
         return len(self.node_ids1)
 
-    def get_pairs(self) -> np.ndarray:
+    def get_pairs(self, structured: bool = False) -> np.ndarray:
         """
         return numpy array of edge pairs [[sv1, sv2] ... ]
+        `node_ids1` and `node_ids2` become views of this array,
+        so it is only created once.
+        :param structured: return a 1D view with fields "node_id1", "node_id2"
+            instead, for use with row wise functions like np.unique
         """
-        if not self._as_pairs is None:
-            return self._as_pairs
-        self._as_pairs = np.vstack([self.node_ids1, self.node_ids2]).T
+        if self._as_pairs is None:
+            pairs = np.empty((len(self), 2), dtype=basetypes.NODE_ID)
+            pairs[:, 0] = self.node_ids1
+            pairs[:, 1] = self.node_ids2
+            self.node_ids1 = pairs[:, 0]
+            self.node_ids2 = pairs[:, 1]
+            self._as_pairs = pairs
+        if structured:
+            return np.ascontiguousarray(self._as_pairs).view(PAIR_DTYPE).reshape(-1)
         return self._as_pairs
 
 
+class EdgesBuilder:
+    """
+    Collects edges and concatenates them once in `build`,
+    instead of concatenating on every addition.
+    """
+
+    def __init__(self):
+        self._node_ids1 = []
+        self._node_ids2 = []
+        self._affinities = []
+        self._areas = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, edges: Edges) -> None:
+        self.add_arrays(
+            edges.node_ids1,
+            edges.node_ids2,
+            affinities=edges.affinities,
+            areas=edges.areas,
+        )
+
+    def add_arrays(
+        self,
+        node_ids1: np.ndarray,
+        node_ids2: np.ndarray,
+        *,
+        affinities: Optional[np.ndarray] = None,
+        areas: Optional[np.ndarray] = None,
+    ) -> None:
+        """arrays are only referenced, they are copied once in `build`"""
+        size = len(node_ids1)
+        assert len(node_ids2) == size
+        if affinities is None:
+            affinities = np.full(size, DEFAULT_AFFINITY, dtype=basetypes.EDGE_AFFINITY)
+        if areas is None:
+            areas = np.full(size, DEFAULT_AREA, dtype=basetypes.EDGE_AREA)
+        self._node_ids1.append(node_ids1)
+        self._node_ids2.append(node_ids2)
+        self._affinities.append(affinities)
+        self._areas.append(areas)
+        self._size += size
+
+    def build(self) -> Edges:
+        if len(self._node_ids1) == 1:
+            # nothing to concatenate, use arrays as they are
+            return Edges(
+                self._node_ids1[0],
+                self._node_ids2[0],
+                affinities=self._affinities[0],
+                areas=self._areas[0],
+            )
+        pairs = np.empty((self._size, 2), dtype=basetypes.NODE_ID)
+        affinities = np.empty(self._size, dtype=basetypes.EDGE_AFFINITY)
+        areas = np.empty(self._size, dtype=basetypes.EDGE_AREA)
+        if self._size:
+            np.concatenate(self._node_ids1, out=pairs[:, 0], casting="unsafe")
+            np.concatenate(self._node_ids2, out=pairs[:, 1], casting="unsafe")
+            np.concatenate(self._affinities, out=affinities, casting="unsafe")
+            np.concatenate(self._areas, out=areas, casting="unsafe")
+        return Edges.from_pairs(pairs, affinities=affinities, areas=areas)
+
+
 _chunk_edges_defaults = (Edges([], []), Edges([], []), Edges([], []))
 ChunkEdges = namedtuple("ChunkEdges", _edge_type_fileds, defaults=_chunk_edges_defaults)
 
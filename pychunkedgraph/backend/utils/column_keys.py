@@ -133,6 +133,14 @@ class Hierarchy:
         serializer=serializers.NumPyValue(dtype=basetypes.NODE_ID))
 
 
+class Mesh:
+    # mesh path a fragment of the node was written to
+    FragmentPath = _Column(
+        key=b'mesh_fragment_path',
+        family_id='0',
+        serializer=serializers.String('utf-8'))
+
+
 class GraphSettings:
     DatasetInfo = _Column(
         key=b'dataset_info',
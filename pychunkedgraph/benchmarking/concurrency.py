@@ -0,0 +1,146 @@
+"""
+Load test of cooperative (gevent) concurrency in one process
+
+Serves root and leaves lookups of supervoxels, like the `root` and `leaves`
+endpoints, with a pool of greenlets of each given size in a single process.
+Requests/sec, latencies and the peak memory of the process are reported
+for each pool size. Pool size 1 is one request at a time, as served by a
+uwsgi process without gevent.
+
+Run against the bigtable emulator:
+    gcloud beta emulators bigtable start &
+    $(gcloud beta emulators bigtable env-init)
+    python -m pychunkedgraph.benchmarking.ingest /tmp/synthetic --chunks 4 4 2
+    python -m pychunkedgraph.benchmarking.concurrency synthetic_benchmark \\
+        --concurrency 1 8 32
+"""
+
+from pychunkedgraph.utils import cooperative
+
+if __name__ == "__main__":
+    # before grpc is imported
+    cooperative.patch_all()
+
+import sys
+import json
+import time
+import argparse
+import resource
+from typing import Dict, Sequence
+
+import numpy as np
+from gevent.pool import Pool
+from google.auth import credentials
+
+from pychunkedgraph.backend import chunkedgraph
+from pychunkedgraph.backend.utils import column_keys
+
+
+def sample_node_ids(cg, n_node_ids: int = 100) -> np.ndarray:
+    """ Supervoxels of the first layer 2 chunk """
+    rows = cg.range_read_chunk(layer=2, x=0, y=0, z=0, columns=column_keys.Hierarchy.Child)
+    node_ids = [children[0].value for children in rows.values()]
+    node_ids = np.concatenate(node_ids) if node_ids else np.array([], dtype=np.uint64)
+    return node_ids[:n_node_ids]
+
+
+def _request(cg, node_id):
+    root_id = cg.get_root(node_id)
+    leaves = cg.get_subgraph_nodes(root_id, verbose=False)
+    return node_id, root_id, len(leaves)
+
+
+def run_load(cg, node_ids: Sequence[np.uint64], concurrency: int, n_requests: int) -> Dict:
+    """ `n_requests` requests, `concurrency` at a time
+
+    :return: dict of measurements, with the results of all successful requests
+    """
+    request_node_ids = [node_ids[i % len(node_ids)] for i in range(n_requests)]
+    latencies = []
+
+    def _timed_request(node_id):
+        time_start = time.time()
+        try:
+            result = _request(cg, node_id)
+        except Exception as e:
+            print(f"Request for {node_id} failed: {e}", file=sys.stderr)
+            return None
+        latencies.append(time.time() - time_start)
+        return result
+
+    time_start = time.time()
+    results = list(Pool(concurrency).imap_unordered(_timed_request, request_node_ids))
+    dt = time.time() - time_start
+    n_failed = results.count(None)
+    results = [result for result in results if result is not None]
+
+    # kilobytes on linux
+    rss_gb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 ** 2
+    return {
+        "concurrency": concurrency,
+        "n_requests": n_requests,
+        "n_failed": n_failed,
+        "time": dt,
+        "requests_per_sec": n_requests / dt if dt > 0 else 0.0,
+        "latency_median": float(np.median(latencies)) if latencies else 0.0,
+        "latency_p99": float(np.percentile(latencies, 99)) if latencies else 0.0,
+        "peak_rss_gb": rss_gb,
+        "requests_per_sec_per_gb": n_requests / dt / rss_gb if dt > 0 else 0.0,
+        "results": {int(node_id): [int(root_id), n_leaves] for node_id, root_id, n_leaves in results},
+    }
+
+
+def run_load_test(cg, node_ids, concurrencies=(1, 8, 32), n_requests=500) -> Dict[int, Dict]:
+    """ Runs `run_load` for each concurrency and checks all of them return
+        the same results as the first one """
+    measurements = {}
+    for concurrency in concurrencies:
+        measurements[concurrency] = run_load(cg, node_ids, concurrency, n_requests)
+
+    expected = measurements[concurrencies[0]]["results"]
+    for measurement in measurements.values():
+        measurement["correct"] = measurement.pop("results") == expected
+    return measurements
+
+
+def print_results(measurements: Dict[int, Dict]) -> None:
+    header = ["concurrency", "requests/s", "median (s)", "p99 (s)", "peak GB", "req/s/GB",
+              "failed", "correct"]
+    keys = ["concurrency", "requests_per_sec", "latency_median", "latency_p99",
+            "peak_rss_gb", "requests_per_sec_per_gb", "n_failed", "correct"]
+    print(" ".join(f"{h:>12}" for h in header))
+    for _, measurement in sorted(measurements.items()):
+        values = [measurement[key] for key in keys]
+        print(" ".join(
+            f"{v:>12}" if isinstance(v, (int, bool)) else f"{v:>12.3f}" for v in values))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cooperative concurrency load test")
+    parser.add_argument("table_id")
+    parser.add_argument("--instance_id", default="pychunkedgraph")
+    parser.add_argument("--project_id", default="IGNORE_ENVIRONMENT_PROJECT")
+    parser.add_argument("--node_ids", type=int, nargs="*", help="supervoxels to query")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--n_requests", type=int, default=500)
+    parser.add_argument("--json", action="store_true", help="print measurements as json")
+    args = parser.parse_args()
+
+    cg = chunkedgraph.ChunkedGraph(
+        args.table_id,
+        instance_id=args.instance_id,
+        project_id=args.project_id,
+        credentials=credentials.AnonymousCredentials(),
+    )
+    if args.node_ids:
+        node_ids = np.array(args.node_ids, dtype=np.uint64)
+    else:
+        node_ids = sample_node_ids(cg)
+    if len(node_ids) == 0:
+        sys.exit(f"No supervoxels found in {args.table_id}")
+
+    measurements = run_load_test(cg, node_ids, args.concurrency, args.n_requests)
+    if args.json:
+        print(json.dumps(measurements))
+    else:
+        print_results(measurements)
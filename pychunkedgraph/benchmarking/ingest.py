@@ -0,0 +1,317 @@
+"""
+Ingest benchmark on a synthetic dataset
+
+Creates a synthetic watershed + agglomeration dataset (chunk edges and
+components files) on the local filesystem and builds a chunkedgraph from it
+with `create_atomic_chunk_helper` and `create_parent_chunk_helper`.
+Chunks/sec and per stage timings are reported for each layer.
+
+Run against the bigtable emulator:
+    gcloud beta emulators bigtable start &
+    $(gcloud beta emulators bigtable env-init)
+    python -m pychunkedgraph.benchmarking.ingest /tmp/synthetic --chunks 4 4 2
+"""
+
+import time
+import argparse
+import collections
+from contextlib import contextmanager
+from itertools import product
+from typing import Dict, Sequence
+
+import numpy as np
+from cloudvolume import CloudVolume
+
+from pychunkedgraph.backend import DataSource
+from pychunkedgraph.backend import GraphConfig
+from pychunkedgraph.backend import BigTableConfig
+from pychunkedgraph.backend import ChunkedGraphMeta
+from pychunkedgraph.backend import flatgraph_utils
+from pychunkedgraph.backend.edges import Edges
+from pychunkedgraph.backend.edges import EDGE_TYPES
+from pychunkedgraph.backend.chunks.utils import compute_chunk_id
+from pychunkedgraph.backend.chunkedgraph_utils import compute_bitmasks
+from pychunkedgraph.ingest import IngestConfig
+from pychunkedgraph.ingest.types import ChunkTask
+from pychunkedgraph.ingest.manager import IngestionManager
+from pychunkedgraph.ingest import ingestion
+from pychunkedgraph.ingest.ingestion import create_atomic_chunk_helper
+from pychunkedgraph.ingest.ingestion import create_parent_chunk_helper
+from pychunkedgraph.ingest.ingestion_utils import initialize_chunkedgraph
+from pychunkedgraph.io.edges import put_chunk_edges
+from pychunkedgraph.io.components import put_chunk_components
+
+
+STAGES = ("download", "cc", "rows", "writes")
+
+
+def _create_watershed_info(ws_path, chunk_size, chunks_shape, resolution):
+    info = CloudVolume.create_new_info(
+        num_channels=1,
+        layer_type="segmentation",
+        data_type="uint64",
+        encoding="raw",
+        resolution=list(resolution),
+        voxel_offset=[0, 0, 0],
+        chunk_size=[int(s) for s in chunk_size],
+        volume_size=[int(s) for s in np.array(chunk_size) * chunks_shape],
+    )
+    CloudVolume(ws_path, info=info).commit_info()
+
+
+def _get_sv_ids(chunk_coord, n_svs, bits_per_dim):
+    chunk_id = compute_chunk_id(1, *chunk_coord, s_bits_per_dim=bits_per_dim)
+    return chunk_id | np.arange(1, n_svs + 1, dtype=np.uint64)
+
+
+def _random_edges(rng, sv_ids1, sv_ids2, n_edges):
+    edges = np.stack(
+        [rng.choice(sv_ids1, n_edges), rng.choice(sv_ids2, n_edges)], axis=1
+    )
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    return np.unique(edges, axis=0)
+
+
+def create_synthetic_dataset(
+    path: str,
+    chunks_shape: Sequence[int] = (4, 4, 2),
+    chunk_size: Sequence[int] = (256, 256, 512),
+    n_svs: int = 1000,
+    edges_per_sv: float = 3.0,
+    between_fraction: float = 0.1,
+    cross_fraction: float = 0.02,
+    n_segments: int = 200,
+    fanout: int = 2,
+    s_bits_atomic_layer: int = 10,
+    seed: int = 0,
+) -> DataSource:
+    """ Writes a synthetic dataset to the local filesystem
+
+    Each chunk has `n_svs` supervoxels. Every supervoxel is assigned to one
+    of `n_segments` agglomerated segments; edges between supervoxels of the
+    same segment become connected edges.
+
+    :param path: local directory
+    :param chunks_shape: number of atomic chunks in x, y, z
+    :param chunk_size: atomic chunk size in voxels
+    :param n_svs: supervoxels per chunk
+    :param edges_per_sv: in chunk edges per supervoxel
+    :param between_fraction: between chunk edges per face, relative to n_svs
+    :param cross_fraction: cross chunk edges per face, relative to n_svs
+    :return: DataSource
+    """
+    rng = np.random.RandomState(seed)
+    chunks_shape = np.array(chunks_shape, dtype=int)
+    data_source = DataSource(
+        watershed=f"file://{path}/ws",
+        edges=f"file://{path}/edges",
+        components=f"file://{path}/components",
+        data_version=2,
+    )
+    _create_watershed_info(data_source.watershed, chunk_size, chunks_shape, (8, 8, 40))
+
+    graph_config = GraphConfig(
+        chunk_size=np.array(chunk_size), fanout=fanout,
+        s_bits_atomic_layer=s_bits_atomic_layer,
+    )
+    meta = ChunkedGraphMeta(data_source, graph_config, BigTableConfig())
+    bits_per_dim = compute_bitmasks(
+        meta.layer_count, fanout, s_bits_atomic_layer=s_bits_atomic_layer
+    )[1]
+
+    chunk_coords = [np.array(c) for c in product(*[range(s) for s in chunks_shape])]
+    sv_ids_d = {}
+    segments_d = {}
+    for coord in chunk_coords:
+        sv_ids_d[tuple(coord)] = _get_sv_ids(coord, n_svs, bits_per_dim)
+        segments_d[tuple(coord)] = rng.randint(0, n_segments, n_svs)
+
+    edges_d = {tuple(c): collections.defaultdict(list) for c in chunk_coords}
+    for coord in chunk_coords:
+        sv_ids = sv_ids_d[tuple(coord)]
+        edges_d[tuple(coord)][EDGE_TYPES.in_chunk].append(
+            _random_edges(rng, sv_ids, sv_ids, int(n_svs * edges_per_sv))
+        )
+        for dim in range(3):
+            adjacent_coord = coord.copy()
+            adjacent_coord[dim] += 1
+            if adjacent_coord[dim] >= chunks_shape[dim]:
+                continue
+            adjacent_sv_ids = sv_ids_d[tuple(adjacent_coord)]
+            for edge_type, fraction in [
+                (EDGE_TYPES.between_chunk, between_fraction),
+                (EDGE_TYPES.cross_chunk, cross_fraction),
+            ]:
+                edges = _random_edges(
+                    rng, sv_ids, adjacent_sv_ids, max(int(n_svs * fraction), 1)
+                )
+                # first id is always in the chunk of the file
+                edges_d[tuple(coord)][edge_type].append(edges)
+                edges_d[tuple(adjacent_coord)][edge_type].append(edges[:, ::-1])
+
+    for coord in chunk_coords:
+        chunk_edges = {}
+        for edge_type in EDGE_TYPES:
+            edges = np.concatenate(
+                edges_d[tuple(coord)][edge_type] + [np.empty((0, 2), np.uint64)]
+            )
+            affinities = rng.rand(len(edges)).astype(np.float32)
+            if edge_type == EDGE_TYPES.cross_chunk:
+                affinities[:] = np.inf
+            chunk_edges[edge_type] = Edges(
+                edges[:, 0],
+                edges[:, 1],
+                affinities=affinities,
+                areas=rng.randint(1, 1000, len(edges)).astype(np.uint64),
+            )
+        put_chunk_edges(data_source.edges, coord, chunk_edges, 3)
+
+        # components include adjacent chunks to label between chunk edges
+        sv_ids = [sv_ids_d[tuple(coord)]]
+        segments = [segments_d[tuple(coord)]]
+        for d in [-1, 1]:
+            for dim in range(3):
+                adjacent_coord = coord.copy()
+                adjacent_coord[dim] += d
+                if tuple(adjacent_coord) in sv_ids_d:
+                    sv_ids.append(sv_ids_d[tuple(adjacent_coord)])
+                    segments.append(segments_d[tuple(adjacent_coord)])
+        sv_ids = np.concatenate(sv_ids)
+        segments = np.concatenate(segments)
+        order = np.argsort(segments, kind="stable")
+        _, split_ids = np.unique(segments[order], return_index=True)
+        components = np.split(sv_ids[order], split_ids[1:])
+        put_chunk_components(data_source.components, components, coord)
+    return data_source
+
+
+class _StageTimer:
+    """Accumulates time spent in stages of chunk creation."""
+
+    def __init__(self):
+        self.timings = collections.defaultdict(float)
+
+    def wrap(self, stage: str, func: callable) -> callable:
+        def _wrapper(*args, **kwargs):
+            time_start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.timings[stage] += time.time() - time_start
+
+        return _wrapper
+
+    @contextmanager
+    def patch(self, module, name: str, stage: str):
+        """time calls of `module.name` as `stage`"""
+        func = getattr(module, name)
+        setattr(module, name, self.wrap(stage, func))
+        try:
+            yield
+        finally:
+            setattr(module, name, func)
+
+    def pop(self) -> Dict[str, float]:
+        timings = dict(self.timings)
+        self.timings.clear()
+        return timings
+
+
+def run_ingest_benchmark(
+    data_source: DataSource,
+    graph_id: str = "synthetic_benchmark",
+    chunk_size: Sequence[int] = (256, 256, 512),
+    fanout: int = 2,
+    s_bits_atomic_layer: int = 10,
+    project_id: str = "IGNORE_ENVIRONMENT_PROJECT",
+    instance_id: str = "emulated_instance",
+) -> Dict[int, Dict[str, float]]:
+    """ Builds a chunkedgraph layer by layer in this process
+
+    :return: {layer: {"n_chunks", "time", "chunks_per_sec", <stages>}}
+        "cc" is graph building and connected components, "rows" is the
+        time not spent in any other stage, i.e. building rows
+    """
+    graph_config = GraphConfig(
+        graph_id=graph_id,
+        chunk_size=np.array(chunk_size),
+        fanout=fanout,
+        s_bits_atomic_layer=s_bits_atomic_layer,
+        overwrite=True,
+    )
+    bigtable_config = BigTableConfig(project_id=project_id, instance_id=instance_id)
+    meta = ChunkedGraphMeta(data_source, graph_config, bigtable_config)
+    initialize_chunkedgraph(meta)
+    imanager = IngestionManager(IngestConfig(), cg_meta=meta)
+
+    timer = _StageTimer()
+    cg = imanager.cg
+    cg.bulk_write = timer.wrap("writes", cg.bulk_write)
+    cg.range_read_chunk = timer.wrap("download", cg.range_read_chunk)
+
+    atomic_bounds = meta.layer_chunk_bounds[2]
+    tasks = [
+        ChunkTask(meta, np.array(coords, dtype=int))
+        for coords in product(*[range(b) for b in atomic_bounds])
+    ]
+
+    results = {}
+    with timer.patch(ingestion, "_get_atomic_chunk_data", "download"), \
+            timer.patch(flatgraph_utils, "build_gt_graph", "cc"), \
+            timer.patch(flatgraph_utils, "connected_components", "cc"):
+        while tasks:
+            layer = tasks[0].layer
+            time_start = time.time()
+            for task in tasks:
+                if layer == 2:
+                    create_atomic_chunk_helper(task, imanager)
+                else:
+                    create_parent_chunk_helper(task, imanager)
+            dt = time.time() - time_start
+
+            result = {stage: 0.0 for stage in STAGES}
+            result.update(timer.pop())
+            result["rows"] = dt - sum(result[stage] for stage in STAGES if stage != "rows")
+            result["n_chunks"] = len(tasks)
+            result["time"] = dt
+            result["chunks_per_sec"] = len(tasks) / dt if dt > 0 else 0.0
+            results[layer] = result
+
+            parents = {}
+            for task in tasks:
+                parent = task.parent_task()
+                if parent.layer <= meta.layer_count:
+                    parents[parent.id] = parent
+            tasks = list(parents.values())
+    return results
+
+
+def print_results(results: Dict[int, Dict[str, float]]) -> None:
+    header = ["layer", "chunks", "time (s)", "chunks/s"] + [f"{s} (s)" for s in STAGES]
+    print(" ".join(f"{h:>12}" for h in header))
+    for layer, result in sorted(results.items()):
+        values = [layer, result["n_chunks"], result["time"], result["chunks_per_sec"]]
+        values += [result[stage] for stage in STAGES]
+        print(" ".join(
+            f"{v:>12}" if isinstance(v, int) else f"{v:>12.3f}" for v in values))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic ingest benchmark")
+    parser.add_argument("path", help="local directory for the synthetic dataset")
+    parser.add_argument("--chunks", type=int, nargs=3, default=[4, 4, 2])
+    parser.add_argument("--chunk_size", type=int, nargs=3, default=[256, 256, 512])
+    parser.add_argument("--svs", type=int, default=1000, help="supervoxels per chunk")
+    parser.add_argument("--graph_id", default="synthetic_benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    time_start = time.time()
+    data_source = create_synthetic_dataset(
+        args.path, chunks_shape=args.chunks, chunk_size=args.chunk_size,
+        n_svs=args.svs, seed=args.seed,
+    )
+    print(f"Created dataset in {time.time() - time_start:.3f}s")
+
+    print_results(run_ingest_benchmark(
+        data_source, graph_id=args.graph_id, chunk_size=args.chunk_size))
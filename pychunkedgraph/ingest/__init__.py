@@ -9,8 +9,23 @@ _ingestconfig_fields = (
     "parents_q_name",
     "parents_q_limit",
     "parents_q_interval",
+    "cache_dir",  # local disk cache for edges and components files, disabled if None
+    "cache_max_bytes",
+    "cache_generation",  # change to invalidate cached files
+)
+_ingestconfig_defaults = (
+    True,
+    "",
+    "atomic",
+    100000,
+    60,
+    "parents",
+    25000,
+    120,
+    None,
+    10 * 1024 ** 3,
+    "",
 )
-_ingestconfig_defaults = (True, "", "atomic", 100000, 60, "parents", 25000, 120)
 IngestConfig = namedtuple(
     "IngestConfig", _ingestconfig_fields, defaults=_ingestconfig_defaults
 )
@@ -44,12 +44,19 @@ def _get_atomic_chunk_data(
     chunk_edges = (
         read_raw_edge_data(imanager, coord)
         if imanager.cg_meta.data_source.use_raw_edges
-        else get_chunk_edges(imanager.cg_meta.data_source.edges, [coord])
+        else get_chunk_edges(
+            imanager.cg_meta.data_source.edges,
+            [coord],
+            serialization=imanager.cg_meta.data_source.edges_format,
+            cache=imanager.cache,
+        )
     )
     mapping = (
         read_raw_agglomeration_data(imanager, coord)
         if imanager.cg_meta.data_source.use_raw_components
-        else get_chunk_components(imanager.cg_meta.data_source.components, coord)
+        else get_chunk_components(
+            imanager.cg_meta.data_source.components, coord, cache=imanager.cache
+        )
     )
     return chunk_edges, mapping
 
@@ -9,6 +9,7 @@ from cloudvolume import CloudVolume
 from . import IngestConfig
 from ..backend import ChunkedGraphMeta
 from ..backend.chunkedgraph import ChunkedGraph
+from ..io.cache import DiskCache
 
 
 class IngestionManager:
@@ -27,6 +28,7 @@ class IngestionManager:
         self._bitmasks = None
         self._bounds = None
         self._redis = None
+        self._cache = None
 
     @property
     def config(self):
@@ -47,6 +49,16 @@ class IngestionManager:
             )
         return self._cg
 
+    @property
+    def cache(self):
+        if self._cache is None and self._config.cache_dir:
+            self._cache = DiskCache(
+                self._config.cache_dir,
+                max_bytes=self._config.cache_max_bytes,
+                generation=self._config.cache_generation,
+            )
+        return self._cache
+
     @classmethod
     def from_pickle(cls, serialized_info):
         return cls(**pickle.loads(serialized_info))
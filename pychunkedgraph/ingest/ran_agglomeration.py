@@ -56,7 +56,13 @@ def read_raw_edge_data(imanager, coord) -> Dict:
         )
         no_edges = no_edges and not sv_ids1.size
     if not no_edges and imanager.cg_meta.data_source.edges:
-        put_chunk_edges(imanager.cg_meta.data_source.edges, coord, chunk_edges, 17)
+        put_chunk_edges(
+            imanager.cg_meta.data_source.edges,
+            coord,
+            chunk_edges,
+            17,
+            serialization=imanager.cg_meta.data_source.edges_format,
+        )
     return chunk_edges
 
 
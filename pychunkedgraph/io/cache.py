@@ -0,0 +1,194 @@
+"""
+Local disk and memory caches for data read from (slow) storage
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class DiskCache:
+    """
+    Size bounded LRU cache of file contents on local disk.
+
+    Entries are keyed by storage path and generation; bump the generation
+    when the underlying files are rewritten to invalidate old entries.
+    Entries are written to a temporary file and atomically renamed,
+    so multiple processes can share the same cache directory.
+    Hit and miss counters are per process.
+    """
+
+    def __init__(
+        self, directory: str, max_bytes: int = 10 * 1024 ** 3, generation: str = ""
+    ):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._generation = str(generation)
+        self._size = None
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _get_file_path(self, path: str) -> str:
+        digest = hashlib.sha256(f"{self._generation}:{path}".encode()).hexdigest()
+        return os.path.join(self._directory, digest[:2], digest)
+
+    def get(self, path: str) -> Optional[bytes]:
+        """
+        :param path: full storage path of the file
+        :return: cached content or None if not cached
+        """
+        file_path = self._get_file_path(path)
+        try:
+            with open(file_path, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        try:
+            # mtime is used as last access time for eviction
+            os.utime(file_path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return content
+
+    def put(self, path: str, content: bytes) -> None:
+        file_path = self._get_file_path(path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, file_path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if self._size is None:
+            self._size = self._compute_size()
+        else:
+            self._size += len(content)
+        if self._size > self._max_bytes:
+            self.evict()
+
+    def _list_entries(self):
+        entries = []
+        for sub_dir in os.scandir(self._directory):
+            if not sub_dir.is_dir():
+                continue
+            for entry in os.scandir(sub_dir.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _compute_size(self) -> int:
+        return sum(size for _, size, _ in self._list_entries())
+
+    def evict(self, target_fraction: float = 0.9) -> int:
+        """
+        Remove least recently used entries until the cache is below
+        `target_fraction` of its maximum size.
+        :return: number of removed entries
+        """
+        entries = sorted(self._list_entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self._max_bytes * target_fraction
+        removed = 0
+        for _, entry_size, entry_path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(entry_path)
+                removed += 1
+            except FileNotFoundError:
+                # removed by another process
+                pass
+            size -= entry_size
+        self._size = size
+        return removed
+
+
+class MemoryCache:
+    """
+    Thread safe in memory LRU cache bounded by the total size of its values
+    (`nbytes` for arrays, `len` otherwise, unless given explicitly).
+    """
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _sizeof(value) -> int:
+        return value.nbytes if hasattr(value, "nbytes") else len(value)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def n_bytes(self) -> int:
+        return self._size
+
+    def keys(self) -> list:
+        with self._lock:
+            return list(self._entries.keys())
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size: Optional[int] = None) -> None:
+        if size is None:
+            size = self._sizeof(value)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self._max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def pop(self, key) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
@@ -0,0 +1,176 @@
+"""
+Simple columnar block file format.
+
+Layout of a file:
+    magic (8 bytes) | header size (uint64 little endian) | header (json)
+    | padding | column block | padding | column block ...
+
+The header maps group -> column -> block description
+(dtype, size, offset, nbytes, compression). Every block starts at an offset
+aligned to `ALIGNMENT` bytes, so uncompressed blocks can be `np.memmap`'d
+directly from a local file without reading the rest of the file.
+"""
+
+import json
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import zstandard as zstd
+
+
+MAGIC = b"PCGCOL01"
+ALIGNMENT = 64
+COMPRESSION_ZSTD = "zstd"
+
+_PREFIX_SIZE = len(MAGIC) + 8
+
+
+def _padding(offset: int) -> int:
+    return (ALIGNMENT - offset % ALIGNMENT) % ALIGNMENT
+
+
+def serialize_columns(
+    groups: Dict[str, Dict[str, np.ndarray]],
+    compressed_columns: Optional[Iterable[str]] = None,
+    compression_level: int = 3,
+) -> bytes:
+    """
+    :param groups: {group: {column_name: 1D array}}
+    :type dict:
+    :param compressed_columns: names of columns to compress with zstd,
+        all other columns are stored raw (and can be memory mapped)
+    :type Iterable[str]:
+    :param compression_level: zstandard compression level
+    :type int:
+    :return: file content
+    :rtype: bytes
+    """
+    compressed_columns = set(compressed_columns or [])
+    cctx = zstd.ZstdCompressor(level=compression_level)
+
+    header = {}
+    blocks = []
+    for group, columns in groups.items():
+        header[group] = {}
+        for name, array in columns.items():
+            array = np.ascontiguousarray(array)
+            dtype = array.dtype.newbyteorder("<")
+            content = array.astype(dtype, copy=False).tobytes()
+            compression = None
+            if name in compressed_columns:
+                content = cctx.compress(content)
+                compression = COMPRESSION_ZSTD
+            header[group][name] = {
+                "dtype": dtype.str,
+                "size": int(array.size),
+                "nbytes": len(content),
+                "compression": compression,
+            }
+            blocks.append((group, name, content))
+
+    # offsets depend on the header size and vice versa,
+    # reserve room for the offsets before encoding the header
+    for group in header:
+        for name in header[group]:
+            header[group][name]["offset"] = 0
+    header_size = len(json.dumps(header).encode()) + 24 * len(blocks)
+    offset = _PREFIX_SIZE + header_size
+    for group, name, content in blocks:
+        offset += _padding(offset)
+        header[group][name]["offset"] = offset
+        offset += len(content)
+
+    header_b = json.dumps(header).encode().ljust(header_size)
+    assert len(header_b) == header_size
+
+    parts = [MAGIC, np.uint64(header_size).astype("<u8").tobytes(), header_b]
+    offset = _PREFIX_SIZE + header_size
+    for _, _, content in blocks:
+        pad = _padding(offset)
+        parts.append(b"\x00" * pad)
+        parts.append(content)
+        offset += pad + len(content)
+    return b"".join(parts)
+
+
+def read_header(content: bytes) -> Dict:
+    """
+    Parse the header from the beginning of a file.
+    `content` must contain at least the full header.
+    """
+    if content[: len(MAGIC)] != MAGIC:
+        raise ValueError("Not a columnar file.")
+    header_size = int(np.frombuffer(content[len(MAGIC) : _PREFIX_SIZE], "<u8")[0])
+    return json.loads(content[_PREFIX_SIZE : _PREFIX_SIZE + header_size].decode())
+
+
+def _decode_block(block: Dict, content) -> np.ndarray:
+    if block["compression"] == COMPRESSION_ZSTD:
+        content = zstd.ZstdDecompressor().decompress(
+            bytes(content), max_output_size=block["size"] * np.dtype(block["dtype"]).itemsize
+        )
+    elif block["compression"] is not None:
+        raise ValueError(f"Unknown compression {block['compression']}.")
+    return np.frombuffer(content, dtype=block["dtype"], count=block["size"])
+
+
+def deserialize_columns(
+    content: bytes, groups: Optional[Iterable[str]] = None
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Read columns from in-memory file content.
+    Uncompressed columns are views into `content`, nothing is copied.
+    :param groups: groups to read, all if None
+    """
+    header = read_header(content)
+    view = memoryview(content)
+    result = {}
+    for group in groups if groups is not None else header:
+        if not group in header:
+            continue
+        result[group] = {}
+        for name, block in header[group].items():
+            start = block["offset"]
+            result[group][name] = _decode_block(
+                block, view[start : start + block["nbytes"]]
+            )
+    return result
+
+
+def memmap_columns(
+    path: str, groups: Optional[Iterable[str]] = None
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Read columns from a local file.
+    Uncompressed columns are memory mapped, compressed columns are
+    read and decompressed; blocks of groups not requested are never read.
+    :param groups: groups to read, all if None
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(_PREFIX_SIZE)
+        if prefix[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a columnar file.")
+        header_size = int(np.frombuffer(prefix[len(MAGIC) :], "<u8")[0])
+        header = json.loads(f.read(header_size).decode())
+
+        result = {}
+        for group in groups if groups is not None else header:
+            if not group in header:
+                continue
+            result[group] = {}
+            for name, block in header[group].items():
+                if block["compression"] is None:
+                    if block["size"] == 0:
+                        result[group][name] = np.empty(0, dtype=block["dtype"])
+                        continue
+                    result[group][name] = np.memmap(
+                        path,
+                        dtype=block["dtype"],
+                        mode="r",
+                        offset=block["offset"],
+                        shape=(block["size"],),
+                    )
+                    continue
+                f.seek(block["offset"])
+                result[group][name] = _decode_block(block, f.read(block["nbytes"]))
+    return result
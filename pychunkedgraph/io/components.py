@@ -1,10 +1,11 @@
 import json
-from typing import Dict, Iterable
+from typing import Dict, Iterable, Optional
 
 import numpy as np
 from cloudvolume.storage import SimpleStorage
 
 from .protobuf.chunkComponents_pb2 import ChunkComponentsMsg
+from .cache import DiskCache
 from ..backend.utils import basetypes
 
 
@@ -47,14 +48,21 @@ def put_chunk_components(components_dir, components, chunk_coord) -> None:
         )
 
 
-def get_chunk_components(components_dir, chunk_coord) -> Dict:
+def get_chunk_components(
+    components_dir, chunk_coord, cache: Optional[DiskCache] = None
+) -> Dict:
     # filename format - components_x_y_z.serliazation
     file_name = f"components_{'_'.join(str(coord) for coord in chunk_coord)}.proto"
-    with SimpleStorage(components_dir) as storage:
-        content = storage.get_file(file_name)
-        if not content:
-            return {}
-        components_message = ChunkComponentsMsg()
-        components_message.ParseFromString(content)
-        return deserialize(components_message)
-
+    content = None
+    if cache is not None:
+        content = cache.get(f"{components_dir}/{file_name}")
+    if content is None:
+        with SimpleStorage(components_dir) as storage:
+            content = storage.get_file(file_name)
+        if cache is not None and content is not None:
+            cache.put(f"{components_dir}/{file_name}", content)
+    if not content:
+        return {}
+    components_message = ChunkComponentsMsg()
+    components_message.ParseFromString(content)
+    return deserialize(components_message)
@@ -3,7 +3,8 @@ Functions for reading and writing edges
 to (slow) storage with CloudVolume
 """
 
-from typing import List, Dict, Tuple, Union
+import os
+from typing import List, Dict, Tuple, Union, Iterable, Optional
 
 import numpy as np
 import zstandard as zstd
@@ -17,6 +18,11 @@ from ..backend.edges import Edges
 from ..backend.edges import EDGE_TYPES
 from ..backend.utils import basetypes
 from ..backend.edges.utils import concatenate_chunk_edges
+from . import columnar
+from .cache import DiskCache
+
+SERIALIZATION_PROTO = "proto"
+SERIALIZATION_COLUMNAR = "columnar"
 
 
 def serialize(edges: Edges) -> EdgesMsg:
@@ -57,8 +63,55 @@ def _decompress_edges(content: bytes) -> Dict:
     return edges_dict
 
 
+def _get_edges_filename(chunk_coordinates: np.ndarray, serialization: str) -> str:
+    chunk_str = "_".join(str(coord) for coord in chunk_coordinates)
+    # filename format - edges_x_y_z.serialization.compression
+    if serialization == SERIALIZATION_PROTO:
+        return f"edges_{chunk_str}.proto.zst"
+    if serialization == SERIALIZATION_COLUMNAR:
+        # compression is stored per column in the file header
+        return f"edges_{chunk_str}.columnar"
+    raise ValueError(f"Unknown edges serialization {serialization}.")
+
+
+def _columns_to_edges(columns_d: Dict, edge_types: Iterable[str]) -> Dict:
+    edges_dict = {}
+    for edge_type in EDGE_TYPES:
+        columns = columns_d.get(edge_type)
+        if edge_type not in edge_types or columns is None:
+            edges_dict[edge_type] = Edges([], [])
+            continue
+        edges_dict[edge_type] = Edges(
+            columns["node_ids1"],
+            columns["node_ids2"],
+            affinities=columns["affinities"],
+            areas=columns["areas"],
+        )
+    return edges_dict
+
+
+def _get_local_chunk_edges(
+    edges_dir: str, fnames: List[str], edge_types: Iterable[str]
+) -> List[Dict]:
+    """memory map columnar files from local filesystem"""
+    path = edges_dir[len("file://") :]
+    chunk_edge_dicts = []
+    for fname in fnames:
+        fpath = os.path.join(path, fname)
+        if not os.path.exists(fpath) or not os.path.getsize(fpath):
+            continue
+        columns_d = columnar.memmap_columns(fpath, groups=edge_types)
+        chunk_edge_dicts.append(_columns_to_edges(columns_d, edge_types))
+    return chunk_edge_dicts
+
+
 def get_chunk_edges(
-    edges_dir: str, chunks_coordinates: List[np.ndarray], cv_threads: int = 1
+    edges_dir: str,
+    chunks_coordinates: List[np.ndarray],
+    cv_threads: int = 1,
+    serialization: str = SERIALIZATION_PROTO,
+    edge_types: Iterable[str] = EDGE_TYPES,
+    cache: Optional[DiskCache] = None,
 ) -> Dict:
     """
     :param edges_dir: cloudvolume storage path
@@ -67,37 +120,111 @@ def get_chunk_edges(
     :type List[np.ndarray]:
     :param cv_threads: cloudvolume storage client thread count
     :type int:     
+    :param serialization: "proto" or "columnar"
+    :type str:
+    :param edge_types: edge types to read, others are returned empty;
+        only the blocks of these types are decoded in columnar files
+    :type Iterable[str]:
+    :param cache: optional local disk cache for downloaded files
+    :type DiskCache:
     :return: dictionary {"edge_type": Edges}
     """
-    fnames = []
-    for chunk_coords in chunks_coordinates:
-        chunk_str = "_".join(str(coord) for coord in chunk_coords)
-        # filename format - edges_x_y_z.serialization.compression
-        fnames.append(f"edges_{chunk_str}.proto.zst")
+    edge_types = tuple(edge_types)
+    fnames = [
+        _get_edges_filename(chunk_coords, serialization)
+        for chunk_coords in chunks_coordinates
+    ]
+
+    if serialization == SERIALIZATION_COLUMNAR and edges_dir.startswith("file://"):
+        return concatenate_chunk_edges(
+            _get_local_chunk_edges(edges_dir, fnames, edge_types)
+        )
+
+    chunk_edge_dicts = []
+    for content in _get_files(edges_dir, fnames, cv_threads, cache):
+        # empty chunk
+        if not content:
+            continue
+        if serialization == SERIALIZATION_COLUMNAR:
+            columns_d = columnar.deserialize_columns(content, groups=edge_types)
+            edges_dict = _columns_to_edges(columns_d, edge_types)
+        else:
+            edges_dict = _decompress_edges(content)
+        chunk_edge_dicts.append(edges_dict)
+    return concatenate_chunk_edges(chunk_edge_dicts)
+
+
+def _get_files(
+    edges_dir: str, fnames: List[str], cv_threads: int, cache: Optional[DiskCache]
+) -> List[bytes]:
+    """download files, return contents in the order of `fnames`"""
+    contents = {}
+    if cache is not None:
+        for fname in fnames:
+            content = cache.get(f"{edges_dir}/{fname}")
+            if content is not None:
+                contents[fname] = content
+    missing = [fname for fname in fnames if not fname in contents]
+    if not missing:
+        return [contents[fname] for fname in fnames]
 
     storage = (
         Storage(edges_dir, n_threads=cv_threads)
         if cv_threads > 1
         else SimpleStorage(edges_dir)
     )
-
-    chunk_edge_dicts = []
     with storage:
-        files = storage.get_files(fnames)
+        files = storage.get_files(missing)
         for _file in files:
             # cv error
             if _file["error"]:
                 raise ValueError(_file["error"])
-            # empty chunk
-            if not _file["content"]:
-                continue
-            edges_dict = _decompress_edges(_file["content"])
-            chunk_edge_dicts.append(edges_dict)
-    return concatenate_chunk_edges(chunk_edge_dicts)
+            contents[_file["filename"]] = _file["content"]
+            # files that don't exist yet are not cached
+            if cache is not None and _file["content"] is not None:
+                cache.put(f"{edges_dir}/{_file['filename']}", _file["content"])
+    return [contents[fname] for fname in fnames]
+
+
+def serialize_columnar(
+    edges_d: Dict,
+    compressed_columns: Optional[Iterable[str]] = None,
+    compression_level: int = 3,
+) -> bytes:
+    """
+    :param edges_d: edges_d with keys "in", "cross", "between"
+    :type dict:
+    :param compressed_columns: columns to compress with zstd,
+        e.g. ("affinities", "areas"); uncompressed columns can be memory mapped
+    :type Iterable[str]:
+    :return: columnar file content
+    :rtype: bytes
+    """
+    groups = {}
+    for edge_type in EDGE_TYPES:
+        edges = edges_d[edge_type]
+        groups[edge_type] = {
+            "node_ids1": edges.node_ids1.astype(basetypes.NODE_ID, copy=False),
+            "node_ids2": edges.node_ids2.astype(basetypes.NODE_ID, copy=False),
+            "affinities": edges.affinities.astype(
+                basetypes.EDGE_AFFINITY, copy=False
+            ),
+            "areas": edges.areas.astype(basetypes.EDGE_AREA, copy=False),
+        }
+    return columnar.serialize_columns(
+        groups,
+        compressed_columns=compressed_columns,
+        compression_level=compression_level,
+    )
 
 
 def put_chunk_edges(
-    edges_dir: str, chunk_coordinates: np.ndarray, edges_d, compression_level: int
+    edges_dir: str,
+    chunk_coordinates: np.ndarray,
+    edges_d,
+    compression_level: int,
+    serialization: str = SERIALIZATION_PROTO,
+    compressed_columns: Optional[Iterable[str]] = None,
 ) -> None:
     """
     :param edges_dir: cloudvolume storage path
@@ -108,23 +235,84 @@ def put_chunk_edges(
     :type dict:
     :param compression_level: zstandard compression level (1-22, higher - better ratio)
     :type int:
+    :param serialization: "proto" or "columnar"
+    :type str:
+    :param compressed_columns: columnar only, columns to compress
+    :type Iterable[str]:
     :return None:
     """
+    file = _get_edges_filename(chunk_coordinates, serialization)
+    if serialization == SERIALIZATION_COLUMNAR:
+        content = serialize_columnar(
+            edges_d,
+            compressed_columns=compressed_columns,
+            compression_level=compression_level,
+        )
+    else:
+        chunk_edges = ChunkEdgesMsg()
+        chunk_edges.in_chunk.CopyFrom(serialize(edges_d[EDGE_TYPES.in_chunk]))
+        chunk_edges.between_chunk.CopyFrom(
+            serialize(edges_d[EDGE_TYPES.between_chunk])
+        )
+        chunk_edges.cross_chunk.CopyFrom(serialize(edges_d[EDGE_TYPES.cross_chunk]))
+        cctx = zstd.ZstdCompressor(level=compression_level)
+        content = cctx.compress(chunk_edges.SerializeToString())
 
-    chunk_edges = ChunkEdgesMsg()
-    chunk_edges.in_chunk.CopyFrom(serialize(edges_d[EDGE_TYPES.in_chunk]))
-    chunk_edges.between_chunk.CopyFrom(serialize(edges_d[EDGE_TYPES.between_chunk]))
-    chunk_edges.cross_chunk.CopyFrom(serialize(edges_d[EDGE_TYPES.cross_chunk]))
-
-    cctx = zstd.ZstdCompressor(level=compression_level)
-    chunk_str = "_".join(str(coord) for coord in chunk_coordinates)
-
-    # filename format - edges_x_y_z.serialization.compression
-    file = f"edges_{chunk_str}.proto.zst"
     with Storage(edges_dir) as storage:
         storage.put_file(
             file_path=file,
-            content=cctx.compress(chunk_edges.SerializeToString()),
+            content=content,
             compress=None,
             cache_control="no-cache",
         )
+
+
+def convert_to_columnar(
+    edges_dir: str,
+    chunks_coordinates: List[np.ndarray],
+    out_dir: Optional[str] = None,
+    compressed_columns: Optional[Iterable[str]] = None,
+    compression_level: int = 3,
+    cv_threads: int = 1,
+) -> int:
+    """
+    Convert proto edge files to the columnar format.
+    :param edges_dir: cloudvolume storage path with proto files
+    :type str:
+    :param chunks_coordinates: list of chunk coords to convert
+    :type List[np.ndarray]:
+    :param out_dir: destination path, defaults to `edges_dir`
+    :type str:
+    :return: number of converted files, empty chunks are skipped
+    :rtype: int
+    """
+    out_dir = edges_dir if out_dir is None else out_dir
+    fnames = [
+        _get_edges_filename(chunk_coords, SERIALIZATION_PROTO)
+        for chunk_coords in chunks_coordinates
+    ]
+    storage = (
+        Storage(edges_dir, n_threads=cv_threads)
+        if cv_threads > 1
+        else SimpleStorage(edges_dir)
+    )
+    with storage:
+        files = {f["filename"]: f for f in storage.get_files(fnames)}
+
+    count = 0
+    for chunk_coords, fname in zip(chunks_coordinates, fnames):
+        _file = files[fname]
+        if _file["error"]:
+            raise ValueError(_file["error"])
+        if not _file["content"]:
+            continue
+        put_chunk_edges(
+            out_dir,
+            chunk_coords,
+            _decompress_edges(_file["content"]),
+            compression_level,
+            serialization=SERIALIZATION_COLUMNAR,
+            compressed_columns=compressed_columns,
+        )
+        count += 1
+    return count
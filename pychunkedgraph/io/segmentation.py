@@ -0,0 +1,252 @@
+"""
+Block cache for watershed segmentation.
+
+Watershed segmentation never changes, so decoded blocks aligned to the
+underlying CloudVolume chunks can be cached and shared by everything in a
+process that reads the same layer at the same mip.
+"""
+
+import io
+import os
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+import numpy as np
+import cloudvolume
+
+from pychunkedgraph.io.cache import DiskCache
+from pychunkedgraph.io.cache import MemoryCache
+
+
+class SegmentationBlockCache:
+    """
+    Reads cutouts from a CloudVolume through a bounded in memory LRU of
+    chunk aligned blocks, optionally backed by a `DiskCache`.
+    """
+
+    def __init__(
+        self,
+        cv: cloudvolume.CloudVolume,
+        max_bytes: int = 128 * 1024 ** 2,
+        disk_cache: Optional[DiskCache] = None,
+    ):
+        self._cv = cv
+        self._block_size = np.array(cv.chunk_size, dtype=np.int64)
+        self._offset = np.array(cv.voxel_offset, dtype=np.int64)
+        self._end = self._offset + np.array(cv.volume_size, dtype=np.int64)
+        self._memory = MemoryCache(max_bytes)
+        self._disk_cache = disk_cache
+
+    @property
+    def cv(self) -> cloudvolume.CloudVolume:
+        return self._cv
+
+    @property
+    def stats(self) -> dict:
+        hits, misses = self._memory.hits, self._memory.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "n_blocks": len(self._memory),
+            "n_bytes": self._memory.n_bytes,
+        }
+
+    def _get_key(self, block: Iterable[int]) -> str:
+        block_str = "_".join(str(int(x)) for x in block)
+        return f"{self._cv.cloudpath}/{self._cv.mip}/{block_str}"
+
+    def _get_block_bbox(self, block: Iterable[int]):
+        start = self._offset + np.array(block) * self._block_size
+        end = np.minimum(start + self._block_size, self._end)
+        return start, end
+
+    def _clamp(self, start: Iterable[int], end: Iterable[int]):
+        start = np.maximum(np.array(start, dtype=np.int64), self._offset)
+        end = np.minimum(np.array(end, dtype=np.int64), self._end)
+        return start, end
+
+    def _get_blocks(self, start: np.ndarray, end: np.ndarray) -> list:
+        """ Blocks intersecting the (clamped, non empty) box [start, end) """
+        block_start = (start - self._offset) // self._block_size
+        block_end = (end - 1 - self._offset) // self._block_size + 1
+        return list(
+            itertools.product(*[range(a, b) for a, b in zip(block_start, block_end)])
+        )
+
+    def _get_cached_block(self, block) -> Optional[np.ndarray]:
+        key = self._get_key(block)
+        data = self._memory.get(key)
+        if data is None and self._disk_cache is not None:
+            content = self._disk_cache.get(key)
+            if content is not None:
+                data = np.load(io.BytesIO(content))
+                self._memory.put(key, data)
+        return data
+
+    def _put_block(self, block, data: np.ndarray) -> None:
+        key = self._get_key(block)
+        self._memory.put(key, data)
+        if self._disk_cache is not None:
+            content = io.BytesIO()
+            np.save(content, data)
+            self._disk_cache.put(key, content.getvalue())
+
+    def _download_blocks(self, blocks) -> dict:
+        """
+        Downloads `blocks` with one cutout per box of contiguous blocks,
+        blocks in between that are not in `blocks` are not downloaded.
+        """
+        result = {}
+        for box_blocks in _get_block_boxes(blocks):
+            result.update(self._download_box(box_blocks))
+        return result
+
+    def _download_box(self, blocks) -> dict:
+        """ Downloads the bounding box of all `blocks` in a single cutout. """
+        bboxes = [self._get_block_bbox(block) for block in blocks]
+        start = np.min([bbox[0] for bbox in bboxes], axis=0)
+        end = np.max([bbox[1] for bbox in bboxes], axis=0)
+        data = np.asarray(
+            self._cv[start[0] : end[0], start[1] : end[1], start[2] : end[2]]
+        )
+        if data.ndim == 4:
+            data = data[..., 0]
+
+        result = {}
+        for block, (b_start, b_end) in zip(blocks, bboxes):
+            b_start, b_end = b_start - start, b_end - start
+            block_data = data[
+                b_start[0] : b_end[0], b_start[1] : b_end[1], b_start[2] : b_end[2]
+            ].copy(order="F")
+            self._put_block(block, block_data)
+            result[block] = block_data
+        return result
+
+    def cutout(self, start: Iterable[int], end: Iterable[int]) -> np.ndarray:
+        """
+        Watershed segmentation in [start, end) at the mip of the volume,
+        clamped to the volume bounds.
+        :return: 3D array (x, y, z)
+        """
+        start, end = self._clamp(start, end)
+        shape = np.maximum(end - start, 0)
+        out = np.zeros(shape, dtype=self._cv.dtype, order="F")
+        if np.any(shape == 0):
+            return out
+
+        blocks = self._get_blocks(start, end)
+
+        block_d = {}
+        missing = []
+        for block in blocks:
+            data = self._get_cached_block(block)
+            if data is None:
+                missing.append(block)
+            else:
+                block_d[block] = data
+        if missing:
+            block_d.update(self._download_blocks(missing))
+
+        for block, data in block_d.items():
+            b_start, b_end = self._get_block_bbox(block)
+            o_start = np.maximum(b_start, start)
+            o_end = np.minimum(b_end, end)
+            out[
+                o_start[0] - start[0] : o_end[0] - start[0],
+                o_start[1] - start[1] : o_end[1] - start[1],
+                o_start[2] - start[2] : o_end[2] - start[2],
+            ] = data[
+                o_start[0] - b_start[0] : o_end[0] - b_start[0],
+                o_start[1] - b_start[1] : o_end[1] - b_start[1],
+                o_start[2] - b_start[2] : o_end[2] - b_start[2],
+            ]
+        return out
+
+    def prefetch(self, bboxes: Iterable, n_threads: int = 8) -> None:
+        """
+        Downloads the blocks of many (e.g. small, scattered) bounding boxes
+        before they are cut out. Each missing block is downloaded once, in
+        parallel, instead of one cutout of all blocks of a box at a time.
+        :param bboxes: iterable of (start, end)
+        """
+        blocks = set()
+        for start, end in bboxes:
+            start, end = self._clamp(start, end)
+            if np.all(end > start):
+                blocks.update(self._get_blocks(start, end))
+        missing = [block for block in blocks if self._get_cached_block(block) is None]
+        if not missing:
+            return
+        with ThreadPoolExecutor(max_workers=min(n_threads, len(missing))) as executor:
+            list(executor.map(lambda block: self._download_blocks([block]), missing))
+
+    def __getitem__(self, slices) -> np.ndarray:
+        start = [s.start for s in slices[:3]]
+        end = [s.stop for s in slices[:3]]
+        return self.cutout(start, end)
+
+
+def _get_block_boxes(blocks) -> list:
+    """
+    Groups blocks into boxes that are completely filled with blocks, by
+    merging contiguous runs of blocks along x, then y, then z.
+    :return: list of lists of blocks
+    """
+    # box: (start, end) in block coordinates
+    boxes = [(tuple(block), tuple(x + 1 for x in block)) for block in blocks]
+    for axis in range(3):
+        others = [i for i in range(3) if i != axis]
+
+        def _sort_key(box):
+            start, end = box
+            return [start[i] for i in others] + [end[i] for i in others] + [start[axis]]
+
+        merged = []
+        for start, end in sorted(boxes, key=_sort_key):
+            if merged:
+                last_start, last_end = merged[-1]
+                if last_end[axis] == start[axis] and all(
+                    last_start[i] == start[i] and last_end[i] == end[i] for i in others
+                ):
+                    merged[-1] = (last_start, end)
+                    continue
+            merged.append((start, end))
+        boxes = merged
+    return [
+        list(itertools.product(*[range(a, b) for a, b in zip(start, end)]))
+        for start, end in boxes
+    ]
+
+
+_block_caches = {}
+_block_caches_lock = threading.Lock()
+
+
+def get_segmentation_block_cache(
+    cloudpath: str, mip: int, info: Optional[dict] = None
+) -> SegmentationBlockCache:
+    """
+    Block cache shared by all users of `cloudpath` at `mip` in this process.
+    Configured with WS_BLOCK_CACHE_BYTES (memory, default 128 MiB per mip) and
+    WS_BLOCK_CACHE_DIR (local disk, disabled by default).
+    """
+    with _block_caches_lock:
+        if not (cloudpath, mip) in _block_caches:
+            disk_cache = None
+            cache_dir = os.environ.get("WS_BLOCK_CACHE_DIR")
+            if cache_dir:
+                disk_cache = DiskCache(
+                    cache_dir,
+                    max_bytes=int(os.environ.get("WS_BLOCK_CACHE_DIR_BYTES", 10 * 1024 ** 3)),
+                )
+            cv = cloudvolume.CloudVolume(cloudpath, mip=mip, info=info)
+            _block_caches[(cloudpath, mip)] = SegmentationBlockCache(
+                cv,
+                max_bytes=int(os.environ.get("WS_BLOCK_CACHE_BYTES", 128 * 1024 ** 2)),
+                disk_cache=disk_cache,
+            )
+        return _block_caches[(cloudpath, mip)]
@@ -0,0 +1,108 @@
+"""
+Process wide cache of mesh fragments.
+
+Fragments are named after (immutable) node IDs and never change once
+written, so they can be cached without invalidation. Fragments written or
+fetched while meshing layer N are reused when meshing layer N + 1 on the
+same worker.
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional, Sequence
+
+from pychunkedgraph.io.cache import DiskCache
+from pychunkedgraph.io.cache import MemoryCache
+
+
+class FragmentCache:
+    """
+    Size bounded in memory LRU cache, optionally backed by a `DiskCache`
+    for fragments evicted from memory. Thread safe.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 ** 2, disk_cache: Optional[DiskCache] = None):
+        self._memory = MemoryCache(max_bytes)
+        self._disk_cache = disk_cache
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "n_entries": len(self._memory),
+            "n_bytes": self._memory.n_bytes,
+        }
+
+    def get(self, key: str) -> Optional[bytes]:
+        content = self._memory.get(key)
+        if content is None and self._disk_cache is not None:
+            content = self._disk_cache.get(key)
+            if content is not None:
+                self._memory.put(key, content)
+        if content is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return content
+
+    def put(self, key: str, content: bytes) -> None:
+        self._memory.put(key, content)
+        if self._disk_cache is not None:
+            self._disk_cache.put(key, content)
+
+    def clear(self) -> None:
+        self._memory.clear()
+
+    def get_files(self, storage, mesh_path: str, filenames: Sequence[str]) -> List[Dict]:
+        """
+        Drop in replacement for `storage.get_files(filenames)`,
+        only fragments not in the cache are downloaded.
+        Missing fragments and errors are not cached.
+        """
+        results = {}
+        to_fetch = []
+        for filename in filenames:
+            content = self.get(f"{mesh_path}/{filename}")
+            if content is None:
+                to_fetch.append(filename)
+            else:
+                results[filename] = {"filename": filename, "content": content, "error": None}
+
+        if to_fetch:
+            for file in storage.get_files(to_fetch):
+                results[file["filename"]] = file
+                if file["content"] is not None and file["error"] is None:
+                    self.put(f"{mesh_path}/{file['filename']}", file["content"])
+        return [results[filename] for filename in filenames if filename in results]
+
+
+_fragment_cache = None
+_fragment_cache_lock = threading.Lock()
+
+
+def get_fragment_cache() -> FragmentCache:
+    """
+    Fragment cache shared by all mesh tasks of this process. Configured with
+    MESH_FRAGMENT_CACHE_BYTES (memory, default 512 MiB) and
+    MESH_FRAGMENT_CACHE_DIR (local disk, disabled by default).
+    """
+    global _fragment_cache
+    with _fragment_cache_lock:
+        if _fragment_cache is None:
+            disk_cache = None
+            cache_dir = os.environ.get("MESH_FRAGMENT_CACHE_DIR")
+            if cache_dir:
+                disk_cache = DiskCache(
+                    cache_dir,
+                    max_bytes=int(os.environ.get("MESH_FRAGMENT_CACHE_DIR_BYTES", 10 * 1024 ** 3)),
+                )
+            _fragment_cache = FragmentCache(
+                max_bytes=int(os.environ.get("MESH_FRAGMENT_CACHE_BYTES", 512 * 1024 ** 2)),
+                disk_cache=disk_cache,
+            )
+        return _fragment_cache
@@ -0,0 +1,95 @@
+"""
+Cache for mesh manifests.
+
+Node IDs are immutable, so the manifest of a node only changes while its
+fragments are still being (re)meshed. Complete manifests are cached until
+evicted, incomplete ones (verified manifests with missing fragments) only
+for a short time so they are refreshed once meshing catches up.
+"""
+
+import json
+import time
+import hashlib
+from typing import Optional
+
+from pychunkedgraph.io.cache import MemoryCache
+
+
+class ManifestCache:
+    """
+    Bounded in process LRU, optionally shared between processes via redis.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024 ** 2,
+        redis_conn=None,
+        incomplete_ttl: float = 30,
+        complete_ttl: float = 7 * 24 * 3600,
+        prefix: str = "manifest",
+    ):
+        self._memory = MemoryCache(max_bytes)
+        self._redis = redis_conn
+        self._incomplete_ttl = incomplete_ttl
+        self._complete_ttl = complete_ttl
+        self._prefix = prefix
+
+    @property
+    def stats(self) -> dict:
+        hits, misses = self._memory.hits, self._memory.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "n_entries": len(self._memory),
+        }
+
+    def get_key(self, table_id: str, node_id, verify: bool, **params) -> str:
+        """
+        :param params: other request parameters that change the manifest
+        """
+        params_str = json.dumps(params, sort_keys=True, default=str)
+        return f"{self._prefix}:{table_id}:{int(node_id)}:{int(bool(verify))}:{params_str}"
+
+    def _is_fresh(self, entry: dict) -> bool:
+        if entry["complete"]:
+            return True
+        return time.time() - entry["time"] < self._incomplete_ttl
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        :return: {"manifest": dict, "complete": bool, "etag": str, "time": float}
+            or None if there is no fresh entry
+        """
+        entry = self._memory.get(key)
+        if entry is not None and self._is_fresh(entry):
+            return entry
+        if self._redis is not None:
+            content = self._redis.get(key)
+            if content is not None:
+                entry = json.loads(content)
+                if self._is_fresh(entry):
+                    self._memory.put(key, entry, size=len(content))
+                    return entry
+        return None
+
+    def put(self, key: str, manifest: dict, complete: bool) -> dict:
+        """
+        :param manifest: json serializable manifest
+        :param complete: False if fragments are still missing
+        :return: the cached entry
+        """
+        manifest_b = json.dumps(manifest, sort_keys=True).encode()
+        entry = {
+            "manifest": manifest,
+            "complete": complete,
+            "etag": hashlib.sha1(manifest_b).hexdigest(),
+            "time": time.time(),
+        }
+        content = json.dumps(entry)
+        self._memory.put(key, entry, size=len(content))
+        if self._redis is not None:
+            ttl = self._complete_ttl if complete else self._incomplete_ttl
+            self._redis.set(key, content, ex=max(1, int(ttl)))
+        return entry
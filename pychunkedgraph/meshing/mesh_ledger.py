@@ -0,0 +1,104 @@
+"""
+Task ledgers for restartable meshing runs.
+
+A ledger records which chunks of a meshing run are done (or failed), so a
+rerun skips finished chunks. `SQLiteLedger` keeps the records in a local
+file, `RedisLedger` in redis for runs spread over several machines.
+"""
+
+import time
+import sqlite3
+from typing import Optional, Set
+
+import numpy as np
+
+
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class SQLiteLedger:
+    def __init__(self, path: str, name: str):
+        """
+        :param path: sqlite database file
+        :param name: name of the run, e.g. table and mesh dir
+        """
+        self._name = name
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS chunks (
+                name TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                layer INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                message TEXT,
+                time REAL,
+                PRIMARY KEY (name, chunk_id))"""
+        )
+        self._conn.commit()
+
+    def _set(self, chunk_id, layer, status, message):
+        # chunk ids are uint64, sqlite integers are signed
+        self._conn.execute(
+            "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                self._name,
+                int(np.uint64(chunk_id).astype(np.int64)),
+                int(layer),
+                status,
+                message,
+                time.time(),
+            ),
+        )
+        self._conn.commit()
+
+    def mark_done(self, chunk_id: np.uint64, layer: int, message: str = None):
+        self._set(chunk_id, layer, STATUS_DONE, message)
+
+    def mark_failed(self, chunk_id: np.uint64, layer: int, message: str = None):
+        self._set(chunk_id, layer, STATUS_FAILED, message)
+
+    def get_chunks(self, status: str = STATUS_DONE, layer: Optional[int] = None) -> Set[np.uint64]:
+        query = "SELECT chunk_id FROM chunks WHERE name = ? AND status = ?"
+        args = [self._name, status]
+        if layer is not None:
+            query += " AND layer = ?"
+            args.append(int(layer))
+        chunk_ids = [row[0] for row in self._conn.execute(query, args)]
+        return set(np.array(chunk_ids, dtype=np.int64).astype(np.uint64))
+
+    def close(self):
+        self._conn.close()
+
+
+class RedisLedger:
+    """
+    Redis layout: hash {prefix}:{name} chunk_id -> "status:layer"
+    """
+
+    def __init__(self, redis_conn, name: str, prefix: str = "meshledger"):
+        self._redis = redis_conn
+        self._key = f"{prefix}:{name}"
+
+    def _set(self, chunk_id, layer, status):
+        self._redis.hset(self._key, str(int(chunk_id)), f"{status}:{int(layer)}")
+
+    def mark_done(self, chunk_id: np.uint64, layer: int, message: str = None):
+        self._set(chunk_id, layer, STATUS_DONE)
+
+    def mark_failed(self, chunk_id: np.uint64, layer: int, message: str = None):
+        self._set(chunk_id, layer, STATUS_FAILED)
+
+    def get_chunks(self, status: str = STATUS_DONE, layer: Optional[int] = None) -> Set[np.uint64]:
+        chunk_ids = set()
+        for chunk_id, value in self._redis.hgetall(self._key).items():
+            chunk_status, chunk_layer = value.decode().split(":")
+            if chunk_status != status:
+                continue
+            if layer is not None and int(chunk_layer) != layer:
+                continue
+            chunk_ids.add(np.uint64(int(chunk_id)))
+        return chunk_ids
+
+    def close(self):
+        pass
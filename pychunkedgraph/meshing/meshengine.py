@@ -1,12 +1,32 @@
+import os
 import cloudvolume
+import collections
 import numpy as np
 import itertools
-import random
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 from pychunkedgraph.backend import chunkedgraph
 from multiwrapper import multiprocessing_utils as mu
 
 from . import meshgen
+from . import mesh_ledger
+
+
+_mesh_worker_cg = None
+
+
+def _init_mesh_worker(cg_info):
+    global _mesh_worker_cg
+    _mesh_worker_cg = chunkedgraph.ChunkedGraph(**cg_info)
+
+
+def _mesh_chunk_worker(chunk_id, mesh_path, mip):
+    cg_info = _mesh_worker_cg.get_serialized_info()
+    del (cg_info['credentials'])
+    # chunks with failed fragments are marked failed in the ledger
+    return meshgen.chunk_mesh_task_new_remapping(
+        cg_info, chunk_id, mesh_path, mip=mip, cg=_mesh_worker_cg,
+        n_processes=1, raise_on_failure=True)
 
 
 class MeshEngine(object):
@@ -80,99 +100,172 @@ class MeshEngine(object):
             self._cv.info["mesh"] = self.cv_mesh_dir
         return self._cv
 
-    def mesh_multiple_layers(self, layers=None, bounding_box=None,
-                             block_factor=2, n_threads=128):
-        if layers is None:
-            layers = range(1, int(self.cg.n_layers + 1))
-
-        layers = np.array(layers, dtype=np.int)
-
-        layers = layers[layers > 0]
-        layers = layers[layers < self.highest_mesh_layer + 1]
-
-        print("Meshing layers:", layers)
-
-        for layer in layers:
-            print("Now: layer %d" % layer)
-            self.mesh_single_layer(layer, bounding_box=bounding_box,
-                                   block_factor=block_factor,
-                                   n_threads=n_threads)
-
-    def mesh_single_layer(self, layer, bounding_box=None, block_factor=2,
-                          n_threads=128):
-        assert layer <= self.highest_mesh_layer
-
-        dataset_bounding_box = np.array(self.cv.bounds.to_list())
-
-        block_bounding_box_cg = \
-            [np.floor(dataset_bounding_box[:3] /
-                      self.cg.chunk_size).astype(np.int),
-             np.ceil(dataset_bounding_box[3:] /
-                     self.cg.chunk_size).astype(np.int)]
+    def get_mesh_path(self, mesh_path=None):
+        """ Path meshes are written to, defaults to the mesh path of the
+            chunkedgraph """
+        return mesh_path or self.cg.cv_mesh_path
+
+    def get_ledger_name(self, mesh_path=None):
+        return "%s:%s" % (self.table_id, self.get_mesh_path(mesh_path))
+
+    def get_ledger(self, ledger_path=None, redis_conn=None, mesh_path=None):
+        """ Ledger recording the chunks of this engine meshed to mesh_path
+
+        :param ledger_path: sqlite file, defaults to <mesh dir>_ledger.db
+        :param redis_conn: use a RedisLedger instead
+        :param mesh_path: defaults to the mesh path of the chunkedgraph
+        """
+        mesh_path = self.get_mesh_path(mesh_path)
+        ledger_name = self.get_ledger_name(mesh_path)
+        if redis_conn is not None:
+            return mesh_ledger.RedisLedger(redis_conn, ledger_name)
+        if ledger_path is None:
+            ledger_path = "%s_ledger.db" % os.path.basename(mesh_path.rstrip("/"))
+        return mesh_ledger.SQLiteLedger(ledger_path, ledger_name)
+
+    def get_layer_chunk_ids(self, layer, bounding_box=None):
+        """ Chunk ids of a layer overlapping the dataset (or bounding_box)
+
+        :param layer: int
+        :param bounding_box: [[x0, y0, z0], [x1, y1, z1]] in voxels
+        :return: np.ndarray of np.uint64
+        """
+        vol_bounds = self.cg.vx_vol_bounds
+        block_bounding_box_cg = [
+            np.zeros(3, dtype=int),
+            np.ceil((vol_bounds[:, 1] - vol_bounds[:, 0]) /
+                    self.cg.chunk_size).astype(int)]
 
         if bounding_box is not None:
+            bounding_box = np.array(bounding_box) - vol_bounds[:, 0]
             bounding_box_cg = \
                 [np.floor(bounding_box[0] /
-                          self.cg.chunk_size).astype(np.int),
+                          self.cg.chunk_size).astype(int),
                  np.ceil(bounding_box[1] /
-                         self.cg.chunk_size).astype(np.int)]
-
-            m = block_bounding_box_cg[0] < bounding_box_cg[0]
-            block_bounding_box_cg[0][m] = bounding_box_cg[0][m]
+                         self.cg.chunk_size).astype(int)]
 
-            m = block_bounding_box_cg[1] > bounding_box_cg[1]
-            block_bounding_box_cg[1][m] = bounding_box_cg[1][m]
+            block_bounding_box_cg[0] = np.maximum(block_bounding_box_cg[0],
+                                                  bounding_box_cg[0])
+            block_bounding_box_cg[1] = np.minimum(block_bounding_box_cg[1],
+                                                  bounding_box_cg[1])
 
-        block_bounding_box_cg /= 2 ** np.max([0, layer - 2])
-        block_bounding_box_cg = np.ceil(block_bounding_box_cg)
+        scale = int(self.cg.fan_out) ** max(0, layer - 2)
+        start = block_bounding_box_cg[0] // scale
+        end = -(-block_bounding_box_cg[1] // scale)
 
-        n_jobs = np.product(block_bounding_box_cg[1] -
-                            block_bounding_box_cg[0]) / \
-                 block_factor ** 2 < n_threads
+        chunk_ids = [self.cg.get_chunk_id(layer=layer, x=x, y=y, z=z)
+                     for x, y, z in itertools.product(*[range(a, b) for a, b
+                                                        in zip(start, end)])]
+        return np.array(chunk_ids, dtype=np.uint64)
 
-        while n_jobs < n_threads and block_factor > 1:
-            block_factor -= 1
+    def mesh_multiple_layers(self, layers=None, bounding_box=None,
+                             n_processes=None, ledger=None, mesh_path=None):
+        """ Meshes all chunks of `layers` in a process pool
+
+        A chunk is meshed as soon as all of its children in the next lower
+        meshed layer are done. Finished chunks are recorded in the ledger
+        and skipped when the run is restarted.
+
+        :param layers: list of ints, defaults to 2 .. highest_mesh_layer
+        :param bounding_box: [[x0, y0, z0], [x1, y1, z1]] in voxels
+        :param n_processes: defaults to the number of cpus
+        :param ledger: SQLiteLedger or RedisLedger, defaults to
+            get_ledger(mesh_path=mesh_path)
+        :param mesh_path: defaults to the mesh path of the chunkedgraph
+        :return: set of failed chunk ids
+        """
+        if layers is None:
+            layers = range(2, int(self.cg.n_layers + 1))
 
-            n_jobs = np.product(block_bounding_box_cg[1] -
-                                block_bounding_box_cg[0]) / \
-                     block_factor ** 2 < n_threads
+        layers = np.array(layers, dtype=int)
 
-        block_iter = itertools.product(np.arange(block_bounding_box_cg[0][0],
-                                                 block_bounding_box_cg[1][0],
-                                                 block_factor),
-                                       np.arange(block_bounding_box_cg[0][1],
-                                                 block_bounding_box_cg[1][1],
-                                                 block_factor),
-                                       np.arange(block_bounding_box_cg[0][2],
-                                                 block_bounding_box_cg[1][2],
-                                                 block_factor))
+        layers = layers[layers > 1]
+        layers = np.unique(layers[layers < self.highest_mesh_layer + 1])
 
-        blocks = np.array(list(block_iter), dtype=np.int)
+        if n_processes is None:
+            n_processes = os.cpu_count()
 
-        cg_info = self.cg.get_serialized_info()
-        del (cg_info['credentials'])
+        mesh_path = self.get_mesh_path(mesh_path)
+        if ledger is None:
+            ledger = self.get_ledger(mesh_path=mesh_path)
 
-        multi_args = []
-        for start_block in blocks:
-            end_block = start_block + block_factor
-            m = end_block > block_bounding_box_cg[1]
-            end_block[m] = block_bounding_box_cg[1][m]
+        print("Meshing layers:", layers)
 
-            multi_args.append([cg_info, start_block, end_block, self.cg._cv_path,
-                               self.cv_mesh_dir, self.mesh_mip, layer])
-        random.shuffle(multi_args)
+        done = ledger.get_chunks(mesh_ledger.STATUS_DONE)
+
+        # chunk id -> (layer, planned children in the previous layer)
+        chunk_layers = {}
+        n_children = collections.defaultdict(int)
+        parent_ids = {}
+        for i_layer, layer in enumerate(layers):
+            for chunk_id in self.get_layer_chunk_ids(
+                    layer, bounding_box=bounding_box):
+                chunk_layers[chunk_id] = layer
+                if i_layer + 1 < len(layers):
+                    parent_layer = layers[i_layer + 1]
+                    parent_id = self.cg.get_parent_chunk_ids(chunk_id)[
+                        parent_layer - layer]
+                    parent_ids[chunk_id] = parent_id
+                    if not chunk_id in done:
+                        n_children[parent_id] += 1
+
+        todo = [c for c in chunk_layers if not c in done]
+        print("%d / %d chunks done" % (len(chunk_layers) - len(todo),
+                                       len(chunk_layers)))
+
+        ready = [c for c in todo if n_children[c] == 0]
+        n_done = 0
+        failed = set()
 
-        random.shuffle(multi_args)
+        cg_info = self.cg.get_serialized_info()
+        del (cg_info['credentials'])
 
-        # Run parallelizing
-        if n_threads == 1:
-            mu.multiprocess_func(meshgen._mesh_layer_thread, multi_args,
-                                 n_threads=n_threads, verbose=True,
-                                 debug=n_threads == 1)
-        else:
-            mu.multisubprocess_func(meshgen._mesh_layer_thread, multi_args,
-                                    n_threads=n_threads,
-                                    suffix="%s_%d" % (self.table_id, layer))
+        with ProcessPoolExecutor(max_workers=n_processes,
+                                 initializer=_init_mesh_worker,
+                                 initargs=(cg_info,)) as pool:
+            futures = {}
+            while ready or futures:
+                for chunk_id in ready:
+                    future = pool.submit(_mesh_chunk_worker, chunk_id,
+                                         mesh_path, self.mesh_mip)
+                    futures[future] = chunk_id
+                ready = []
+
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    chunk_id = futures.pop(future)
+                    layer = chunk_layers[chunk_id]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print("Chunk %d (layer %d) failed: %s" %
+                              (chunk_id, layer, repr(e)))
+                        ledger.mark_failed(chunk_id, layer, repr(e))
+                        failed.add(chunk_id)
+                        continue
+
+                    ledger.mark_done(chunk_id, layer)
+                    n_done += 1
+                    if chunk_id in parent_ids:
+                        parent_id = parent_ids[chunk_id]
+                        n_children[parent_id] -= 1
+                        if n_children[parent_id] == 0 and \
+                                parent_id in chunk_layers:
+                            ready.append(parent_id)
+
+        n_blocked = len(todo) - n_done - len(failed)
+        if failed:
+            print("%d chunks failed, %d chunks blocked by failed children" %
+                  (len(failed), n_blocked))
+        return failed
+
+    def mesh_single_layer(self, layer, bounding_box=None, n_processes=None,
+                          ledger=None, mesh_path=None):
+        assert layer <= self.highest_mesh_layer
+        return self.mesh_multiple_layers(layers=[layer],
+                                         bounding_box=bounding_box,
+                                         n_processes=n_processes,
+                                         ledger=ledger, mesh_path=mesh_path)
 
     def create_manifests_for_higher_layers(self, n_threads=1):
         root_id_max = self.cg.get_max_node_id(
@@ -6,12 +6,12 @@ import numpy as np
 import json
 import time
 import collections
-from functools import lru_cache
-import datetime
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 import pytz
 import cloudvolume
-from scipy import ndimage, sparse
-import networkx as nx
+from scipy import sparse
+from scipy.sparse import csgraph
 
 from multiwrapper import multiprocessing_utils as mu
 from cloudvolume import Storage, EmptyVolumeException
@@ -19,6 +19,7 @@ from cloudvolume.lib import Vec
 import DracoPy
 import zmesh
 import fastremap
+import cc3d
 import time
 
 sys.path.insert(0, os.path.join(sys.path[0], "../.."))
@@ -26,8 +27,11 @@ os.environ["TRAVIS_BRANCH"] = "IDONTKNOWWHYINEEDTHIS"
 UTC = pytz.UTC
 
 from pychunkedgraph.backend import chunkedgraph  # noqa
+from pychunkedgraph.backend import chunkedgraph_exceptions as cg_exceptions  # noqa
 from pychunkedgraph.backend.utils import serializers, column_keys  # noqa
 from pychunkedgraph.meshing import meshgen_utils  # noqa
+from pychunkedgraph.meshing.fragment_cache import get_fragment_cache  # noqa
+from pychunkedgraph.meshing.remapping_cache import get_remapping_cache  # noqa
 
 # Change below to true if debugging and want to see results in stdout
 PRINT_FOR_DEBUGGING = False
@@ -57,25 +61,8 @@ def decode_draco_mesh_buffer(fragment):
     }
 
 
-def get_remapped_segmentation(
-    cg, chunk_id, mip=2, overlap_vx=1, time_stamp=None, n_threads=1
-):
-    """ Downloads + remaps ws segmentation + resolve unclear cases
-
-    :param cg: chunkedgraph object
-    :param chunk_id: np.uint64
-    :param mip: int
-    :param overlap_vx: int
-    :param time_stamp:
-    :return: remapped segmentation
-    """
-    assert mip >= cg.cv.mip
-
-    sv_remapping, unsafe_dict = get_lx_overlapping_remappings(
-        cg, chunk_id, time_stamp=time_stamp, n_threads=n_threads
-    )
-
-    cv = cloudvolume.CloudVolume(cg.cv.cloudpath, mip=mip)
+def _get_chunk_ws_segmentation(cg, chunk_id, mip, overlap_vx):
+    """ Downloads ws segmentation of a chunk with overlap in positive direction """
     mip_diff = mip - cg.cv.mip
 
     mip_chunk_size = cg.chunk_size.astype(np.int) / np.array(
@@ -88,135 +75,144 @@ def get_remapped_segmentation(
         + cg.get_chunk_coordinates(chunk_id) * mip_chunk_size
     )
     chunk_end = chunk_start + mip_chunk_size + overlap_vx
-    chunk_end = Vec.clamp(
-        chunk_end,
-        cg.cv.mip_voxel_offset(mip),
-        cg.cv.mip_voxel_offset(mip) + cg.cv.mip_volume_size(mip),
-    )
+    # blocks are shared between remeshing tasks of the same chunk
+    return cg.get_ws_block_cache(mip).cutout(chunk_start, chunk_end)
 
-    ws_seg = cv[
-        chunk_start[0] : chunk_end[0],
-        chunk_start[1] : chunk_end[1],
-        chunk_start[2] : chunk_end[2],
-    ].squeeze()
 
-    seg = fastremap.mask_except(ws_seg, list(sv_remapping.keys()), in_place=False)
-    fastremap.remap(seg, sv_remapping, preserve_missing_labels=True, in_place=True)
+def _get_inner_faces(seg):
+    """ Last voxel plane inside the chunk, adjacent to the overlap planes """
+    return np.concatenate((seg[-2, :, :], seg[:, -2, :], seg[:, :, -2]), axis=None)
 
-    for unsafe_root_id in unsafe_dict.keys():
-        bin_seg = seg == unsafe_root_id
-
-        if np.sum(bin_seg) == 0:
-            continue
 
-        l2_edges = []
-        cc_seg, n_cc = ndimage.label(bin_seg)
-        for i_cc in range(1, n_cc + 1):
-            bin_cc_seg = cc_seg == i_cc
-
-            overlaps = []
-            overlaps.extend(np.unique(seg[-2, :, :][bin_cc_seg[-1, :, :]]))
-            overlaps.extend(np.unique(seg[:, -2, :][bin_cc_seg[:, -1, :]]))
-            overlaps.extend(np.unique(seg[:, :, -2][bin_cc_seg[:, :, -1]]))
-            overlaps = np.unique(overlaps)
-
-            linked_l2_ids = overlaps[np.in1d(overlaps, unsafe_dict[unsafe_root_id])]
-
-            if len(linked_l2_ids) == 0:
-                seg[bin_cc_seg] = 0
-            elif len(linked_l2_ids) == 1:
-                seg[bin_cc_seg] = linked_l2_ids[0]
-            else:
-                seg[bin_cc_seg] = linked_l2_ids[0]
-
-                for i_l2_id in range(len(linked_l2_ids) - 1):
-                    for j_l2_id in range(i_l2_id + 1, len(linked_l2_ids)):
-                        l2_edges.append(
-                            [linked_l2_ids[i_l2_id], linked_l2_ids[j_l2_id]]
-                        )
+def _get_overlap_faces(seg):
+    return np.concatenate((seg[-1, :, :], seg[:, -1, :], seg[:, :, -1]), axis=None)
 
-        if len(l2_edges) > 0:
-            g = nx.Graph()
-            g.add_edges_from(l2_edges)
 
-            ccs = nx.connected_components(g)
+def resolve_unsafe_roots(seg, unsafe_dict):
+    """ Assigns voxels of unsafe roots (roots with more than one l2 node in
+        the chunk) to the l2 node they are connected to across the chunk
+        boundary. Connected components of an unsafe root that do not touch
+        one of its l2 nodes are removed, l2 nodes connected through the same
+        component are merged (to the smallest id).
 
-            for cc in ccs:
-                cc_ids = np.sort(list(cc))
-                seg[np.in1d(seg, cc_ids[1:]).reshape(seg.shape)] = cc_ids[0]
+        All unsafe roots are labeled in a single connected components pass
+        and linked to l2 nodes with one lookup on the boundary planes.
 
+    :param seg: remapped segmentation, modified in place
+    :param unsafe_dict: dict, unsafe root id -> l2 ids
+    :return: seg
+    """
+    if len(unsafe_dict) == 0:
+        return seg
+
+    unsafe_root_ids = np.array(list(unsafe_dict.keys()), dtype=np.uint64)
+    unsafe_seg = fastremap.mask_except(seg, list(unsafe_root_ids), in_place=False)
+    # different labels are never connected
+    cc_seg = cc3d.connected_components(unsafe_seg, connectivity=6)
+    n_cc = int(cc_seg.max())
+    if n_cc == 0:
+        return seg
+
+    cc_roots = np.zeros(n_cc + 1, dtype=np.uint64)
+    for cc_id, root_id in fastremap.component_map(cc_seg, unsafe_seg).items():
+        cc_roots[cc_id] = root_id
+    del unsafe_seg
+
+    # (component, l2 id) pairs across the boundary
+    cc_faces = _get_overlap_faces(cc_seg).astype(np.uint64)
+    inner_faces = _get_inner_faces(seg).astype(np.uint64)
+    face_mask = (cc_faces > 0) & (inner_faces > 0)
+    pairs = np.unique(
+        np.stack([cc_faces[face_mask], inner_faces[face_mask]], axis=1), axis=0
+    ).reshape(-1, 2)
+
+    # keep pairs where the l2 id belongs to the component's root
+    l2_ids = [np.asarray(unsafe_dict[r], dtype=np.uint64) for r in unsafe_dict]
+    l2_roots = np.repeat(unsafe_root_ids, [len(ids) for ids in l2_ids])
+    l2_ids = np.concatenate(l2_ids) if len(l2_ids) else np.array([], np.uint64)
+    if len(l2_ids) == 0 or len(pairs) == 0:
+        pairs = pairs[:0]
+    else:
+        order = np.argsort(l2_ids)
+        l2_ids, l2_roots = l2_ids[order], l2_roots[order]
+        idx = np.searchsorted(l2_ids, pairs[:, 1]).clip(max=len(l2_ids) - 1)
+        linked = (l2_ids[idx] == pairs[:, 1]) & (l2_roots[idx] == cc_roots[pairs[:, 0]])
+        pairs = pairs[linked]
+
+    # pairs are sorted, assign each component to its smallest linked l2 id
+    cc_l2_ids = np.zeros(n_cc + 1, dtype=np.uint64)
+    linked_ccs, first = np.unique(pairs[:, 0], return_index=True)
+    cc_l2_ids[linked_ccs] = pairs[first, 1]
+
+    l2_remapping = {}
+    l2_edges = np.stack([cc_l2_ids[pairs[:, 0]], pairs[:, 1]], axis=1)
+    l2_edges = l2_edges[l2_edges[:, 0] != l2_edges[:, 1]]
+    if len(l2_edges) > 0:
+        nodes, edges = np.unique(l2_edges, return_inverse=True)
+        edges = edges.reshape(-1, 2)
+        graph = sparse.coo_matrix(
+            (np.ones(len(edges)), (edges[:, 0], edges[:, 1])),
+            shape=(len(nodes), len(nodes)),
+        )
+        _, cc_labels = csgraph.connected_components(graph, directed=False)
+        # nodes are sorted, the first node of each component is its smallest
+        _, first = np.unique(cc_labels, return_index=True)
+        targets = nodes[first][cc_labels]
+        l2_remapping = dict(zip(nodes[nodes != targets], targets[nodes != targets]))
+
+    unsafe_mask = cc_seg > 0
+    seg[unsafe_mask] = cc_l2_ids[cc_seg[unsafe_mask]]
+    if l2_remapping:
+        fastremap.remap(seg, l2_remapping, preserve_missing_labels=True, in_place=True)
     return seg
 
 
-# TODO: refactor (duplicated code with get_remapped_segmentation)
-def get_remapped_seg_for_lvl2_nodes(
+def get_remapped_segmentation(
     cg,
-    chunk_id: np.uint64,
-    lvl2_nodes: Sequence[np.uint64],
-    mip: int = 2,
-    overlap_vx: int = 1,
+    chunk_id,
+    mip=2,
+    overlap_vx=1,
     time_stamp=None,
-    n_threads: int = 1,
+    n_threads=1,
+    lvl2_nodes: Sequence[np.uint64] = None,
 ):
-    """ Downloads + remaps ws segmentation + resolve unclear cases, filter out all but specified lvl2_nodes
+    """ Downloads + remaps ws segmentation + resolve unclear cases
 
     :param cg: chunkedgraph object
     :param chunk_id: np.uint64
     :param mip: int
     :param overlap_vx: int
     :param time_stamp:
+    :param lvl2_nodes: list of np.uint64 or None
+        filter out all but the specified lvl2 nodes
     :return: remapped segmentation
     """
-    # Determine the segmentation bounding box to download given cg, chunk_id, and mip. Then download
-    cv = cloudvolume.CloudVolume(cg.cv.cloudpath, mip=mip)
-    mip_diff = mip - cg.cv.mip
-
-    mip_chunk_size = cg.chunk_size.astype(np.int) / np.array(
-        [2 ** mip_diff, 2 ** mip_diff, 1]
-    )
-    mip_chunk_size = mip_chunk_size.astype(np.int)
-
-    chunk_start = (
-        cg.cv.mip_voxel_offset(mip)
-        + cg.get_chunk_coordinates(chunk_id) * mip_chunk_size
-    )
-    chunk_end = chunk_start + mip_chunk_size + overlap_vx
-    chunk_end = Vec.clamp(
-        chunk_end,
-        cg.cv.mip_voxel_offset(mip),
-        cg.cv.mip_voxel_offset(mip) + cg.cv.mip_volume_size(mip),
-    )
+    assert mip >= cg.cv.mip
 
-    seg = cv[
-        chunk_start[0] : chunk_end[0],
-        chunk_start[1] : chunk_end[1],
-        chunk_start[2] : chunk_end[2],
-    ].squeeze()
+    if lvl2_nodes is None:
+        sv_remapping, unsafe_dict = get_lx_overlapping_remappings(
+            cg, chunk_id, time_stamp=time_stamp, n_threads=n_threads
+        )
+        ws_seg = _get_chunk_ws_segmentation(cg, chunk_id, mip, overlap_vx)
+        seg = fastremap.mask_except(ws_seg, list(sv_remapping.keys()), in_place=False)
+        fastremap.remap(seg, sv_remapping, preserve_missing_labels=True, in_place=True)
+        return resolve_unsafe_roots(seg, unsafe_dict)
 
+    seg = _get_chunk_ws_segmentation(cg, chunk_id, mip, overlap_vx)
     sv_of_lvl2_nodes = cg.get_children(lvl2_nodes)
+    remapping = {
+        sv_id: node for node, sv_list in sv_of_lvl2_nodes.items() for sv_id in sv_list
+    }
+
+    # If a node_id is on the chunk_boundary, we must check the overlap region
+    # to see if the meshes' end will be open or closed
+    sv_ids = np.array(list(remapping.keys()), dtype=np.uint64)
+    sv_nodes = np.array(list(remapping.values()), dtype=np.uint64)
+    on_the_border = np.isin(sv_ids, np.unique(_get_inner_faces(seg)))
+    node_ids_on_the_border = np.unique(sv_nodes[on_the_border])
 
-    # Check which of the lvl2_nodes meet the chunk boundary
-    node_ids_on_the_border = []
-    remapping = {}
-    for node, sv_list in sv_of_lvl2_nodes.items():
-        node_on_the_border = False
-        for sv_id in sv_list:
-            remapping[sv_id] = node
-            # If a node_id is on the chunk_boundary, we must check the overlap region to see if the meshes' end will be open or closed
-            if (not node_on_the_border) and (
-                np.isin(sv_id, seg[-2, :, :])
-                or np.isin(sv_id, seg[:, -2, :])
-                or np.isin(sv_id, seg[:, :, -2])
-            ):
-                node_on_the_border = True
-                node_ids_on_the_border.append(node)
-
-    node_ids_on_the_border = np.array(node_ids_on_the_border)
     if len(node_ids_on_the_border) > 0:
-        overlap_region = np.concatenate(
-            (seg[:, :, -1], seg[:, -1, :], seg[-1, :, :]), axis=None
-        )
-        overlap_sv_ids = np.unique(overlap_region)
+        overlap_sv_ids = np.unique(_get_overlap_faces(seg))
         if overlap_sv_ids[0] == 0:
             overlap_sv_ids = overlap_sv_ids[1:]
         # Get the remappings for the supervoxels in the overlap region
@@ -226,58 +222,47 @@ def get_remapped_seg_for_lvl2_nodes(
         sv_remapping.update(remapping)
         fastremap.mask_except(seg, list(sv_remapping.keys()), in_place=True)
         fastremap.remap(seg, sv_remapping, preserve_missing_labels=True, in_place=True)
-        # For some supervoxel, they could map to multiple l2 nodes in the chunk, so we must perform a connected component analysis
-        # to see which l2 node they are adjacent to
-        for unsafe_root_id in unsafe_dict.keys():
-            bin_seg = seg == unsafe_root_id
-
-            if np.sum(bin_seg) == 0:
-                continue
-
-            l2_edges = []
-            cc_seg, n_cc = ndimage.label(bin_seg)
-            for i_cc in range(1, n_cc + 1):
-                bin_cc_seg = cc_seg == i_cc
-
-                overlaps = []
-                overlaps.extend(np.unique(seg[-2, :, :][bin_cc_seg[-1, :, :]]))
-                overlaps.extend(np.unique(seg[:, -2, :][bin_cc_seg[:, -1, :]]))
-                overlaps.extend(np.unique(seg[:, :, -2][bin_cc_seg[:, :, -1]]))
-                overlaps = np.unique(overlaps)
-
-                linked_l2_ids = overlaps[np.in1d(overlaps, unsafe_dict[unsafe_root_id])]
-
-                if len(linked_l2_ids) == 0:
-                    seg[bin_cc_seg] = 0
-                elif len(linked_l2_ids) == 1:
-                    seg[bin_cc_seg] = linked_l2_ids[0]
-                else:
-                    seg[bin_cc_seg] = linked_l2_ids[0]
-
-                    for i_l2_id in range(len(linked_l2_ids) - 1):
-                        for j_l2_id in range(i_l2_id + 1, len(linked_l2_ids)):
-                            l2_edges.append(
-                                [linked_l2_ids[i_l2_id], linked_l2_ids[j_l2_id]]
-                            )
-
-            if len(l2_edges) > 0:
-                g = nx.Graph()
-                g.add_edges_from(l2_edges)
-
-                ccs = nx.connected_components(g)
-
-                for cc in ccs:
-                    cc_ids = np.sort(list(cc))
-                    seg[np.in1d(seg, cc_ids[1:]).reshape(seg.shape)] = cc_ids[0]
+        # Some supervoxels could map to multiple l2 nodes in the chunk,
+        # resolve them by the l2 node they are adjacent to
+        resolve_unsafe_roots(seg, unsafe_dict)
     else:
-        # If no nodes in our subset meet the chunk boundary we can simply retrieve the sv of the nodes in the subset
+        # If no nodes in our subset meet the chunk boundary we can simply
+        # retrieve the sv of the nodes in the subset
         fastremap.mask_except(seg, list(remapping.keys()), in_place=True)
         fastremap.remap(seg, remapping, preserve_missing_labels=True, in_place=True)
 
     return seg
 
 
-@lru_cache(maxsize=None)
+def get_remapped_seg_for_lvl2_nodes(
+    cg,
+    chunk_id: np.uint64,
+    lvl2_nodes: Sequence[np.uint64],
+    mip: int = 2,
+    overlap_vx: int = 1,
+    time_stamp=None,
+    n_threads: int = 1,
+):
+    """ Downloads + remaps ws segmentation + resolve unclear cases, filter out all but specified lvl2_nodes
+
+    :param cg: chunkedgraph object
+    :param chunk_id: np.uint64
+    :param mip: int
+    :param overlap_vx: int
+    :param time_stamp:
+    :return: remapped segmentation
+    """
+    return get_remapped_segmentation(
+        cg,
+        chunk_id,
+        mip=mip,
+        overlap_vx=overlap_vx,
+        time_stamp=time_stamp,
+        n_threads=n_threads,
+        lvl2_nodes=lvl2_nodes,
+    )
+
+
 def get_higher_to_lower_remapping(cg, chunk_id, time_stamp):
     """ Retrieves lx node id to sv id mappping
 
@@ -286,6 +271,13 @@ def get_higher_to_lower_remapping(cg, chunk_id, time_stamp):
     :param time_stamp: datetime object
     :return: dictionary
     """
+    remapping_cache = get_remapping_cache()
+    cache_key = remapping_cache.get_key(
+        cg, "higher_to_lower", chunk_id, cg.get_chunk_layer(chunk_id), time_stamp
+    )
+    lx_remapping = remapping_cache.get(cache_key)
+    if lx_remapping is not None:
+        return lx_remapping
 
     def _lower_remaps(ks):
         return np.concatenate([lower_remaps[k] for k in ks])
@@ -329,10 +321,10 @@ def get_higher_to_lower_remapping(cg, chunk_id, time_stamp):
         else:
             lx_remapping[k] = this_child_ids
 
+    remapping_cache.put(cache_key, lx_remapping)
     return lx_remapping
 
 
-@lru_cache(maxsize=None)
 def get_root_lx_remapping(cg, chunk_id, stop_layer, time_stamp, n_threads=1):
     """ Retrieves root to l2 node id mapping
 
@@ -342,6 +334,13 @@ def get_root_lx_remapping(cg, chunk_id, stop_layer, time_stamp, n_threads=1):
     :param time_stamp: datetime object
     :return: multiples
     """
+    remapping_cache = get_remapping_cache()
+    cache_key = remapping_cache.get_key(
+        cg, "root_lx", chunk_id, stop_layer, time_stamp
+    )
+    cached = remapping_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
     def _get_root_ids(args):
         start_id, end_id = args
@@ -363,10 +362,11 @@ def get_root_lx_remapping(cg, chunk_id, stop_layer, time_stamp, n_threads=1):
     if n_jobs > 0:
         mu.multithread_func(_get_root_ids, multi_args, n_threads=n_threads)
 
-    return lx_ids, np.array(root_ids), lx_id_remap
+    result = lx_ids, np.array(root_ids), lx_id_remap
+    remapping_cache.put(cache_key, result)
+    return result
 
 
-# @lru_cache(maxsize=None)
 def get_lx_overlapping_remappings(cg, chunk_id, time_stamp=None, n_threads=1):
     """ Retrieves sv id to layer mapping for chunk with overlap in positive
         direction (one chunk)
@@ -376,10 +376,8 @@ def get_lx_overlapping_remappings(cg, chunk_id, time_stamp=None, n_threads=1):
     :param time_stamp: datetime object
     :return: multiples
     """
-    if time_stamp is None:
-        time_stamp = datetime.datetime.utcnow()
-
-    if time_stamp.tzinfo is None:
+    # None is passed on, remappings of "now" are not cached
+    if time_stamp is not None and time_stamp.tzinfo is None:
         time_stamp = UTC.localize(time_stamp)
 
     chunk_coords = cg.get_chunk_coordinates(chunk_id)
@@ -560,10 +558,8 @@ def get_lx_overlapping_remappings_for_nodes_and_svs(
     :param n_threads: int
     :return: multiples
     """
-    if time_stamp is None:
-        time_stamp = datetime.datetime.utcnow()
-
-    if time_stamp.tzinfo is None:
+    # None is passed on, remappings of "now" are not cached
+    if time_stamp is not None and time_stamp.tzinfo is None:
         time_stamp = UTC.localize(time_stamp)
 
     chunk_coords = cg.get_chunk_coordinates(chunk_id)
@@ -796,6 +792,28 @@ def transform_draco_fragment_and_return_encoding_options(
     return cur_encoding_settings
 
 
+def _get_unique_vertices(vertices):
+    """ Finds duplicate vertices by hashing their integer coordinates
+
+    :return: index of the first occurrence of each unique vertex and
+        the inverse mapping of all vertices to them
+    """
+    coords = np.round(vertices).astype(np.int64)
+    coords -= coords.min(axis=0)
+    try:
+        vertex_keys = np.ravel_multi_index(coords.T, coords.max(axis=0) + 1)
+    except ValueError:
+        # coordinate range too large to hash into int64
+        _, unique_index, inverse = np.unique(
+            coords, return_index=True, return_inverse=True, axis=0
+        )
+        return unique_index, inverse.reshape(-1)
+    _, unique_index, inverse = np.unique(
+        vertex_keys, return_index=True, return_inverse=True
+    )
+    return unique_index, inverse.reshape(-1)
+
+
 def merge_draco_meshes_across_boundaries(cg, fragments, chunk_id, mip, high_padding):
     """
     Merge a list of draco mesh fragments, removing duplicate vertices that lie
@@ -841,39 +859,27 @@ def merge_draco_meshes_across_boundaries(cg, fragments, chunk_id, mip, high_padd
         )
         # Separate the vertices that are on the quantized chunk boundary from those that aren't
         are_chunk_aligned = (vertices == quantized_chunk_boundary).any(axis=1)
-        vertices = np.hstack((vertices, np.arange(vertexct[-1])[:, np.newaxis]))
+        n_not_chunk_aligned = int(np.sum(~are_chunk_aligned))
+        vertex_remapping = np.empty(vertexct[-1], dtype=np.uint32)
+        # Those that are not simply pass through
+        vertex_remapping[~are_chunk_aligned] = np.arange(
+            n_not_chunk_aligned, dtype=np.uint32
+        )
+        # Those that are on the boundary we remove duplicates. Quantization
+        # origins and bin sizes are whole nm, so are the vertex coordinates.
         chunk_aligned = vertices[are_chunk_aligned]
-        not_chunk_aligned = vertices[~are_chunk_aligned]
-        del vertices
-        del are_chunk_aligned
-        faces_remapping = {}
-        # Those that are not simply pass through (simple remap)
-        if len(not_chunk_aligned) > 0:
-            not_chunk_aligned_remap = dict(
-                zip(
-                    not_chunk_aligned[:, 3].astype(np.uint32),
-                    np.arange(len(not_chunk_aligned), dtype=np.uint32),
-                )
-            )
-            faces_remapping.update(not_chunk_aligned_remap)
-        # Those that are on the boundary we remove duplicates
         if len(chunk_aligned) > 0:
-            unique_chunk_aligned, inverse_to_chunk_aligned = np.unique(
-                chunk_aligned[:, 0:3], return_inverse=True, axis=0
+            unique_index, inverse = _get_unique_vertices(chunk_aligned)
+            vertex_remapping[are_chunk_aligned] = n_not_chunk_aligned + inverse.astype(
+                np.uint32
             )
-            chunk_aligned_remap = dict(
-                zip(
-                    chunk_aligned[:, 3].astype(np.uint32),
-                    np.uint32(len(not_chunk_aligned))
-                    + inverse_to_chunk_aligned.astype(np.uint32),
-                )
+            vertices = np.concatenate(
+                (vertices[~are_chunk_aligned], chunk_aligned[unique_index])
             )
-            faces_remapping.update(chunk_aligned_remap)
-            vertices = np.concatenate((not_chunk_aligned[:, 0:3], unique_chunk_aligned))
         else:
-            vertices = not_chunk_aligned[:, 0:3]
+            vertices = vertices[~are_chunk_aligned]
         # Remap the faces to their new vertex indices
-        fastremap.remap(faces, faces_remapping, in_place=True)
+        faces = vertex_remapping[faces]
 
     return {
         "num_vertices": np.uint32(len(vertices)),
@@ -937,6 +943,9 @@ def remeshing(
             l2_chunk_dict[chunk_id].add(node_id)
 
     add_nodes_to_l2_chunk_dict(l2_node_ids)
+    # the hierarchy of these chunks (and chunks sharing parents) changed
+    remapping_cache = get_remapping_cache()
+    remapping_cache.invalidate(cg, list(l2_chunk_dict.keys()))
     for chunk_id, node_ids in l2_chunk_dict.items():
         if PRINT_FOR_DEBUGGING:
             print("remeshing", chunk_id, node_ids)
@@ -980,6 +989,146 @@ def remeshing(
                 node_id_subset=node_ids,
                 cg=cg,
             )
+    if PRINT_FOR_DEBUGGING:
+        print("remapping cache", remapping_cache.stats)
+
+
+def merge_and_encode_fragments(
+    cg, new_fragment_id, fragments, layer, mip, chunk_id, high_padding
+):
+    """ Decodes the draco fragments of the children of a node, merges them
+        and encodes the merged fragment
+
+    :param fragments: list of dicts as returned by Storage.get_files
+    :return: new_fragment_id, encoded fragment (None if failed), messages
+    """
+    messages = []
+    old_fragments = []
+    missing_fragments = False
+    new_fragment_str = new_fragment_id[0 : new_fragment_id.find(":")]
+    for fragment in fragments:
+        filename = fragment["filename"]
+        end_of_node_id_index = filename.find(":")
+        if end_of_node_id_index == -1:
+            print(
+                f"Unexpected filename {filename}. Filenames expected in format "
+                f"'{{node_id}}:{{lod}}:{{bbox}}' like {new_fragment_id}"
+            )
+            missing_fragments = True
+        node_id_str = filename[:end_of_node_id_index]
+        if fragment["content"] is not None and fragment["error"] is None:
+            try:
+                old_fragments.append(
+                    {
+                        "mesh": decode_draco_mesh_buffer(fragment["content"]),
+                        "node_id": np.uint64(node_id_str),
+                    }
+                )
+            except:
+                missing_fragments = True
+                messages.append(
+                    f"Decoding failed for {node_id_str} in {new_fragment_str}"
+                )
+        elif cg.get_chunk_layer(np.uint64(node_id_str)) > 2:
+            messages.append(f"{filename} missing for {new_fragment_id}")
+
+    if len(old_fragments) == 0 or missing_fragments:
+        messages.append(f"No meshes for {new_fragment_id}")
+        return new_fragment_id, None, messages
+
+    draco_encoding_options = None
+    for old_fragment in old_fragments:
+        if draco_encoding_options is None:
+            draco_encoding_options = transform_draco_fragment_and_return_encoding_options(
+                cg, old_fragment, layer, mip, chunk_id
+            )
+        else:
+            encoding_options_for_fragment = transform_draco_fragment_and_return_encoding_options(
+                cg, old_fragment, layer, mip, chunk_id
+            )
+            np.testing.assert_equal(
+                draco_encoding_options["quantization_bits"],
+                encoding_options_for_fragment["quantization_bits"],
+            )
+            np.testing.assert_equal(
+                draco_encoding_options["quantization_range"],
+                encoding_options_for_fragment["quantization_range"],
+            )
+            np.testing.assert_array_equal(
+                draco_encoding_options["quantization_origin"],
+                encoding_options_for_fragment["quantization_origin"],
+            )
+
+    new_fragment = merge_draco_meshes_across_boundaries(
+        cg, old_fragments, chunk_id, mip, high_padding
+    )
+
+    try:
+        new_fragment_b = DracoPy.encode_mesh_to_buffer(
+            new_fragment["vertices"], new_fragment["faces"], **draco_encoding_options
+        )
+    except:
+        messages.append(
+            f'Bad mesh created for {new_fragment_str}: {len(new_fragment["vertices"])} vertices, {len(new_fragment["faces"])} faces'
+        )
+        return new_fragment_id, None, messages
+    return new_fragment_id, new_fragment_b, messages
+
+
+def _get_fragment_batches(multi_child_nodes, fragment_batch_size=None):
+    """ Splits new fragment ids into batches with at most fragment_batch_size
+        child fragments (at least one node per batch) """
+    if fragment_batch_size is None:
+        return [list(multi_child_nodes.keys())]
+    batches = [[]]
+    n_fragments = 0
+    for new_fragment_id, child_fragments in multi_child_nodes.items():
+        if batches[-1] and n_fragments + len(child_fragments) > fragment_batch_size:
+            batches.append([])
+            n_fragments = 0
+        batches[-1].append(new_fragment_id)
+        n_fragments += len(child_fragments)
+    return batches
+
+
+_merge_worker_cg = None
+
+
+def _init_merge_worker(cg_info):
+    global _merge_worker_cg
+    _merge_worker_cg = chunkedgraph.ChunkedGraph(**cg_info)
+
+
+def _merge_and_encode_fragments_worker(args):
+    return merge_and_encode_fragments(_merge_worker_cg, *args)
+
+
+@contextmanager
+def _get_merge_pool(cg_info, n_processes):
+    """ Process pool of a single mesh task, None if n_processes <= 1.
+        The pool is shut down with the task, rq work horses exit without
+        cleaning up and would leave its workers behind. Workers are only
+        started when fragments are merged in the pool. """
+    if n_processes <= 1:
+        yield None
+        return
+    with ProcessPoolExecutor(
+        max_workers=n_processes,
+        initializer=_init_merge_worker,
+        initargs=(cg_info,),
+    ) as pool:
+        yield pool
+
+
+def _merge_fragments(pool, cg, merge_args, n_processes):
+    """ Runs merge_and_encode_fragments for all merge_args, in `pool`
+        if there is one """
+    if pool is None or len(merge_args) <= 1:
+        return [merge_and_encode_fragments(cg, *args) for args in merge_args]
+    chunksize = max(1, len(merge_args) // (4 * n_processes))
+    return pool.map(
+        _merge_and_encode_fragments_worker, merge_args, chunksize=chunksize
+    )
 
 
 REDIS_HOST = os.environ.get("REDIS_SERVICE_HOST", "localhost")
@@ -1004,10 +1153,24 @@ def chunk_mesh_task_new_remapping(
     fragment_batch_size=None,
     node_id_subset=None,
     cg=None,
+    n_processes=None,
+    raise_on_failure=False,
 ):
+    """ Creates the mesh fragments of a chunk
+
+    :param raise_on_failure: raise a PostconditionError after writing the
+        successful fragments if any fragment of the chunk failed
+    :return: str, summary and failure messages
+    """
     if cg is None:
         cg = chunkedgraph.ChunkedGraph(**cg_info)
+    if n_processes is None:
+        # layer 3+ fragments are merged in a process pool with this many workers
+        n_processes = int(os.environ.get("MESH_MERGE_PROCESSES", 1))
     mesh_path = mesh_path or cg.cv_mesh_path
+    fragment_cache = get_fragment_cache()
+    written_node_ids = []
+    failed_node_ids = []
     result = []
 
     layer, _, chunk_offset = get_meshing_necessities_from_graph(cg, chunk_id, mip)
@@ -1068,18 +1231,23 @@ def chunk_mesh_task_new_remapping(
                         result.append(
                             f"{obj_id} failed: {len(mesh.vertices)} vertices, {len(mesh.faces)} faces"
                         )
+                        failed_node_ids.append(obj_id)
                         continue
                     compress = False
                 else:
                     file_contents = mesh.to_precomputed()
                     compress = True
                 if WRITING_TO_CLOUD:
+                    mesh_name = meshgen_utils.get_mesh_name(cg, obj_id)
                     storage.put_file(
-                        file_path=f"{meshgen_utils.get_mesh_name(cg, obj_id)}",
+                        file_path=mesh_name,
                         content=file_contents,
                         compress=compress,
                         cache_control="no-cache",
                     )
+                    if encoding == "draco":
+                        fragment_cache.put(f"{mesh_path}/{mesh_name}", file_contents)
+                    written_node_ids.append(obj_id)
     else:
         # For each node with more than one child, create a new fragment by
         # merging the mesh fragments of the children.
@@ -1147,135 +1315,60 @@ def chunk_mesh_task_new_remapping(
             print("Nothing to do", cx, cy, cz)
             return ", ".join(str(x) for x in result)
 
-        with Storage(mesh_path) as storage:
-            vals = multi_child_nodes.values()
-            fragment_to_fetch = [
-                fragment for child_fragments in vals for fragment in child_fragments
-            ]
-            if fragment_batch_size is None:
-                files_contents = storage.get_files(fragment_to_fetch)
-            else:
-                files_contents = storage.get_files(
-                    fragment_to_fetch[0:fragment_batch_size]
-                )
-                fragments_in_batch_processed = 0
-                batches_processed = 0
-                num_fragments_processed = 0
-            fragment_map = {}
-            for i in range(len(files_contents)):
-                fragment_map[files_contents[i]["filename"]] = files_contents[i]
-            i = 0
-            for new_fragment_id, fragment_ids_to_fetch in multi_child_nodes.items():
-                i += 1
-                if i % max(1, len(multi_child_nodes) // 10) == 0:
-                    print(f"{i}/{len(multi_child_nodes)}")
-
-                old_fragments = []
-                missing_fragments = False
-                for fragment_id in fragment_ids_to_fetch:
-                    if fragment_batch_size is not None:
-                        fragments_in_batch_processed += 1
-                        if fragments_in_batch_processed > fragment_batch_size:
-                            fragments_in_batch_processed = 1
-                            batches_processed += 1
-                            num_fragments_processed = (
-                                batches_processed * fragment_batch_size
-                            )
-                            files_contents = storage.get_files(
-                                fragment_to_fetch[
-                                    num_fragments_processed : num_fragments_processed
-                                    + fragment_batch_size
-                                ]
-                            )
-                            fragment_map = {}
-                            for j in range(len(files_contents)):
-                                fragment_map[
-                                    files_contents[j]["filename"]
-                                ] = files_contents[j]
-                    fragment = fragment_map[fragment_id]
-                    filename = fragment["filename"]
-                    end_of_node_id_index = filename.find(":")
-                    if end_of_node_id_index == -1:
-                        print(
-                            f"Unexpected filename {filename}. Filenames expected in format '\{node_id}:\{lod}:\{meshgen_utils.get_chunk_bbox_str(cg, node_id)}'"
-                        )
-                        missing_fragments = True
-                    node_id_str = filename[:end_of_node_id_index]
-                    if fragment["content"] is not None and fragment["error"] is None:
-                        try:
-                            old_fragments.append(
-                                {
-                                    "mesh": decode_draco_mesh_buffer(
-                                        fragment["content"]
-                                    ),
-                                    "node_id": np.uint64(node_id_str),
-                                }
-                            )
-                        except:
-                            missing_fragments = True
-                            new_fragment_str = new_fragment_id[
-                                0 : new_fragment_id.find(":")
-                            ]
-                            result.append(
-                                f"Decoding failed for {node_id_str} in {new_fragment_str}"
-                            )
-                    elif cg.get_chunk_layer(np.uint64(node_id_str)) > 2:
-                        result.append(f"{fragment_id} missing for {new_fragment_id}")
-
-                if len(old_fragments) == 0 or missing_fragments:
-                    result.append(f"No meshes for {new_fragment_id}")
-                    continue
-
-                draco_encoding_options = None
-                for old_fragment in old_fragments:
-                    if draco_encoding_options is None:
-                        draco_encoding_options = transform_draco_fragment_and_return_encoding_options(
-                            cg, old_fragment, layer, mip, chunk_id
-                        )
-                    else:
-                        encoding_options_for_fragment = transform_draco_fragment_and_return_encoding_options(
-                            cg, old_fragment, layer, mip, chunk_id
-                        )
-                        np.testing.assert_equal(
-                            draco_encoding_options["quantization_bits"],
-                            encoding_options_for_fragment["quantization_bits"],
-                        )
-                        np.testing.assert_equal(
-                            draco_encoding_options["quantization_range"],
-                            encoding_options_for_fragment["quantization_range"],
-                        )
-                        np.testing.assert_array_equal(
-                            draco_encoding_options["quantization_origin"],
-                            encoding_options_for_fragment["quantization_origin"],
-                        )
-
-                new_fragment = merge_draco_meshes_across_boundaries(
-                    cg, old_fragments, chunk_id, mip, high_padding
+        merge_pool = _get_merge_pool(cg_info or cg.get_serialized_info(), n_processes)
+        with Storage(mesh_path) as storage, merge_pool as merge_pool:
+            batches = _get_fragment_batches(multi_child_nodes, fragment_batch_size)
+            n_done = 0
+            for batch in batches:
+                fragment_to_fetch = [
+                    fragment
+                    for new_fragment_id in batch
+                    for fragment in multi_child_nodes[new_fragment_id]
+                ]
+                files_contents = fragment_cache.get_files(
+                    storage, mesh_path, fragment_to_fetch
                 )
+                fragment_map = {}
+                for file_contents in files_contents:
+                    fragment_map[file_contents["filename"]] = file_contents
 
-                try:
-                    new_fragment_b = DracoPy.encode_mesh_to_buffer(
-                        new_fragment["vertices"],
-                        new_fragment["faces"],
-                        **draco_encoding_options,
-                    )
-                except:
-                    new_fragment_str = new_fragment_id[0 : new_fragment_id.find(":")]
-                    result.append(
-                        f'Bad mesh created for {new_fragment_str}: {len(new_fragment["vertices"])} vertices, {len(new_fragment["faces"])} faces'
-                    )
-                    continue
-
-                if WRITING_TO_CLOUD:
-                    storage.put_file(
+                merge_args = [
+                    (
                         new_fragment_id,
-                        new_fragment_b,
-                        content_type="application/octet-stream",
-                        compress=False,
-                        cache_control="no-cache",
+                        [fragment_map[f] for f in multi_child_nodes[new_fragment_id]],
+                        layer,
+                        mip,
+                        chunk_id,
+                        high_padding,
                     )
+                    for new_fragment_id in batch
+                ]
+                merged = _merge_fragments(merge_pool, cg, merge_args, n_processes)
+                for new_fragment_id, new_fragment_b, messages in merged:
+                    result.extend(messages)
+                    if new_fragment_b is None:
+                        failed_node_ids.append(new_fragment_id.split(":")[0])
+                        continue
+                    if WRITING_TO_CLOUD:
+                        storage.put_file(
+                            new_fragment_id,
+                            new_fragment_b,
+                            content_type="application/octet-stream",
+                            compress=False,
+                            cache_control="no-cache",
+                        )
+                        fragment_cache.put(f"{mesh_path}/{new_fragment_id}", new_fragment_b)
+                        written_node_ids.append(np.uint64(new_fragment_id.split(":")[0]))
+                n_done += len(batch)
+                print(f"{n_done}/{len(multi_child_nodes)}")
 
+    meshgen_utils.record_mesh_fragments(cg, written_node_ids, mesh_path)
     if PRINT_FOR_DEBUGGING:
         print(", ".join(str(x) for x in result))
+    if raise_on_failure and failed_node_ids:
+        raise cg_exceptions.PostconditionError(
+            f"{len(failed_node_ids)} fragments of chunk {chunk_id} failed: "
+            + ", ".join(str(x) for x in result)
+        )
     return ", ".join(str(x) for x in result)
 
@@ -7,6 +7,7 @@ from cloudvolume import CloudVolume, Storage
 from typing import Sequence
 
 from pychunkedgraph.backend import chunkedgraph  # noqa
+from pychunkedgraph.backend.utils import column_keys, serializers  # noqa
 
 
 def str_to_slice(slice_str: str):
@@ -119,6 +120,64 @@ def get_downstream_multi_child_nodes(cg, node_ids: Sequence[np.uint64], require_
     return recursive_helper(node_ids)
 
 
+def record_mesh_fragments(cg, node_ids: Sequence[np.uint64], mesh_path: str = None):
+    """ Records that fragments of node_ids exist in mesh_path, so that
+        existence checks do not need to query the storage
+
+    :param cg: chunkedgraph instance
+    :param node_ids: list of uint64
+    :param mesh_path: str (default: cg.cv_mesh_path)
+    """
+    mesh_path = mesh_path or cg.cv_mesh_path
+    rows = [
+        cg.mutate_row(
+            serializers.serialize_uint64(node_id),
+            {column_keys.Mesh.FragmentPath: mesh_path},
+        )
+        for node_id in node_ids
+    ]
+    if rows:
+        cg.bulk_write(rows, slow_retry=False)
+
+
+def get_mesh_existence(cg, node_ids: Sequence[np.uint64], stor=None) -> dict:
+    """ Checks whether fragments of node_ids exist in cg.cv_mesh_path.
+        Nodes recorded with `record_mesh_fragments` are answered with a
+        single batched read, only the remaining ones are checked on the
+        storage. Nothing is written, fragments are recorded when they are
+        meshed.
+
+    :param cg: chunkedgraph instance
+    :param node_ids: list of uint64
+    :param stor: Storage of cg.cv_mesh_path or None
+    :return: dict node_id -> bool
+    """
+    mesh_path = cg.cv_mesh_path
+    node_ids = np.array(node_ids, dtype=np.uint64)
+    if len(node_ids) == 0:
+        return {}
+    rows = cg.read_node_id_rows(
+        node_ids=node_ids, columns=column_keys.Mesh.FragmentPath
+    )
+    existence = {}
+    for node_id in node_ids:
+        cells = rows.get(node_id, [])
+        if any(cell.value == mesh_path for cell in cells):
+            existence[node_id] = True
+
+    unknown_ids = [node_id for node_id in node_ids if not node_id in existence]
+    if unknown_ids:
+        filenames = {get_mesh_name(cg, node_id): node_id for node_id in unknown_ids}
+        if stor is None:
+            with Storage(mesh_path) as stor:
+                existence_dict = stor.files_exist(list(filenames.keys()))
+        else:
+            existence_dict = stor.files_exist(list(filenames.keys()))
+        for filename, exists in existence_dict.items():
+            existence[filenames[filename]] = exists
+    return existence
+
+
 def get_highest_child_nodes_with_meshes(
     cg,
     node_id: np.uint64,
@@ -127,7 +186,15 @@ def get_highest_child_nodes_with_meshes(
     verify_existence=False,
     bounding_box=None,
     flexible_start_layer=None,
+    return_n_missing=False,
 ):
+    """ Returns the highest children of node_id that have a mesh
+
+    :param return_n_missing: bool
+        also return the number of nodes at stop_layer without mesh
+        (only counted with verify_existence)
+    """
+    n_missing = 0
     if flexible_start_layer is not None:
         # Get highest children that are at flexible_start_layer or below
         # (do this because of skip connections)
@@ -146,20 +213,18 @@ def get_highest_child_nodes_with_meshes(
         valid_node_ids = []
         with Storage(cg.cv_mesh_path) as stor:
             while True:
-                filenames = [get_mesh_name(cg, c) for c in candidates]
-
                 time_start = time.time()
-                existence_dict = stor.files_exist(filenames)
+                existence_dict = get_mesh_existence(cg, candidates, stor=stor)
                 print("Existence took: %.3fs" % (time.time() - time_start))
 
                 missing_meshes = []
-                for mesh_key in existence_dict:
-                    node_id = np.uint64(mesh_key.split(":")[0])
-                    if existence_dict[mesh_key]:
+                for node_id, exists in existence_dict.items():
+                    if exists:
                         valid_node_ids.append(node_id)
+                    elif cg.get_chunk_layer(node_id) > stop_layer:
+                        missing_meshes.append(node_id)
                     else:
-                        if cg.get_chunk_layer(node_id) > stop_layer:
-                            missing_meshes.append(node_id)
+                        n_missing += 1
 
                 time_start = time.time()
                 if missing_meshes:
@@ -171,4 +236,6 @@ def get_highest_child_nodes_with_meshes(
     else:
         valid_node_ids = candidates
 
+    if return_n_missing:
+        return valid_node_ids, n_missing
     return valid_node_ids
@@ -0,0 +1,131 @@
+"""
+Process wide cache for the chunk remappings used in meshing.
+
+Entries are keyed by (table, kind, chunk_id, layer, time stamp) so tasks
+meshing the same chunks at the same time stamp share results. Remappings
+for "now" (no time stamp) change with every edit and are not cached.
+The cache is bounded by an estimate of the memory used by its entries.
+Edits change the hierarchy of the edited chunks and of every chunk sharing
+a parent with them, `invalidate` drops the affected entries.
+"""
+
+import os
+import datetime
+import threading
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from pychunkedgraph.io.cache import MemoryCache
+
+
+def _estimate_nbytes(value) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 100
+    if isinstance(value, dict):
+        return sum(
+            _estimate_nbytes(k) + _estimate_nbytes(v) for k, v in value.items()
+        ) + 100
+    if isinstance(value, (list, tuple)):
+        return sum(_estimate_nbytes(v) for v in value) + 60
+    return 32
+
+
+class RemappingCache:
+    def __init__(self, max_bytes: int = 1024 ** 3):
+        self._memory = MemoryCache(max_bytes)
+        self.invalidations = 0
+
+    @property
+    def stats(self) -> dict:
+        hits, misses = self._memory.hits, self._memory.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "invalidations": self.invalidations,
+            "n_entries": len(self._memory),
+            "n_bytes": self._memory.n_bytes,
+        }
+
+    def get_key(
+        self,
+        cg,
+        kind: str,
+        chunk_id: np.uint64,
+        layer: int,
+        time_stamp: Optional[datetime.datetime],
+    ) -> Optional[Tuple]:
+        """
+        :param kind: name of the remapping
+        :param layer: layer the remapping depends on; an edit invalidates
+            the entry when it shares the parent chunk at this layer
+        :return: None when `time_stamp` is None, the remapping is not cached
+        """
+        if time_stamp is None:
+            return None
+        if time_stamp.tzinfo is None:
+            time_stamp = time_stamp.replace(tzinfo=datetime.timezone.utc)
+        return (cg.table_id, kind, int(chunk_id), int(layer), time_stamp.timestamp())
+
+    def get(self, key: Optional[Tuple]):
+        if key is None:
+            return None
+        return self._memory.get(key)
+
+    def put(self, key: Optional[Tuple], value) -> None:
+        if key is None:
+            return
+        self._memory.put(key, value, size=_estimate_nbytes(value))
+
+    def invalidate(self, cg, chunk_ids: Iterable[np.uint64]) -> int:
+        """
+        Drop entries affected by edits in `chunk_ids`.
+        :return: number of removed entries
+        """
+        chunk_ids = np.unique(np.array(chunk_ids, dtype=np.uint64))
+        if len(chunk_ids) == 0:
+            return 0
+        # layer -> parent chunks of the edited chunks at that layer
+        edited_parents = {}
+        for chunk_id in chunk_ids:
+            chunk_layer = cg.get_chunk_layer(chunk_id)
+            for i, parent_chunk_id in enumerate(cg.get_parent_chunk_ids(chunk_id)):
+                edited_parents.setdefault(chunk_layer + i, set()).add(int(parent_chunk_id))
+
+        removed = 0
+        for key in self._memory.keys():
+            table_id, _, chunk_id, layer, _ = key
+            if table_id != cg.table_id:
+                continue
+            chunk_layer = cg.get_chunk_layer(np.uint64(chunk_id))
+            if layer < chunk_layer or not layer in edited_parents:
+                continue
+            parent_chunk_id = cg.get_parent_chunk_ids(np.uint64(chunk_id))[layer - chunk_layer]
+            if int(parent_chunk_id) in edited_parents[layer]:
+                self._memory.pop(key)
+                removed += 1
+        self.invalidations += removed
+        return removed
+
+    def clear(self) -> None:
+        self._memory.clear()
+
+
+_remapping_cache = None
+_remapping_cache_lock = threading.Lock()
+
+
+def get_remapping_cache() -> RemappingCache:
+    """
+    Remapping cache shared by all mesh tasks of this process. Configured with
+    MESH_REMAPPING_CACHE_BYTES (default 1 GiB).
+    """
+    global _remapping_cache
+    with _remapping_cache_lock:
+        if _remapping_cache is None:
+            _remapping_cache = RemappingCache(
+                max_bytes=int(os.environ.get("MESH_REMAPPING_CACHE_BYTES", 1024 ** 3))
+            )
+        return _remapping_cache
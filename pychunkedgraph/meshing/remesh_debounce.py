@@ -0,0 +1,227 @@
+"""
+Debounce and coalesce remeshing requests with redis.
+
+Every edit triggers a remesh request for its new L2 IDs. Edits on the same
+objects tend to arrive in bursts, so instead of enqueueing one `remeshing`
+job per request, new L2 IDs are buffered per table and per chunk. The first
+request for a table opens a window; a single flush job at the end of the
+window remeshes everything collected so far, after dropping L2 IDs that have
+been superseded by later edits in the meantime.
+
+A window whose flush job never ran (lost or failed) is rescheduled by the
+next request for the table or by `sweep`. L2 IDs of a failed flush are put
+back into the buffer.
+"""
+
+import time
+import uuid
+from typing import Callable, Dict, Iterable, Optional
+
+import numpy as np
+from redis.exceptions import WatchError
+
+
+class RemeshDebouncer:
+    """
+    Redis layout (`prefix` defaults to "remesh"):
+        {prefix}:{table_id}:chunks          set of chunk IDs with pending L2 IDs
+        {prefix}:{table_id}:chunk:{chunk}   set of pending L2 IDs of a chunk
+        {prefix}:{table_id}:job             id of the flush job of the window
+        {prefix}:due                        sorted set, table_id -> flush time
+    """
+
+    def __init__(
+        self,
+        redis_conn,
+        window: float = 5.0,
+        prefix: str = "remesh",
+        grace: float = 60.0,
+    ):
+        """
+        :param grace: seconds after the end of a window before its flush
+            job is considered lost and the window is rescheduled
+        """
+        self._redis = redis_conn
+        self._window = window
+        self._prefix = prefix
+        self._grace = grace
+
+    @property
+    def window(self) -> float:
+        return self._window
+
+    def _chunks_key(self, table_id: str) -> str:
+        return f"{self._prefix}:{table_id}:chunks"
+
+    def _chunk_key(self, table_id: str, chunk_id) -> str:
+        return f"{self._prefix}:{table_id}:chunk:{int(chunk_id)}"
+
+    def _job_key(self, table_id: str) -> str:
+        return f"{self._prefix}:{table_id}:job"
+
+    @property
+    def _due_key(self) -> str:
+        return f"{self._prefix}:due"
+
+    def add(
+        self,
+        table_id: str,
+        lvl2_ids: Iterable[np.uint64],
+        chunk_ids: Iterable[np.uint64],
+    ) -> bool:
+        """
+        Buffer L2 IDs for remeshing.
+        :param lvl2_ids: new L2 IDs
+        :param chunk_ids: chunk ID of each L2 ID
+        :return: True if this opened a new window or rescheduled an overdue
+            one, the caller is then responsible for scheduling `pop` after
+            `window` with the id from `job_id`
+        """
+        lvl2_ids = np.asarray(lvl2_ids, dtype=np.uint64)
+        chunk_ids = np.asarray(chunk_ids, dtype=np.uint64)
+        assert len(lvl2_ids) == len(chunk_ids)
+        if len(lvl2_ids) == 0:
+            return False
+
+        pipe = self._redis.pipeline()
+        for chunk_id in np.unique(chunk_ids):
+            ids = lvl2_ids[chunk_ids == chunk_id]
+            pipe.sadd(self._chunk_key(table_id, chunk_id), *[int(x) for x in ids])
+            pipe.sadd(self._chunks_key(table_id), int(chunk_id))
+        pipe.zadd(self._due_key, {table_id: time.time() + self._window}, nx=True)
+        pipe.set(self._job_key(table_id), uuid.uuid4().hex, nx=True)
+        pipe.zscore(self._due_key, table_id)
+        result = pipe.execute()
+        if result[-3]:
+            return True
+        return result[-1] + self._grace < time.time() and self._reschedule(table_id)
+
+    def _reschedule(self, table_id: str) -> bool:
+        """ Move an overdue window to the future, only one caller wins. """
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(self._due_key)
+                due = pipe.zscore(self._due_key, table_id)
+                if due is None or due + self._grace >= time.time():
+                    return False
+                pipe.multi()
+                pipe.zadd(self._due_key, {table_id: time.time() + self._window}, xx=True)
+                pipe.set(self._job_key(table_id), uuid.uuid4().hex)
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    def job_id(self, table_id: str) -> Optional[str]:
+        """ Id of the flush job of the open window of a table. """
+        job_id = self._redis.get(self._job_key(table_id))
+        return None if job_id is None else job_id.decode()
+
+    def pending(self, table_id: str) -> Dict[int, np.ndarray]:
+        """ Pending L2 IDs per chunk, without removing them. """
+        chunk_ids = self._redis.smembers(self._chunks_key(table_id))
+        result = {}
+        for chunk_id in chunk_ids:
+            ids = self._redis.smembers(self._chunk_key(table_id, chunk_id))
+            result[int(chunk_id)] = np.array(sorted(int(x) for x in ids), dtype=np.uint64)
+        return result
+
+    def due_tables(self, now: Optional[float] = None) -> list:
+        """ Tables whose window has passed. """
+        now = time.time() if now is None else now
+        return [x.decode() for x in self._redis.zrangebyscore(self._due_key, 0, now)]
+
+    def sweep(self, schedule_func: Callable[[str], None]) -> list:
+        """
+        Reschedule windows whose flush job did not run within `grace`.
+        Meant to be called periodically, see `sweep_debounced_remeshing`.
+        :param schedule_func: schedules `pop` of a table after `window`
+            with the id from `job_id`
+        :return: rescheduled tables
+        """
+        tables = []
+        for table_id in self.due_tables(now=time.time() - self._grace):
+            if self._reschedule(table_id):
+                schedule_func(table_id)
+                tables.append(table_id)
+        return tables
+
+    def pop(self, table_id: str) -> Dict[int, np.ndarray]:
+        """
+        Atomically take all pending L2 IDs of a table and close its window.
+        Requests arriving afterwards open a new window.
+        :return: {chunk_id: L2 IDs}
+        """
+        chunks_key = self._chunks_key(table_id)
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(chunks_key)
+                    chunk_ids = [int(x) for x in pipe.smembers(chunks_key)]
+                    chunk_keys = [self._chunk_key(table_id, c) for c in chunk_ids]
+                    pipe.multi()
+                    for chunk_key in chunk_keys:
+                        pipe.smembers(chunk_key)
+                    pipe.delete(chunks_key, self._job_key(table_id), *chunk_keys)
+                    pipe.zrem(self._due_key, table_id)
+                    result = pipe.execute()
+                    break
+                except WatchError:
+                    # chunk added while reading, try again
+                    continue
+
+        pending = {}
+        for chunk_id, ids in zip(chunk_ids, result[: len(chunk_ids)]):
+            pending[chunk_id] = np.array(sorted(int(x) for x in ids), dtype=np.uint64)
+        return pending
+
+    def flush(
+        self,
+        table_id: str,
+        remesh_func: Callable[[np.ndarray], None],
+        filter_func: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    ) -> np.ndarray:
+        """
+        Pop pending L2 IDs, drop superseded ones and remesh the rest
+        with a single call of `remesh_func`.
+        L2 IDs are put back into the buffer when `remesh_func` fails.
+        :param filter_func: returns the L2 IDs that are still current
+        :return: L2 IDs that were remeshed
+        """
+        pending = self.pop(table_id)
+        if not pending:
+            return np.array([], dtype=np.uint64)
+        all_lvl2_ids = np.concatenate(list(pending.values()))
+        chunk_ids = np.concatenate(
+            [np.full(len(ids), chunk_id, dtype=np.uint64) for chunk_id, ids in pending.items()]
+        )
+        lvl2_ids = all_lvl2_ids
+        if filter_func is not None and len(lvl2_ids):
+            lvl2_ids = np.asarray(filter_func(lvl2_ids), dtype=np.uint64)
+        if len(lvl2_ids):
+            try:
+                remesh_func(lvl2_ids)
+            except Exception:
+                requeue = np.in1d(all_lvl2_ids, lvl2_ids)
+                self.add(table_id, all_lvl2_ids[requeue], chunk_ids[requeue])
+                raise
+        return lvl2_ids
+
+
+def filter_superseded_lvl2_ids(cg, lvl2_ids: Iterable[np.uint64]) -> np.ndarray:
+    """
+    Keep L2 IDs that are still part of the latest graph. An L2 ID is
+    superseded when a later edit assigned its supervoxels to a new L2 node;
+    checking one supervoxel per L2 ID is sufficient.
+    """
+    lvl2_ids = np.asarray(lvl2_ids, dtype=np.uint64)
+    if len(lvl2_ids) == 0:
+        return lvl2_ids
+    children_d = cg.get_children(lvl2_ids)
+    has_children = np.array([len(children_d[x]) > 0 for x in lvl2_ids], dtype=bool)
+    lvl2_ids = lvl2_ids[has_children]
+    if len(lvl2_ids) == 0:
+        return lvl2_ids
+    first_children = np.array([children_d[x][0] for x in lvl2_ids], dtype=np.uint64)
+    parents = np.asarray(cg.get_parents(first_children), dtype=np.uint64)
+    return lvl2_ids[parents == lvl2_ids]
@@ -0,0 +1,79 @@
+import numpy as np
+from flask import Flask
+
+from pychunkedgraph.app.admission import AdmissionMiddleware, CostModel, SlotPool
+
+
+def _create_app(directory, limits, max_workers=4):
+    app = Flask(__name__)
+
+    @app.route("/table/<table_id>/node/<node_id>/leaves")
+    def handle_leaves(table_id, node_id):
+        return "leaves"
+
+    @app.route("/table/<table_id>/node/<node_id>/root")
+    def handle_root(table_id, node_id):
+        return "root"
+
+    app.wsgi_app = AdmissionMiddleware(
+        app.wsgi_app, app.url_map, directory, limits=limits, max_workers=max_workers
+    )
+    return app
+
+
+class TestAdmission:
+    def test_slot_pool(self, tmpdir):
+        pool = SlotPool(str(tmpdir), "pool", 3)
+        other_pool = SlotPool(str(tmpdir), "pool", 3)
+
+        fds = pool.acquire(2)
+        assert len(fds) == 2
+        assert other_pool.acquire(2) is None
+        other_fds = other_pool.acquire(1)
+        assert other_fds is not None
+        assert pool.acquire(1) is None
+
+        SlotPool.release(fds)
+        SlotPool.release(other_fds)
+        fds = other_pool.acquire(3)
+        assert len(fds) == 3
+        SlotPool.release(fds)
+
+    def test_cost_model(self):
+        cost_model = CostModel(unit_seconds=10)
+        assert cost_model.estimate("handle_leaves") == 1
+        assert cost_model.estimate("handle_leaves", 2) == 1
+        assert cost_model.estimate("handle_leaves", 8) == 6
+
+        cost_model.observe("handle_leaves", 8, 40)
+        assert cost_model.estimate("handle_leaves", 8) == 4
+        # other layers fall back to the endpoint average
+        assert cost_model.estimate("handle_leaves", 5) == 4
+
+    def test_middleware(self, tmpdir):
+        app = _create_app(str(tmpdir), {"handle_leaves": 2})
+        client = app.test_client()
+        root_id = (np.uint64(5) << np.uint64(56)) + np.uint64(1)
+
+        def get_status(url):
+            # slots are held until the response is closed
+            with client.get(url) as response:
+                return response.status_code
+
+        assert get_status(f"/table/t/node/{root_id}/leaves") == 200
+
+        endpoint_fds = SlotPool(str(tmpdir), "handle_leaves", 2).acquire(2)
+        response = client.get(f"/table/t/node/{root_id}/leaves")
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        # unlimited endpoints are not affected
+        assert get_status(f"/table/t/node/{root_id}/root") == 200
+        SlotPool.release(endpoint_fds)
+
+        worker_fds = SlotPool(str(tmpdir), "workers", 4).acquire(4)
+        response = client.get(f"/table/t/node/{root_id}/leaves")
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        SlotPool.release(worker_fds)
+
+        assert get_status(f"/table/t/node/{root_id}/leaves") == 200
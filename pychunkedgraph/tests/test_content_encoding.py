@@ -0,0 +1,39 @@
+import pytest
+from flask import Response
+
+from pychunkedgraph.app import content_encoding
+
+
+class TestContentEncoding:
+    def test_choose_encoding(self):
+        assert content_encoding.choose_encoding("") is None
+        assert content_encoding.choose_encoding("identity") is None
+        assert content_encoding.choose_encoding("gzip, deflate") == "gzip"
+        assert content_encoding.choose_encoding("gzip, deflate, zstd") == "zstd"
+        assert content_encoding.choose_encoding("zstd;q=0.5, gzip") == "gzip"
+        assert content_encoding.choose_encoding("zstd;q=0, *") == "gzip"
+        assert content_encoding.choose_encoding("br") is None
+
+    @pytest.mark.parametrize("encoding", ["zstd", "gzip"])
+    def test_roundtrip(self, encoding):
+        data = b"0123456789" * 1000
+        compressed = content_encoding.compress(data, encoding, level=1)
+        assert len(compressed) < len(data)
+        assert content_encoding.decompress(compressed, encoding) == data
+
+        with pytest.raises(ValueError):
+            content_encoding.decompress(data, "br")
+        # corrupt data
+        with pytest.raises(ValueError):
+            content_encoding.decompress(data, encoding)
+
+    def test_should_compress(self):
+        assert not content_encoding.should_compress(Response(b"a" * 10), 1024)
+        assert content_encoding.should_compress(Response(b"a" * 2048), 1024)
+        assert not content_encoding.should_compress(
+            Response(b"a" * 2048, mimetype="image/png"), 1024)
+        assert not content_encoding.should_compress(
+            Response(b"a" * 2048, status=404), 1024)
+        response = Response(b"a" * 2048)
+        response.headers["Content-Encoding"] = "gzip"
+        assert not content_encoding.should_compress(response, 1024)
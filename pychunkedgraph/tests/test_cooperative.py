@@ -0,0 +1,33 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from helpers import bigtable_emulator, gen_graph, gen_graph_simplequerytest, to_label
+
+
+class TestCooperativeConcurrency:
+    @pytest.mark.timeout(120)
+    def test_load_test(self, gen_graph_simplequerytest):
+        """ Load test with gevent in a separate (patched) process """
+        cgraph = gen_graph_simplequerytest
+        node_ids = [
+            to_label(cgraph, 1, 0, 0, 0, 0),
+            to_label(cgraph, 1, 1, 0, 0, 0),
+            to_label(cgraph, 1, 2, 0, 0, 0),
+        ]
+
+        output = subprocess.run(
+            [sys.executable, "-m", "pychunkedgraph.benchmarking.concurrency",
+             cgraph.table_id, "--instance_id", "emulated_instance",
+             "--node_ids", *[str(node_id) for node_id in node_ids],
+             "--concurrency", "1", "16", "--n_requests", "300", "--json"],
+            stdout=subprocess.PIPE, check=True,
+        ).stdout.decode()
+        measurements = json.loads(output.strip().split("\n")[-1])
+
+        # throughput is reported by the script, not asserted
+        for concurrency in ["1", "16"]:
+            assert measurements[concurrency]["n_failed"] == 0
+            assert measurements[concurrency]["correct"]
@@ -0,0 +1,44 @@
+from pychunkedgraph.io.cache import DiskCache
+from pychunkedgraph.meshing.fragment_cache import FragmentCache
+
+
+class DictStorage:
+    def __init__(self, files):
+        self.files = files
+        self.requested = []
+
+    def get_files(self, filenames):
+        self.requested.extend(filenames)
+        return [
+            {"filename": f, "content": self.files.get(f), "error": None}
+            for f in filenames
+        ]
+
+
+class TestFragmentCache:
+    def test_get_files(self):
+        storage = DictStorage({"1:0:a": b"a", "2:0:b": b"bb"})
+        cache = FragmentCache()
+        cache.put("path/3:0:c", b"ccc")
+
+        files = cache.get_files(storage, "path", ["1:0:a", "3:0:c", "4:0:d"])
+        assert [f["content"] for f in files] == [b"a", b"ccc", None]
+        assert storage.requested == ["1:0:a", "4:0:d"]
+
+        storage.requested = []
+        cache.get_files(storage, "path", ["1:0:a", "4:0:d"])
+        # missing fragments are not cached
+        assert storage.requested == ["4:0:d"]
+
+    def test_lru(self, tmp_path):
+        cache = FragmentCache(max_bytes=20)
+        for i in range(3):
+            cache.put(str(i), bytes(10))
+        assert cache.get("0") is None
+        assert cache.get("2") is not None
+        assert cache.stats["n_bytes"] == 20
+
+        cache = FragmentCache(max_bytes=20, disk_cache=DiskCache(str(tmp_path)))
+        for i in range(3):
+            cache.put(str(i), bytes(10))
+        assert cache.get("0") == bytes(10)
@@ -0,0 +1,19 @@
+from helpers import bigtable_emulator
+
+from pychunkedgraph.benchmarking import ingest
+
+
+def test_ingest_benchmark(tmp_path):
+    chunk_size = (64, 64, 64)
+    data_source = ingest.create_synthetic_dataset(
+        str(tmp_path), chunks_shape=(2, 1, 1), chunk_size=chunk_size, n_svs=20,
+        n_segments=5,
+    )
+    results = ingest.run_ingest_benchmark(
+        data_source, graph_id="test_ingest_benchmark", chunk_size=chunk_size
+    )
+
+    assert results[2]["n_chunks"] == 2
+    for result in results.values():
+        assert all(result[stage] >= 0 for stage in ingest.STAGES)
+    assert all(results[2][stage] > 0 for stage in ingest.STAGES)
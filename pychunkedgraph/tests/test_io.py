@@ -0,0 +1,234 @@
+import numpy as np
+import pytest
+
+from pychunkedgraph.backend.edges import Edges
+from pychunkedgraph.backend.edges import EdgesBuilder
+from pychunkedgraph.backend.edges import EDGE_TYPES
+from pychunkedgraph.io import columnar
+from pychunkedgraph.io.cache import DiskCache
+from pychunkedgraph.io import edges as io_edges
+from pychunkedgraph.io.segmentation import SegmentationBlockCache
+
+
+def _make_edges_d(n=5):
+    edges_d = {}
+    for i, edge_type in enumerate(EDGE_TYPES):
+        edges_d[edge_type] = Edges(
+            np.arange(n, dtype=np.uint64) + i,
+            np.arange(n, 2 * n, dtype=np.uint64),
+            affinities=np.linspace(0, 1, n).astype(np.float32),
+            areas=np.arange(n, dtype=np.uint64) * 10,
+        )
+    return edges_d
+
+
+class TestEdges:
+    def test_no_copy(self):
+        node_ids1 = np.arange(5, dtype=np.uint64)
+        edges = Edges(node_ids1, node_ids1 + 1)
+        assert np.shares_memory(edges.node_ids1, node_ids1)
+        assert edges.affinities.dtype == np.float32
+        assert edges.areas.dtype == np.uint64
+
+        pairs = edges.get_pairs()
+        assert pairs.shape == (5, 2)
+        assert np.shares_memory(edges.node_ids1, pairs)
+        structured = edges.get_pairs(structured=True)
+        assert np.shares_memory(structured, pairs)
+        assert np.array_equal(structured["node_id2"], node_ids1 + 1)
+
+    def test_builder(self):
+        builder = EdgesBuilder()
+        for i in range(3):
+            builder.add(Edges([i], [i + 10], affinities=np.array([0.5])))
+        builder.add_arrays(np.array([3], np.uint64), np.array([13], np.uint64))
+        edges = builder.build()
+        assert len(edges) == 4
+        assert np.array_equal(edges.node_ids2, [10, 11, 12, 13])
+        assert edges.affinities[0] == np.float32(0.5)
+        assert len(EdgesBuilder().build()) == 0
+
+
+class TestColumnar:
+    def test_roundtrip(self):
+        groups = {
+            "a": {"x": np.arange(10, dtype=np.uint64), "y": np.ones(3, np.float32)},
+            "b": {"x": np.array([], dtype=np.uint64)},
+        }
+        content = columnar.serialize_columns(groups, compressed_columns=["y"])
+        header = columnar.read_header(content)
+        assert header["a"]["y"]["compression"] == columnar.COMPRESSION_ZSTD
+        assert header["a"]["x"]["offset"] % columnar.ALIGNMENT == 0
+
+        result = columnar.deserialize_columns(content)
+        for group, columns in groups.items():
+            for name, array in columns.items():
+                assert np.array_equal(result[group][name], array)
+                assert result[group][name].dtype == array.dtype
+
+        assert list(columnar.deserialize_columns(content, groups=["b"])) == ["b"]
+
+    def test_memmap(self, tmp_path):
+        groups = {"a": {"x": np.arange(100, dtype=np.uint64)}}
+        path = str(tmp_path / "test.columnar")
+        with open(path, "wb") as f:
+            f.write(columnar.serialize_columns(groups))
+        result = columnar.memmap_columns(path)
+        assert isinstance(result["a"]["x"], np.memmap)
+        assert np.array_equal(result["a"]["x"], groups["a"]["x"])
+
+    def test_not_columnar(self):
+        with pytest.raises(ValueError):
+            columnar.read_header(b"x" * 32)
+
+
+class TestChunkEdges:
+    @pytest.mark.parametrize("compressed_columns", [None, ["affinities", "areas"]])
+    def test_columnar_chunk_edges(self, tmp_path, compressed_columns):
+        edges_dir = f"file://{tmp_path}"
+        edges_d = _make_edges_d()
+        io_edges.put_chunk_edges(
+            edges_dir,
+            [0, 0, 0],
+            edges_d,
+            3,
+            serialization=io_edges.SERIALIZATION_COLUMNAR,
+            compressed_columns=compressed_columns,
+        )
+        result = io_edges.get_chunk_edges(
+            edges_dir,
+            [[0, 0, 0], [1, 0, 0]],
+            serialization=io_edges.SERIALIZATION_COLUMNAR,
+            edge_types=[EDGE_TYPES.between_chunk],
+        )
+        assert len(result[EDGE_TYPES.in_chunk]) == 0
+        between = result[EDGE_TYPES.between_chunk]
+        assert np.array_equal(between.get_pairs(), edges_d[EDGE_TYPES.between_chunk].get_pairs())
+        assert np.array_equal(between.areas, edges_d[EDGE_TYPES.between_chunk].areas)
+
+    def test_convert_to_columnar(self, tmp_path):
+        edges_dir = f"file://{tmp_path}"
+        edges_d = _make_edges_d()
+        io_edges.put_chunk_edges(edges_dir, [0, 0, 0], edges_d, 3)
+        assert io_edges.convert_to_columnar(edges_dir, [[0, 0, 0]]) == 1
+
+        proto = io_edges.get_chunk_edges(edges_dir, [[0, 0, 0]])
+        cols = io_edges.get_chunk_edges(
+            edges_dir, [[0, 0, 0]], serialization=io_edges.SERIALIZATION_COLUMNAR
+        )
+        for edge_type in EDGE_TYPES:
+            assert np.array_equal(proto[edge_type].get_pairs(), cols[edge_type].get_pairs())
+            assert np.array_equal(proto[edge_type].affinities, cols[edge_type].affinities)
+
+
+class TestDiskCache:
+    def test_get_put(self, tmp_path):
+        cache = DiskCache(str(tmp_path))
+        assert cache.get("gs://bucket/a") is None
+        cache.put("gs://bucket/a", b"content")
+        assert cache.get("gs://bucket/a") == b"content"
+        assert cache.stats["hits"] == 1
+        assert cache.stats["misses"] == 1
+
+        # different generation, different entry
+        cache = DiskCache(str(tmp_path), generation="1")
+        assert cache.get("gs://bucket/a") is None
+
+    def test_evict(self, tmp_path):
+        cache = DiskCache(str(tmp_path), max_bytes=250)
+        for i in range(3):
+            cache.put(f"gs://bucket/{i}", bytes(100))
+        assert cache.get("gs://bucket/0") is None
+        assert cache.get("gs://bucket/2") is not None
+
+    def test_cached_chunk_edges(self, tmp_path):
+        edges_dir = f"file://{tmp_path / 'edges'}"
+        cache = DiskCache(str(tmp_path / "cache"))
+        io_edges.put_chunk_edges(edges_dir, [0, 0, 0], _make_edges_d(), 3)
+        first = io_edges.get_chunk_edges(edges_dir, [[0, 0, 0]], cache=cache)
+        second = io_edges.get_chunk_edges(edges_dir, [[0, 0, 0]], cache=cache)
+        assert cache.stats["hits"] == 1
+        for edge_type in EDGE_TYPES:
+            assert np.array_equal(first[edge_type].get_pairs(), second[edge_type].get_pairs())
+
+
+class ArrayVolume:
+    """ Minimal stand-in for a CloudVolume backed by an array. """
+
+    def __init__(self, data, chunk_size, voxel_offset=(0, 0, 0)):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.voxel_offset = np.array(voxel_offset)
+        self.volume_size = data.shape
+        self.dtype = data.dtype
+        self.cloudpath = "array://"
+        self.mip = 0
+        self.n_reads = 0
+        self.n_voxels = 0
+
+    def __getitem__(self, slices):
+        self.n_reads += 1
+        slices = tuple(
+            slice(s.start - o, s.stop - o) for s, o in zip(slices, self.voxel_offset)
+        )
+        self.n_voxels += self.data[slices].size
+        return self.data[slices][..., None]
+
+
+class TestSegmentationBlockCache:
+    @pytest.mark.parametrize("use_disk", [False, True])
+    def test_cutout(self, tmp_path, use_disk):
+        data = np.arange(10 * 9 * 8, dtype=np.uint64).reshape(10, 9, 8)
+        cv = ArrayVolume(data, chunk_size=(4, 4, 4), voxel_offset=(10, 20, 30))
+        disk_cache = DiskCache(str(tmp_path)) if use_disk else None
+        cache = SegmentationBlockCache(cv, disk_cache=disk_cache)
+
+        seg = cache.cutout([11, 21, 31], [17, 26, 40])
+        assert np.array_equal(seg, data[1:7, 1:6, 1:8])
+        assert cv.n_reads == 1
+
+        # cached blocks are not read again
+        seg = cache[12:15, 22:24, 32:34]
+        assert np.array_equal(seg, data[2:5, 2:4, 2:4])
+        assert cv.n_reads == 1
+        assert cache.stats["hits"] > 0
+
+        if use_disk:
+            cache = SegmentationBlockCache(cv, disk_cache=disk_cache)
+            assert np.array_equal(cache.cutout([10, 20, 30], [14, 24, 34]), data[:4, :4, :4])
+            assert cv.n_reads == 1
+
+    def test_cutout_skips_cached_blocks(self):
+        data = np.arange(12 * 8 * 4, dtype=np.uint64).reshape(12, 8, 4)
+        cv = ArrayVolume(data, chunk_size=(4, 4, 4))
+        cache = SegmentationBlockCache(cv)
+
+        cache.cutout([4, 0, 0], [8, 4, 4])
+        assert cv.n_voxels == 64
+
+        # the cached block in the middle is not downloaded again, the
+        # missing blocks of each side are downloaded in one cutout
+        seg = cache.cutout([0, 0, 0], [12, 8, 4])
+        assert np.array_equal(seg, data)
+        assert cv.n_voxels == 12 * 8 * 4
+        assert cv.n_reads == 4
+
+    def test_prefetch(self):
+        data = np.arange(16 * 16 * 8, dtype=np.uint64).reshape(16, 16, 8)
+        cv = ArrayVolume(data, chunk_size=(4, 4, 4))
+        cache = SegmentationBlockCache(cv)
+
+        # two points in one block, one in another, one outside of the volume
+        bboxes = [([1, 1, 1], [2, 2, 2]), ([2, 2, 2], [3, 3, 3]),
+                  ([13, 1, 5], [14, 2, 6]), ([20, 20, 20], [21, 21, 21])]
+        cache.prefetch(bboxes, n_threads=2)
+        assert cv.n_reads == 2
+
+        for start, end in bboxes[:3]:
+            seg = cache.cutout(start, end)
+            assert np.array_equal(
+                seg, data[start[0]:end[0], start[1]:end[1], start[2]:end[2]])
+        assert cv.n_reads == 2
+
+        cache.prefetch(bboxes)
+        assert cv.n_reads == 2
@@ -0,0 +1,31 @@
+import pytest
+
+from pychunkedgraph.meshing.manifest_cache import ManifestCache
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class TestManifestCache:
+    def test_complete(self):
+        redis_conn = fakeredis.FakeStrictRedis()
+        cache = ManifestCache(redis_conn=redis_conn)
+        key = cache.get_key("table", 123, True, bounds=None)
+        assert key != cache.get_key("table", 123, False, bounds=None)
+        assert cache.get(key) is None
+
+        entry = cache.put(key, {"fragments": ["1:0:a"]}, complete=True)
+        assert cache.get(key)["etag"] == entry["etag"]
+
+        # shared through redis
+        other = ManifestCache(redis_conn=redis_conn)
+        assert other.get(key)["manifest"] == {"fragments": ["1:0:a"]}
+
+    def test_incomplete_refresh(self):
+        cache = ManifestCache(incomplete_ttl=0)
+        key = cache.get_key("table", 123, True)
+        cache.put(key, {"fragments": []}, complete=False)
+        assert cache.get(key) is None
+
+        cache = ManifestCache(incomplete_ttl=60)
+        cache.put(key, {"fragments": []}, complete=False)
+        assert cache.get(key) is not None
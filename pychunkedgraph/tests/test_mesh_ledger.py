@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from pychunkedgraph.meshing import mesh_ledger
+
+
+def _check_ledger(ledger):
+    big_chunk_id = np.uint64(2 ** 63 + 5)
+    ledger.mark_done(np.uint64(1), 2)
+    ledger.mark_done(big_chunk_id, 3)
+    ledger.mark_failed(np.uint64(2), 2, "error")
+
+    assert ledger.get_chunks() == {np.uint64(1), big_chunk_id}
+    assert ledger.get_chunks(layer=3) == {big_chunk_id}
+    assert ledger.get_chunks(mesh_ledger.STATUS_FAILED) == {np.uint64(2)}
+
+    # retried chunk
+    ledger.mark_done(np.uint64(2), 2)
+    assert ledger.get_chunks(mesh_ledger.STATUS_FAILED) == set()
+    assert len(ledger.get_chunks(layer=2)) == 2
+
+
+class TestMeshLedger:
+    def test_sqlite_ledger(self, tmp_path):
+        path = str(tmp_path / "ledger.db")
+        _check_ledger(mesh_ledger.SQLiteLedger(path, "table:mesh"))
+
+        # resume from disk, other runs are separate
+        assert len(mesh_ledger.SQLiteLedger(path, "table:mesh").get_chunks()) == 3
+        assert mesh_ledger.SQLiteLedger(path, "other:mesh").get_chunks() == set()
+
+    def test_redis_ledger(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        redis_conn = fakeredis.FakeStrictRedis()
+        _check_ledger(mesh_ledger.RedisLedger(redis_conn, "table:mesh"))
+        assert mesh_ledger.RedisLedger(redis_conn, "other:mesh").get_chunks() == set()
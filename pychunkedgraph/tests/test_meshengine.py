@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+from pychunkedgraph.backend import chunkedgraph_exceptions as cg_exceptions
+from pychunkedgraph.meshing import mesh_ledger, meshengine, meshgen
+
+
+def test_mesh_multiple_layers(tmp_path, mocker):
+    # layer 2 chunks 1 - 4, layer 3 chunks 10 (parent of 1, 2) and 11
+    layer_chunk_ids = {2: [1, 2, 3, 4], 3: [10, 11]}
+    parents = {1: 10, 2: 10, 3: 11, 4: 11}
+    cg = SimpleNamespace(
+        n_layers=3,
+        cv_mesh_path="gs://bucket/mesh_dir",
+        get_parent_chunk_ids=lambda chunk_id: [chunk_id, parents[chunk_id]],
+        get_serialized_info=lambda: {"credentials": None},
+    )
+    engine = meshengine.MeshEngine("table")
+    engine._cg = cg
+    mocker.patch.object(
+        engine, "get_layer_chunk_ids",
+        side_effect=lambda layer, bounding_box=None: np.array(
+            layer_chunk_ids[layer], dtype=np.uint64),
+    )
+
+    calls = []
+
+    def _mesh_chunk(cg_info, chunk_id, mesh_path, mip, cg, n_processes,
+                    raise_on_failure):
+        calls.append((int(chunk_id), mesh_path))
+        if chunk_id == 3 and raise_on_failure:
+            raise cg_exceptions.PostconditionError("No meshes for 3")
+        return "(3, 1, 1)"
+
+    mocker.patch.object(meshengine, "ProcessPoolExecutor", ThreadPoolExecutor)
+    mocker.patch.object(meshengine, "_init_mesh_worker")
+    mocker.patch.object(meshengine, "_mesh_worker_cg", cg)
+    mocker.patch.object(meshgen, "chunk_mesh_task_new_remapping", _mesh_chunk)
+
+    ledger = engine.get_ledger(ledger_path=str(tmp_path / "ledger.db"))
+    assert engine.get_ledger_name() == "table:gs://bucket/mesh_dir"
+    ledger.mark_done(np.uint64(1), 2)
+
+    failed = engine.mesh_multiple_layers(layers=[2, 3], n_processes=2, ledger=ledger)
+    assert failed == {3}
+    # done chunks are skipped, chunk 11 is blocked by its failed child
+    assert sorted(chunk_id for chunk_id, _ in calls) == [2, 3, 4, 10]
+    chunk_ids = [chunk_id for chunk_id, _ in calls]
+    assert chunk_ids.index(10) > chunk_ids.index(2)
+    assert all(mesh_path == "gs://bucket/mesh_dir" for _, mesh_path in calls)
+    assert ledger.get_chunks() == {1, 2, 4, 10}
+    assert ledger.get_chunks(mesh_ledger.STATUS_FAILED) == {3}
@@ -0,0 +1,86 @@
+import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+from pychunkedgraph.meshing import meshgen
+from pychunkedgraph.meshing.meshgen import (
+    _get_fragment_batches,
+    _get_unique_vertices,
+    resolve_unsafe_roots,
+)
+from pychunkedgraph.meshing.remapping_cache import RemappingCache
+
+
+def test_resolve_unsafe_roots():
+    # root 100 has l2 nodes 1 and 2 in this chunk, root 101 has 3
+    unsafe_dict = {np.uint64(100): [1, 2], np.uint64(101): [3]}
+    seg = np.zeros((4, 4, 4), dtype=np.uint64)
+    # component touching l2 node 1 across the x boundary
+    seg[2, 0, 0] = 1
+    seg[3, 0, 0] = 100
+    # component touching both l2 nodes, merges them
+    seg[2, 2, 2] = 2
+    seg[3, 2, 2] = 100
+    seg[3, 2, 1] = 100
+    seg[2, 2, 1] = 1
+    # component touching nothing
+    seg[3, 0, 3] = 100
+    # component of another root touching an l2 node of root 100
+    seg[2, 3, 3] = 1
+    seg[3, 3, 3] = 101
+
+    resolve_unsafe_roots(seg, unsafe_dict)
+    assert seg[3, 0, 0] == 1
+    assert seg[3, 2, 2] == 1 and seg[3, 2, 1] == 1 and seg[2, 2, 2] == 1
+    assert seg[3, 0, 3] == 0
+    assert seg[3, 3, 3] == 0
+    assert not np.isin([100, 101, 2], seg).any()
+
+
+def test_get_fragment_batches():
+    multi_child_nodes = {"a": [1, 2], "b": [3], "c": [4, 5, 6], "d": [7]}
+    assert _get_fragment_batches(multi_child_nodes) == [["a", "b", "c", "d"]]
+    assert _get_fragment_batches(multi_child_nodes, 3) == [["a", "b"], ["c"], ["d"]]
+    assert _get_fragment_batches(multi_child_nodes, 1) == [["a"], ["b"], ["c"], ["d"]]
+
+
+def test_get_unique_vertices():
+    vertices = np.array([[8, 0, 16], [0, 0, 0], [8, 0, 16], [8.0001, 0, 16]])
+    unique_index, inverse = _get_unique_vertices(vertices)
+    assert len(unique_index) == 2
+    assert np.array_equal(vertices[unique_index][inverse][[0, 1, 2]], vertices[[0, 1, 2]])
+    assert inverse[0] == inverse[2] == inverse[3]
+
+
+def test_remapping_cache_key():
+    cg = SimpleNamespace(table_id="table")
+    cache = RemappingCache()
+    # remappings of "now" are not cached
+    key = cache.get_key(cg, "root_lx", 5, 3, None)
+    cache.put(key, {"a": 1})
+    assert cache.get(key) is None
+
+    time_stamp = datetime.datetime(2020, 1, 1, 0, 0, 0)
+    key = cache.get_key(cg, "root_lx", 5, 3, time_stamp)
+    cache.put(key, {"a": 1})
+    assert cache.get(cache.get_key(cg, "root_lx", 5, 3, time_stamp)) == {"a": 1}
+    later_key = cache.get_key(cg, "root_lx", 5, 3, time_stamp + datetime.timedelta(seconds=1))
+    assert cache.get(later_key) is None
+
+
+def test_remapping_of_now_is_not_cached(mocker):
+    cache = RemappingCache()
+    mocker.patch.object(meshgen, "get_remapping_cache", return_value=cache)
+    rr_chunk = {np.uint64(10): [SimpleNamespace(value=np.array([1, 2], dtype=np.uint64))]}
+    cg = SimpleNamespace(
+        table_id="table",
+        n_layers=3,
+        get_chunk_layer=lambda chunk_id: 2,
+        range_read_chunk=mocker.Mock(return_value=rr_chunk),
+    )
+
+    remapping = meshgen.get_higher_to_lower_remapping(cg, 5, time_stamp=None)
+    assert list(remapping) == [10]
+    assert cg.range_read_chunk.call_args[1]["time_stamp"] is None
+    assert cache.stats["n_entries"] == 0
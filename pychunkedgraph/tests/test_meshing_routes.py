@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pytest
+from rq import Queue
+
+from pychunkedgraph.app import app_utils, create_app
+from pychunkedgraph.app.meshing import common
+
+
+@pytest.fixture
+def client(mocker):
+    mocker.patch(
+        "middle_auth_client.decorators.get_user_cache",
+        return_value={"id": 1, "admin": False, "groups": [],
+                      "permissions_v2": {"fafb": ["view", "edit"]}},
+    )
+    mocker.patch.object(app_utils, "get_log_db")
+    app = create_app({"TESTING": True})
+    return app.test_client()
+
+
+class TestMeshingRoutes:
+    def test_remesh(self, client, mocker):
+        get_cg = mocker.patch.object(app_utils, "get_cg")
+        remeshing = mocker.patch.object(common, "_remeshing")
+
+        response = client.post(
+            "/meshing/api/v1/table/fly_v31/remeshing?priority=false",
+            data=json.dumps({"new_lvl2_ids": [123, 456]}),
+            headers={"Authorization": "Bearer token"},
+        )
+        assert response.status_code == 202
+
+        get_cg.assert_called_once_with("fly_v31")
+        remeshing.assert_called_once()
+        lvl2_ids = remeshing.call_args[0][1]
+        assert np.array_equal(lvl2_ids, np.array([123, 456], dtype=np.uint64))
+
+    def test_debounce_remesh(self, mocker):
+        fakeredis = pytest.importorskip("fakeredis")
+
+        get_cg = mocker.patch.object(app_utils, "get_cg")
+        get_cg.return_value.get_chunk_ids_from_node_ids.side_effect = lambda ids: ids // 10
+        q = Queue("mesh-chunks", connection=fakeredis.FakeStrictRedis())
+
+        task_id = common._debounce_remesh(q, "fly_v31", [123, 456], window=60)
+        # coalesced requests get the id of the pending flush job
+        assert common._debounce_remesh(q, "fly_v31", [789], window=60) == task_id
+        assert q.scheduled_job_registry.get_job_ids() == [task_id]
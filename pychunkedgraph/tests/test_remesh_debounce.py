@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+import pytest
+
+from pychunkedgraph.meshing.remesh_debounce import RemeshDebouncer
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class TestRemeshDebouncer:
+    def test_coalesce(self):
+        debouncer = RemeshDebouncer(fakeredis.FakeStrictRedis(), window=60)
+        assert debouncer.add("table", [1, 2], [10, 10])
+        job_id = debouncer.job_id("table")
+        # window already open, no new flush job
+        assert not debouncer.add("table", [2, 3], [10, 20])
+        assert debouncer.job_id("table") == job_id
+        assert debouncer.add("other", [4], [10])
+
+        assert debouncer.due_tables() == []
+        assert sorted(debouncer.due_tables(now=1e12)) == ["other", "table"]
+
+        pending = debouncer.pending("table")
+        assert np.array_equal(pending[10], [1, 2])
+        assert np.array_equal(pending[20], [3])
+
+        calls = []
+        remeshed = debouncer.flush("table", calls.append)
+        assert len(calls) == 1
+        assert np.array_equal(np.sort(remeshed), [1, 2, 3])
+        assert debouncer.pending("table") == {}
+        assert debouncer.due_tables(now=1e12) == ["other"]
+
+        # flushing closes the window
+        assert debouncer.job_id("table") is None
+        assert debouncer.add("table", [5], [10])
+        assert debouncer.job_id("table") not in (None, job_id)
+
+    def test_skip_superseded(self):
+        debouncer = RemeshDebouncer(fakeredis.FakeStrictRedis())
+        debouncer.add("table", [1, 2, 3], [10, 10, 20])
+
+        calls = []
+        remeshed = debouncer.flush(
+            "table", calls.append, filter_func=lambda ids: ids[ids != 2]
+        )
+        assert np.array_equal(np.sort(remeshed), [1, 3])
+
+        # everything superseded, nothing to remesh
+        debouncer.add("table", [4], [10])
+        debouncer.flush("table", calls.append, filter_func=lambda ids: ids[:0])
+        assert len(calls) == 1
+        assert len(debouncer.flush("table", calls.append)) == 0
+
+    def test_reschedule_lost_window(self):
+        redis_conn = fakeredis.FakeStrictRedis()
+        debouncer = RemeshDebouncer(redis_conn, window=0, grace=0)
+        assert debouncer.add("table", [1], [10])
+        job_id = debouncer.job_id("table")
+        # flush job never ran, the next request reschedules the window
+        time.sleep(0.01)
+        assert debouncer.add("table", [2], [10])
+        assert debouncer.job_id("table") != job_id
+
+        time.sleep(0.01)
+        scheduled = []
+        assert debouncer.sweep(scheduled.append) == ["table"]
+        assert scheduled == ["table"]
+        assert np.array_equal(debouncer.pending("table")[10], [1, 2])
+
+        # windows are not shared between prefixes
+        other = RemeshDebouncer(redis_conn, window=60, prefix="remesh:low")
+        assert other.add("table", [3], [10])
+        assert other.sweep(scheduled.append) == []
+
+    def test_requeue_failed(self):
+        debouncer = RemeshDebouncer(fakeredis.FakeStrictRedis())
+        debouncer.add("table", [1, 2, 3], [10, 10, 20])
+
+        def _fail(lvl2_ids):
+            raise RuntimeError()
+
+        with pytest.raises(RuntimeError):
+            debouncer.flush("table", _fail, filter_func=lambda ids: ids[ids != 2])
+        pending = debouncer.pending("table")
+        assert np.array_equal(pending[10], [1])
+        assert np.array_equal(pending[20], [3])
@@ -0,0 +1,104 @@
+import io
+
+import numpy as np
+import pytest
+
+from pychunkedgraph.app import response_formats
+from pychunkedgraph.backend import chunkedgraph_exceptions as cg_exceptions
+
+msgpack = pytest.importorskip("msgpack")
+pa = pytest.importorskip("pyarrow")
+
+
+class TestResponseFormats:
+    def test_get_response_format(self):
+        from werkzeug.datastructures import MIMEAccept
+
+        assert response_formats.get_response_format() == "json"
+        assert response_formats.get_response_format("NPY") == "npy"
+        with pytest.raises(cg_exceptions.BadRequest):
+            response_formats.get_response_format("xml")
+
+        accept = MIMEAccept([("*/*", 1)])
+        assert response_formats.get_response_format(None, accept) == "json"
+        accept = MIMEAccept([("application/x-msgpack", 1), ("*/*", 0.1)])
+        assert response_formats.get_response_format(None, accept) == "msgpack"
+        accept = MIMEAccept([("application/x-npz", 1)])
+        assert response_formats.get_response_format(None, accept) == "npy"
+
+    def test_npy(self):
+        leaf_ids = np.array([1, 2 ** 63 + 1], dtype=np.uint64)
+        content, mimetype = response_formats.to_npy({"leaf_ids": leaf_ids})
+        assert mimetype == "application/x-npy"
+        result = np.load(io.BytesIO(content))
+        assert result.dtype == np.dtype("<u8")
+        assert np.array_equal(result, leaf_ids)
+
+        edges = np.array([[1, 2], [2, 3]], dtype=np.uint64)
+        content, mimetype = response_formats.to_npy({"a": leaf_ids, "b": edges})
+        assert mimetype == "application/x-npz"
+        result = np.load(io.BytesIO(content))
+        assert np.array_equal(result["b"], edges)
+
+        with pytest.raises(cg_exceptions.BadRequest):
+            response_formats.to_npy({"user_info": {"a": 1}})
+
+    def test_msgpack(self):
+        edges = np.array([[1, 2], [2, 3]], dtype=np.uint64)
+        data = {"n_splits": 1, "edges": edges, "info": {np.uint64(5): [1, 2]}}
+        content, mimetype = response_formats.to_msgpack(data)
+        assert mimetype == "application/x-msgpack"
+
+        result = msgpack.unpackb(content, strict_map_key=False)
+        assert result["n_splits"] == 1
+        assert result["info"] == {5: [1, 2]}
+        encoded = result["edges"]
+        decoded = np.frombuffer(encoded[b"data"], dtype=encoded[b"type"])
+        assert np.array_equal(decoded.reshape(encoded[b"shape"]), edges)
+
+    def test_arrow(self):
+        edges = np.array([[1, 2], [2, 3], [4, 5]], dtype=np.uint64)
+        areas = np.array([1.5, 2, 3], dtype=np.float32)
+        content, mimetype = response_formats.to_arrow({"edges": edges, "areas": areas})
+        assert mimetype == "application/vnd.apache.arrow.stream"
+
+        table = pa.ipc.open_stream(content).read_all()
+        assert table.column_names == ["edges", "areas"]
+        assert table.column("edges").to_pylist() == edges.tolist()
+        assert np.array_equal(table.column("areas").to_numpy(), areas)
+
+        with pytest.raises(cg_exceptions.BadRequest):
+            response_formats.to_arrow({"a": np.arange(2), "b": np.arange(3)})
+
+    @pytest.mark.parametrize("encoding", [None, "gzip", "zstd"])
+    def test_compressed_frames(self, encoding):
+        import zlib
+        import zstandard as zstd
+
+        batches = [
+            np.array([[1, 2], [3, 2 ** 63]], dtype=np.uint64),
+            np.empty((0, 2), dtype=np.uint64),
+            np.array([[5, 6]], dtype=np.uint64),
+        ]
+        chunks = list(response_formats.iter_compressed_frames(batches, encoding))
+        assert len(chunks) == 3
+
+        if encoding == "gzip":
+            decompressor = zlib.decompressobj(31)
+        elif encoding == "zstd":
+            decompressor = zstd.ZstdDecompressor().decompressobj()
+        else:
+            decompressor = None
+
+        # every chunk can be decoded as soon as it arrives
+        content = b""
+        for chunk, n_bytes in zip(chunks, [40, 64, 72]):
+            content += decompressor.decompress(chunk) if decompressor else chunk
+            assert len(content) == n_bytes
+
+        frames = list(response_formats.decode_frames(content, n_cols=2))
+        assert len(frames) == 2
+        assert np.array_equal(np.concatenate(frames), np.concatenate(batches))
+
+        with pytest.raises(ValueError):
+            list(response_formats.decode_frames(content[:-8], n_cols=2))
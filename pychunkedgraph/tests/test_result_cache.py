@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from flask import Flask
+
+from pychunkedgraph.app import result_cache
+from pychunkedgraph.io.cache import DiskCache
+
+
+class TestResultCache:
+    def test_encoding(self):
+        ids = np.array([2 ** 63 + 10, 5, 2 ** 63 + 3, 7], dtype=np.uint64)
+        decoded = result_cache.decode_result(result_cache.encode_result(ids))
+        assert decoded.dtype == np.uint64
+        assert np.array_equal(decoded, np.sort(ids))
+
+        edges = np.array([[3, 1], [1, 2 ** 64 - 1], [1, 2]], dtype=np.uint64)
+        decoded = result_cache.decode_result(result_cache.encode_result(edges))
+        assert np.array_equal(decoded, [[1, 2], [1, 2 ** 64 - 1], [3, 1]])
+
+        empty = np.array([], dtype=np.uint64)
+        assert len(result_cache.decode_result(result_cache.encode_result(empty))) == 0
+
+        value = {"a": [1, 2]}
+        assert result_cache.decode_result(result_cache.encode_result(value)) == value
+
+        # consecutive ids compress to a few bits each
+        ids = np.arange(2 ** 60, 2 ** 60 + 100000, dtype=np.uint64)
+        assert len(result_cache.encode_result(ids)) < 1000
+
+    def test_disk(self, tmp_path):
+        cache = result_cache.ResultCache(DiskCache(str(tmp_path)))
+        key = cache.get_key("table", np.uint64(5), "leaves", bounds="0-1_0-1_0-1")
+        assert cache.get(key) is None
+        result = cache.put(key, np.array([3, 1], dtype=np.uint64))
+        assert np.array_equal(result, [1, 3])
+        assert np.array_equal(cache.get(key), [1, 3])
+        assert cache.get(cache.get_key("table", 5, "leaves")) is None
+        assert cache.stats["hits"] == 1
+
+    def test_redis_eviction(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        store = result_cache.RedisStore(fakeredis.FakeStrictRedis(), max_bytes=1000)
+        for i in range(10):
+            store.put(f"k{i}", bytes(200))
+            # keep the first entry in use
+            assert store.get("k0") is not None
+        assert store.get("k0") is not None
+        assert store.get("k9") is not None
+        assert store.get("k1") is None
+        assert sum(store.get(f"k{i}") is not None for i in range(10)) <= 4
+
+    def test_cached_result_skips_empty(self, tmp_path, mocker):
+        from pychunkedgraph.app import app_utils
+
+        cache = result_cache.ResultCache(DiskCache(str(tmp_path)))
+        mocker.patch.object(app_utils, "get_result_cache", return_value=cache)
+
+        with Flask(__name__).app_context():
+            # node that does not exist (yet)
+            key = cache.get_key("table", np.uint64(5), "leaves")
+            result = app_utils.cached_result(key, lambda: np.array([], dtype=np.uint64))
+            assert len(result) == 0
+            assert cache.get(key) is None
+
+            result = app_utils.cached_result(key, lambda: np.array([3, 1], dtype=np.uint64))
+            assert np.array_equal(result, [1, 3])
+            assert np.array_equal(cache.get(key), [1, 3])
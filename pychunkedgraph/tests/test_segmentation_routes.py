@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pytest
+
+from pychunkedgraph.app import app_utils, create_app
+from pychunkedgraph.app.segmentation.v1 import routes
+
+
+@pytest.fixture
+def client(mocker):
+    mocker.patch(
+        "middle_auth_client.decorators.get_user_cache",
+        return_value={"id": 1, "admin": False, "groups": [],
+                      "permissions_v2": {"fafb": ["view"]}},
+    )
+    app = create_app({"TESTING": True})
+    return app.test_client()
+
+
+class TestSegmentationRoutes:
+    def test_cached_leaves_are_logged(self, client, mocker):
+        get_log_db = mocker.patch.object(app_utils, "get_log_db")
+        # cache hit, the handler does not run
+        mocker.patch.object(routes, "cached_result",
+                            return_value=np.array([1, 2], dtype=np.uint64))
+
+        response = client.get(
+            "/segmentation/api/v1/table/fly_v31/node/123/leaves",
+            headers={"Authorization": "Bearer token"},
+        )
+        assert response.status_code == 200
+        assert json.loads(response.data)["leaf_ids"] == [1, 2]
+
+        get_log_db.assert_called_once_with("fly_v31")
+        log_kwargs = get_log_db.return_value.add_success_log.call_args[1]
+        assert log_kwargs["user_id"] == "1"
+
+    def test_find_path_needs_two_nodes(self, client, mocker):
+        mocker.patch.object(app_utils, "get_log_db")
+        get_cg = mocker.patch.object(app_utils, "get_cg")
+
+        nodes = [[1, 0, 0, 0], [2, 8, 8, 40], [3, 16, 16, 80]]
+        response = client.post(
+            "/segmentation/api/v1/table/fly_v31/graph/find_path",
+            data=json.dumps(nodes),
+            headers={"Authorization": "Bearer token"},
+        )
+        assert response.status_code == 400
+        get_cg.assert_not_called()
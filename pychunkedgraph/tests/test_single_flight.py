@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+from pychunkedgraph.app.single_flight import SingleFlight
+
+
+def _run_concurrently(funcs):
+    results = [None] * len(funcs)
+
+    def _run(i):
+        try:
+            results[i] = funcs[i]()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=_run, args=(i,)) for i in range(len(funcs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestSingleFlight:
+    def test_local(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        def _compute(x):
+            calls.append(x)
+            time.sleep(0.2)
+            return x * 2
+
+        results = _run_concurrently(
+            [lambda: single_flight.do("a", _compute, 1)] * 5
+            + [lambda: single_flight.do("b", _compute, 2)]
+        )
+        assert results == [2] * 5 + [4]
+        assert sorted(calls) == [1, 2]
+        assert single_flight.n_shared == 4
+
+        # nothing is cached after the computation
+        assert single_flight.do("a", _compute, 3) == 6
+
+    def test_local_error(self):
+        single_flight = SingleFlight()
+
+        def _fail():
+            time.sleep(0.1)
+            raise ValueError("failed")
+
+        results = _run_concurrently([lambda: single_flight.do("a", _fail)] * 3)
+        assert all(isinstance(r, ValueError) for r in results)
+
+    def test_redis(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+        # one instance per "process"
+        single_flights = [
+            SingleFlight(fakeredis.FakeStrictRedis(server=server), poll_interval=0.01)
+            for _ in range(4)
+        ]
+        calls = []
+
+        def _compute():
+            calls.append(1)
+            time.sleep(0.3)
+            return {"root_id": 5}
+
+        results = _run_concurrently([lambda s=s: s.do("a", _compute) for s in single_flights])
+        assert results == [{"root_id": 5}] * 4
+        assert len(calls) == 1
+
+        # the lock is released, later calls compute again
+        assert single_flights[0].do("a", _compute) == {"root_id": 5}
+        assert len(calls) == 2
+
+    def test_redis_leader_failure(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+        leader = SingleFlight(fakeredis.FakeStrictRedis(server=server))
+        follower = SingleFlight(fakeredis.FakeStrictRedis(server=server), poll_interval=0.01)
+
+        def _fail():
+            time.sleep(0.2)
+            raise ValueError("failed")
+
+        def _follow():
+            time.sleep(0.05)
+            return follower.do("a", lambda: 1)
+
+        results = _run_concurrently([lambda: leader.do("a", _fail), _follow])
+        assert isinstance(results[0], ValueError)
+        assert results[1] == 1
+
+    def test_redis_result_not_stored(self, mocker):
+        fakeredis = pytest.importorskip("fakeredis")
+        redis_conn = fakeredis.FakeStrictRedis()
+        single_flight = SingleFlight(redis_conn)
+        set_ = redis_conn.set
+
+        def _set(name, value, **kwargs):
+            if ":result:" in name:
+                raise ConnectionError("result too large")
+            return set_(name, value, **kwargs)
+
+        mocker.patch.object(redis_conn, "set", side_effect=_set)
+        assert single_flight.do("a", lambda: {"root_id": 5}) == {"root_id": 5}
+        # the lock is released
+        assert redis_conn.keys("singleflight:lock:*") == []
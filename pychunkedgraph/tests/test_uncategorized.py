@@ -19,7 +19,7 @@ from grpc._channel import _Rendezvous
 from helpers import (bigtable_emulator, create_chunk, gen_graph,
                      gen_graph_simplequerytest,
                      lock_expired_timedelta_override, to_label)
-from pychunkedgraph.backend import chunkedgraph
+from pychunkedgraph.backend import chunkedgraph, chunkedgraph_utils
 from pychunkedgraph.backend import chunkedgraph_exceptions as cg_exceptions
 from pychunkedgraph.backend.utils import column_keys, serializers
 from pychunkedgraph.creator import graph_tests
@@ -80,6 +80,27 @@ class TestGraphNodeConversion:
         assert serializers.deserialize_uint64(
             serializers.serialize_uint64(label)) == label
 
+    @pytest.mark.timeout(30)
+    def test_graph_settings_snapshot(self, gen_graph, tmpdir):
+        cgraph = gen_graph(n_layers=5)
+        path = str(tmpdir.join("settings"))
+
+        chunkedgraph_utils.write_graph_settings_snapshot(path, cgraph.graph_settings)
+        graph_settings = chunkedgraph_utils.read_graph_settings_snapshot(path)
+        assert graph_settings.keys() == cgraph.read_graph_settings().keys()
+        assert chunkedgraph_utils.read_graph_settings_snapshot(path, max_age=-1) is None
+
+        snapshot_cgraph = chunkedgraph.ChunkedGraph(
+            cgraph.table_id,
+            client=cgraph.client,
+            instance_id=cgraph.instance_id,
+            graph_settings=graph_settings)
+        assert snapshot_cgraph.n_layers == cgraph.n_layers
+        assert snapshot_cgraph.fan_out == cgraph.fan_out
+        assert np.array_equal(snapshot_cgraph.chunk_size, cgraph.chunk_size)
+        assert snapshot_cgraph.bitmasks == cgraph.bitmasks
+        assert snapshot_cgraph.dataset_info == cgraph.dataset_info
+
 
 class TestGraphBuild:
     @pytest.mark.timeout(30)
@@ -783,6 +804,24 @@ class TestGraphSimpleQueries:
 
         assert np.all(~(np.sort(childs_1) - np.sort(childs_2)))
 
+    @pytest.mark.timeout(30)
+    def test_get_leaves_multiple(self, gen_graph_simplequerytest):
+        cgraph = gen_graph_simplequerytest
+        root1 = cgraph.get_root(to_label(cgraph, 1, 0, 0, 0, 0))
+        root2 = cgraph.get_root(to_label(cgraph, 1, 1, 0, 0, 0))
+        lvl2_parent = cgraph.get_parent(to_label(cgraph, 1, 1, 0, 0, 0))
+
+        leaves_d = cgraph.get_leaves_multiple([root1, root2, lvl2_parent, root2])
+        assert len(leaves_d) == 3
+        for node_id in [root1, root2, lvl2_parent]:
+            assert np.array_equal(np.sort(leaves_d[node_id]),
+                                  np.sort(cgraph.get_subgraph_nodes(node_id)))
+
+        bb = np.array([[1, 0, 0], [2, 1, 1]], dtype=np.int)
+        leaves_d = cgraph.get_leaves_multiple([root2], bounding_box=bb)
+        assert np.array_equal(np.sort(leaves_d[root2]),
+                              np.sort(cgraph.get_subgraph_nodes(root2, bounding_box=bb)))
+
     @pytest.mark.timeout(30)
     def test_get_atomic_partners(self, gen_graph_simplequerytest):
         cgraph = gen_graph_simplequerytest
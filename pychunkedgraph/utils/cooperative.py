@@ -0,0 +1,53 @@
+"""
+Cooperative (gevent) concurrency.
+
+Requests to the segmentation app mostly wait on Bigtable and storage I/O.
+With gevent one worker process serves many of these requests concurrently,
+so a few processes (each with its own ChunkedGraph cache) replace dozens.
+
+`patch_all` has to run before anything else is imported, see run.py. It
+monkey patches the standard library and makes gRPC (Bigtable) yield to
+other greenlets while waiting on a call instead of blocking the process.
+"""
+
+import os
+
+CONCURRENCY_ENV = "GEVENT_CONCURRENCY"
+
+_patched = False
+
+
+def get_concurrency() -> int:
+    """ Requests a worker serves concurrently, 0 without gevent """
+    return int(os.environ.get(CONCURRENCY_ENV, 0))
+
+
+def is_patched() -> bool:
+    return _patched
+
+
+def patch_all() -> None:
+    global _patched
+    if _patched:
+        return
+
+    from gevent import monkey
+
+    monkey.patch_all()
+
+    # gRPC polls its completion queues from native threads, which gevent
+    # cannot switch away from, unless it uses the gevent poller
+    import grpc.experimental.gevent as grpc_gevent
+
+    grpc_gevent.init_gevent()
+    _patched = True
+
+
+def patch_from_env() -> bool:
+    """ `patch_all` if GEVENT_CONCURRENCY is set
+
+    :return: whether gevent is used
+    """
+    if get_concurrency() > 0:
+        patch_all()
+    return _patched
@@ -1,5 +1,9 @@
 import os
+import time
+import logging
+import threading
 from pychunkedgraph.app import create_app
+from pychunkedgraph.app.meshing import tasks as meshing_tasks
 import redis
 from rq import Connection, Worker, Queue
 # This is for monitoring rq with supervisord
@@ -26,10 +30,28 @@ QUEUES = ['mesh-chunks','mesh-chunks-low-priority']
 # NAME = 'worker-1024'
 
 app = create_app()
+logger = logging.getLogger(__name__)
 
 redis_connection = redis.from_url(app.config["REDIS_URL"])
+
+
+def sweep_remesh_windows(window):
+    # flush jobs of debounced remesh requests can get lost, reschedule them
+    while True:
+        time.sleep(max(window, 10))
+        try:
+            meshing_tasks.sweep_debounced_remeshing(redis_connection, QUEUES, window)
+        except Exception as e:
+            logger.error(f"Sweeping remesh windows failed: {e}")
+
+
+window = app.config.get("REMESH_DEBOUNCE_WINDOW", 0)
+if window > 0:
+    threading.Thread(target=sweep_remesh_windows, args=(window,), daemon=True).start()
+
 with app.app_context():
     with Connection(redis_connection):
         worker = Worker(QUEUES,
                         default_worker_ttl=600)
-        worker.work()
\ No newline at end of file
+        # scheduler is needed for the debounced remesh jobs (enqueue_in)
+        worker.work(with_scheduler=True)
\ No newline at end of file
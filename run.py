@@ -1,3 +1,7 @@
+# gevent has to patch the standard library before anything else is imported
+from pychunkedgraph.utils import cooperative
+cooperative.patch_from_env()
+
 from werkzeug.serving import WSGIRequestHandler
 from pychunkedgraph.app import create_app
 